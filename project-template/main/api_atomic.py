@@ -0,0 +1,168 @@
+"""
+Support for the JSON:API Atomic Operations extension, so clients can make
+a batch of writes in one request and one transaction.
+
+See https://jsonapi.org/ext/atomic/
+
+Each operation is dispatched to an existing FormApiMixin view, with the
+operation object standing in for the request body. Since an operation has
+the same {"data": ...} shape as a normal request the views' body pointers
+work unchanged.
+
+    class ArticleOperationsApi(LoginNotRequiredMixin, AtomicOperationsApiMixin, View):
+        operation_views = {
+            ("add", "articles"): ArticleCreateApi,
+            ("update", "articles"): ArticleUpdateApi,
+            ("remove", "articles"): ArticleDeleteApi,
+        }
+
+update and remove operations pass the ref (or data) id to the view as the
+path capture named by operation_path_arg.
+"""
+import copy
+from typing import Any, Dict, List, Tuple
+
+from django.core.exceptions import PermissionDenied
+from django.db import transaction
+from django.http import Http404, JsonResponse
+
+from main.api_helpers import ApiRequestError, ApiResponse, FormApiMixin
+
+
+ATOMIC_MEDIA_TYPE = 'application/vnd.api+json; ext="https://jsonapi.org/ext/atomic"'
+
+
+class AtomicOperationsApiMixin(FormApiMixin):
+    """
+    Runs every operation in the "atomic:operations" member of the body
+    inside one transaction. Returns the results in the same order as the
+    operations, or the errors of the first operation to fail with their
+    pointers relative to the whole document.
+    """
+
+    # Maps (op, resource type) to the FormApiMixin view handling it
+    operation_views: Dict[Tuple[str, str], Any] = {}
+    # The path capture the ref id is passed to the operation view as
+    operation_path_arg = "id"
+    max_operations = 100
+
+    operation_methods = {
+        "add": "POST",
+        "update": "PUT",
+        "remove": "DELETE",
+    }
+
+    def post(self, request, *args, **kwargs):
+        try:
+            operations = self.get_operations()
+        except ApiRequestError as e:
+            return e.response()
+
+        results = []
+        with transaction.atomic():
+            for index, operation in enumerate(operations):
+                response = self.run_operation(request, operation)
+                if response.status_code >= 400:
+                    transaction.set_rollback(True)
+                    return self.operation_failed(index, response)
+                results.append(self.get_operation_result(response))
+
+        return JsonResponse(
+            {"atomic:results": results},
+            content_type=ATOMIC_MEDIA_TYPE,
+        )
+
+    def get_operations(self) -> List[Dict[str, Any]]:
+        body = self.read_json_body()
+        operations = body.get("atomic:operations") if isinstance(body, dict) else None
+        if not isinstance(operations, list) or not operations:
+            raise ApiRequestError("Body must contain a non-empty atomic:operations list", status=400)
+        if len(operations) > self.max_operations:
+            raise ApiRequestError(f"At most {self.max_operations} operations allowed per request", status=400)
+        return operations
+
+    def run_operation(self, request, operation: Any):
+        """
+        Dispatch an operation to its view and return the response
+        """
+        if not isinstance(operation, dict) or operation.get("op") not in self.operation_methods:
+            return self.operation_error("/op", "Operation must be one of add, update or remove")
+
+        op = operation["op"]
+        ref = operation.get("ref") or {}
+        if not isinstance(ref, dict):
+            return self.operation_error("/ref", "ref must be an object")
+        data = operation.get("data")
+        resource_type = ref.get("type") or (data.get("type") if isinstance(data, dict) else None)
+        view_class = self.operation_views.get((op, resource_type))
+        if view_class is None:
+            return self.operation_error("/op", f"Unsupported operation {op} on type {resource_type}")
+
+        path_args = {}
+        resource_id = ref.get("id") or (data.get("id") if isinstance(data, dict) else None)
+        if op != "add":
+            if resource_id is None:
+                return self.operation_error("/ref", "Operation needs a ref with an id")
+            path_args[self.operation_path_arg] = resource_id
+
+        operation_request = copy.copy(request)
+        operation_request.method = self.operation_methods[op]
+
+        view = view_class(json_body=operation)
+        view.setup(operation_request, **path_args)
+        try:
+            return view.dispatch(operation_request, **path_args)
+        except Http404:
+            # Reported against the operation like any other failure rather
+            # than as Django's error page
+            return ApiResponse(errors=[{"status": "404", "title": "Not found"}], status=404)
+        except PermissionDenied:
+            return ApiResponse(errors=[{"status": "403", "title": "Permission denied"}], status=403)
+
+    def get_operation_result(self, response) -> Dict[str, Any]:
+        document = getattr(response, "document", None)
+        if document and "data" in document:
+            return {"data": document["data"]}
+        return {}
+
+    def operation_failed(self, index: int, response):
+        """
+        Build the response for a failed operation, making error pointers
+        relative to the whole request document.
+        """
+        errors = (getattr(response, "document", None) or {}).get("errors") or [
+            {
+                "status": str(response.status_code),
+                "title": "Operation failed",
+            }
+        ]
+
+        prefix = f"/atomic:operations/{index}"
+        rtn = []
+        for error in errors:
+            error = dict(error)
+            source = error.get("source")
+            if source and "pointer" in source:
+                error["source"] = {**source, "pointer": prefix + source["pointer"]}
+            elif not source:
+                error["source"] = {"pointer": prefix}
+            rtn.append(error)
+
+        return ApiResponse(errors=rtn, status=response.status_code, content_type=ATOMIC_MEDIA_TYPE)
+
+    def operation_error(self, pointer: str, detail: str):
+        """
+        An error response for an operation that couldn't be dispatched. The
+        pointer is relative to the operation.
+        """
+        return ApiResponse(
+            errors=[
+                {
+                    "status": "400",
+                    "title": "Invalid operation",
+                    "detail": detail,
+                    "source": {"pointer": pointer},
+                }
+            ],
+            status=400,
+        )
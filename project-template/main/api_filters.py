@@ -0,0 +1,239 @@
+"""
+JSON:API filter[...] and sort= query parameters for collection views.
+
+See https://jsonapi.org/format/#fetching-filtering and
+https://jsonapi.org/format/#fetching-sorting
+
+Filters are whitelisted per view and each one has to be backed by a
+database index, so a client can't turn a list endpoint into a sequential
+scan in production:
+
+    class PermissionFilterSet(ApiFilterSet):
+        model = Permission
+        filters = {
+            # Indexed by the foreign key
+            "content_type": ApiFilter(operators=["eq", "in"]),
+            # Only a btree index, so no contains
+            "codename": ApiFilter(operators=["eq", "startswith"], sortable=True, index="perm_codename_like"),
+        }
+
+    class PermissionListApi(LoginNotRequiredMixin, ResourceApiMixin, View):
+        serializer_class = PermissionSerializer
+        filterset_class = PermissionFilterSet
+
+Requests then look like /permissions?filter[codename][startswith]=add_&sort=-codename .
+
+The supporting index is worked out from the model (primary key, unique,
+db_index, foreign keys, Meta.indexes and unique constraints with the field
+first). Set index to the name of the index if it's been created some other
+way, e.g. in a RunSQL migration. Operators other than the btree friendly
+ones (eq, lt, lte, gt, gte, in) always need an explicitly named index.
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.core.checks import Warning, register
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Model, QuerySet, UniqueConstraint
+from django.http import QueryDict
+
+from main.api_helpers import ApiParameterError
+
+
+FILTER_PARAMETER_RE = re.compile(r"^filter\[([^\]]+)\](?:\[([^\]]+)\])?$")
+
+
+class ApiFilter:
+    """
+    A whitelisted filter on a model field
+    """
+
+    # JSON:API operator name -> Django lookup
+    lookups = {
+        "eq": "exact",
+        "lt": "lt",
+        "lte": "lte",
+        "gt": "gt",
+        "gte": "gte",
+        "in": "in",
+        "startswith": "startswith",
+        "contains": "contains",
+    }
+    # Operators any btree index on the column can be used for
+    btree_operators = {"eq", "lt", "lte", "gt", "gte", "in"}
+
+    def __init__(self, field: Optional[str]=None, operators: Iterable[str]=("eq",), sortable: bool=False, index: Optional[str]=None):
+        """
+        :param field: The model field, defaults to the filter name
+        :param operators: Allowed operators, see ApiFilter.lookups
+        :param sortable: Whether sort= can use this filter name
+        :param index: The name of the index supporting this filter, if it
+            can't be worked out from the model
+        """
+        unknown = set(operators) - set(self.lookups)
+        if unknown:
+            raise ValueError(f"Unknown filter operators {unknown}")
+
+        self.field = field
+        self.operators = list(operators)
+        self.sortable = sortable
+        self.index = index
+
+
+class ApiFilterSet:
+    """
+    Compiles filter[...] and sort= parameters into ORM lookups against a
+    whitelist of filters.
+    """
+
+    model: Model = None
+    filters: Dict[str, ApiFilter] = {}
+
+    def __init__(self, query: QueryDict):
+        self.query = query
+
+    def filter_queryset(self, queryset: QuerySet) -> QuerySet:
+        """
+        Apply the requested filters. Raises ApiParameterError if any of
+        them aren't allowed.
+        """
+        lookups = {}
+        for name, operator, parameter in self._get_requested_filters():
+            api_filter = self.filters.get(name)
+            if api_filter is None:
+                raise ApiParameterError(parameter, f"Filtering on {name} isn't supported")
+            if operator not in api_filter.operators:
+                raise ApiParameterError(parameter, f"Operator {operator} isn't supported for {name}")
+            self._check_index(name, operator, parameter)
+
+            field = self._get_field(name)
+            lookup = f"{field.name}__{ApiFilter.lookups[operator]}"
+            lookups[lookup] = self._convert_value(field, operator, self.query.get(parameter), parameter)
+
+        return queryset.filter(**lookups)
+
+    def get_ordering(self) -> Optional[List[str]]:
+        """
+        The order_by() arguments for the sort parameter or None if there
+        isn't one.
+        """
+        value = self.query.get("sort")
+        if not value:
+            return None
+
+        rtn = []
+        for sort_field in value.split(","):
+            descending = sort_field.startswith("-")
+            name = sort_field.lstrip("-")
+            api_filter = self.filters.get(name)
+            if api_filter is None or not api_filter.sortable:
+                raise ApiParameterError("sort", f"Sorting on {name} isn't supported")
+            self._check_index(name, None, "sort")
+            rtn.append(("-" if descending else "") + self._get_field(name).name)
+        return rtn
+
+    def _get_requested_filters(self) -> List[Tuple[str, str, str]]:
+        rtn = []
+        for parameter in self.query.keys():
+            if parameter.startswith("filter"):
+                match = FILTER_PARAMETER_RE.match(parameter)
+                if not match:
+                    raise ApiParameterError(parameter, "Filters must look like filter[field] or filter[field][operator]")
+                rtn.append((match.group(1), match.group(2) or "eq", parameter))
+        return rtn
+
+    def _check_index(self, name, operator, parameter):
+        api_filter = self.filters[name]
+        index = self.get_supporting_indexes().get(name)
+        if index is None:
+            raise ApiParameterError(parameter, f"{name} isn't indexed so can't be filtered or sorted on")
+        if operator is not None and operator not in ApiFilter.btree_operators and api_filter.index is None:
+            raise ApiParameterError(parameter, f"No index supports the {operator} operator for {name}")
+
+    @classmethod
+    def _get_field(cls, name):
+        return cls.model._meta.get_field(cls.filters[name].field or name)
+
+    @staticmethod
+    def _convert_value(field, operator, value, parameter):
+        try:
+            if operator == "in":
+                return [field.to_python(v) for v in value.split(",")]
+            return field.to_python(value)
+        except ValidationError as e:
+            raise ApiParameterError(parameter, " ".join(e.messages))
+
+    @classmethod
+    def get_supporting_indexes(cls) -> Dict[str, Optional[str]]:
+        """
+        Filter name -> a description of the index supporting it, or None if
+        there isn't one. Calculated once per class.
+        """
+        cached = cls.__dict__.get("_supporting_indexes")
+        if cached is None:
+            cached = {
+                name: api_filter.index or _find_index(cls._get_field(name))
+                for name, api_filter in cls.filters.items()
+            }
+            cls._supporting_indexes = cached
+        return cached
+
+
+def _find_index(field) -> Optional[str]:
+    """
+    Name (or description) of an index with field as its leading column
+    """
+    if field.primary_key:
+        return "primary key"
+    if field.unique:
+        return "unique"
+    if field.db_index:
+        return "db_index"
+
+    meta = field.model._meta
+    for index in meta.indexes:
+        if index.fields and index.fields[0].lstrip("-") == field.name:
+            return index.name
+    for constraint in meta.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.fields and constraint.fields[0] == field.name:
+            return constraint.name
+    for fields in meta.unique_together:
+        if fields[0] == field.name:
+            return "unique_together"
+    return None
+
+
+@register()
+def api_filter_index_check(app_configs, **kwargs):
+    """
+    Checks that every whitelisted API filter refers to a real field with
+    an index supporting it.
+    """
+    from main.auth.checks import get_all_view_classes
+
+    rtn = []
+    for cls in get_all_view_classes():
+        filterset_class = getattr(cls, "filterset_class", None)
+        if not (isinstance(filterset_class, type) and issubclass(filterset_class, ApiFilterSet)):
+            continue
+
+        for name, api_filter in filterset_class.filters.items():
+            try:
+                field = filterset_class._get_field(name)
+            except FieldDoesNotExist:
+                rtn.append(Warning(
+                    f"API filter {name} doesn't refer to a model field",
+                    obj=filterset_class,
+                    id="main.apifilterfield",
+                ))
+                continue
+
+            if (api_filter.index or _find_index(field)) is None:
+                rtn.append(Warning(
+                    f"API filter {name} has no supporting index",
+                    hint="Add an index to the field or remove the filter",
+                    obj=filterset_class,
+                    id="main.apifilterindex",
+                ))
+
+    return rtn
@@ -4,10 +4,12 @@ Classes to help you make a JSON:API based API.
 See https://jsonapi.org/format/
 """
 import json
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from django import forms
-from django.http import HttpRequest, JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import QuerySet
+from django.http import HttpRequest, JsonResponse, StreamingHttpResponse
 
 
 class ApiResponse(JsonResponse):
@@ -16,15 +18,19 @@ class ApiResponse(JsonResponse):
     - data - https://jsonapi.org/format/#document-resource-objects
     - Errors - https://jsonapi.org/format/#error-objects
     - Links - https://jsonapi.org/format/#document-links
+    - Included - https://jsonapi.org/format/#document-compound-documents
+    - Meta - https://jsonapi.org/format/#document-meta
     """
-    def __init__(self, data: Optional[Any]=None, errors: Optional[List]=None, links: Optional[Any]=None, **kwargs):
+    def __init__(self, data: Optional[Any]=None, errors: Optional[List]=None, links: Optional[Any]=None, included: Optional[List]=None, meta: Optional[Dict]=None, **kwargs):
         kwargs.setdefault("content_type", "application/vnd.api+json")
 
-        if data:
+        if data is not None:
             assert errors is None
             content = {
                 "data": data
             }
+            if included is not None:
+                content["included"] = included
         elif errors:
             assert data is None
             content = {
@@ -37,6 +43,11 @@ class ApiResponse(JsonResponse):
 
         if links:
             content["links"] = links
+        if meta:
+            content["meta"] = meta
+
+        # Keep the undumped document around for callers combining responses
+        self.document = content
 
         super().__init__(
             data=content,
@@ -44,6 +55,74 @@ class ApiResponse(JsonResponse):
         )
 
 
+class StreamingApiResponse(StreamingHttpResponse):
+    """
+    Collection response which serialises the rows of a queryset as they
+    are read from the database rather than building the whole document in
+    memory first. Takes the same errors and links arguments as ApiResponse.
+
+        StreamingApiResponse(
+            queryset=MyModel.objects.all(),
+            serializer=lambda row: {"type": "mymodel", "id": str(row.pk)},
+        )
+
+    Note that once streaming has started the status code can't change, so
+    any database errors part way through will truncate the response.
+    """
+
+    def __init__(
+            self,
+            queryset: Optional[QuerySet]=None,
+            serializer: Optional[Callable[[Any], Any]]=None,
+            errors: Optional[List]=None,
+            links: Optional[Any]=None,
+            chunk_size: int=2000,
+            encoder=DjangoJSONEncoder,
+            **kwargs):
+        kwargs.setdefault("content_type", "application/vnd.api+json")
+
+        if queryset is not None:
+            assert errors is None
+            assert serializer is not None
+        elif errors:
+            assert serializer is None
+        else:
+            raise AssertionError(
+                "Must specify either queryset or errors keys."
+            )
+
+        super().__init__(
+            streaming_content=self._generate(queryset, serializer, errors, links, chunk_size, encoder),
+            **kwargs,
+        )
+
+    @staticmethod
+    def _generate(queryset, serializer, errors, links, chunk_size, encoder):
+        dumps = encoder().encode
+
+        if queryset is None:
+            yield '{"errors": ' + dumps(errors)
+        else:
+            yield '{"data": ['
+            # Yield a chunk at a time so we're not making a write call per row
+            buffer = []
+            separator = ""
+            for row in queryset.iterator(chunk_size=chunk_size):
+                buffer.append(separator)
+                buffer.append(dumps(serializer(row)))
+                separator = ", "
+                if len(buffer) >= chunk_size * 2:
+                    yield "".join(buffer)
+                    buffer = []
+            buffer.append("]")
+            yield "".join(buffer)
+
+        if links:
+            yield ', "links": ' + dumps(links)
+
+        yield "}"
+
+
 class SimpleErrorResponse(ApiResponse):
     """
     A basic message and error code (same as HTTP status) response
@@ -61,9 +140,11 @@ class SimpleErrorResponse(ApiResponse):
             status=status
         )
 
-    def _calculate_status(self, status: int):
+    def _calculate_title(self, status: int):
         if status == 500:
             return "internal_server_error"
+        elif status == 413:
+            return "payload_too_large"
         elif status == 405:
             return "method_not_allowed"
         elif status == 404:
@@ -76,6 +157,46 @@ class SimpleErrorResponse(ApiResponse):
             raise ValueError(f"Unknown status code {status}")
 
 
+class ApiParameterError(ValueError):
+    """
+    A query parameter couldn't be used. Turned into a JSON:API 400 error
+    with the parameter as the source.
+    """
+
+    def __init__(self, parameter: str, detail: str):
+        super().__init__(detail)
+        self.parameter = parameter
+        self.detail = detail
+
+    def as_error(self) -> Dict[str, Any]:
+        return {
+            "status": "400",
+            "title": "Invalid query parameter",
+            "detail": self.detail,
+            "source": {
+                "parameter": self.parameter
+            }
+        }
+
+    def response(self) -> ApiResponse:
+        return ApiResponse(errors=[self.as_error()], status=400)
+
+
+class ApiRequestError(Exception):
+    """
+    The request couldn't be processed, e.g. the body was too large or not
+    valid JSON. Turned into a JSON:API error response with the given status.
+    """
+
+    def __init__(self, detail: str, status: int=400):
+        super().__init__(detail)
+        self.detail = detail
+        self.status = status
+
+    def response(self) -> ApiResponse:
+        return SimpleErrorResponse(self.detail, status=self.status)
+
+
 class FormApiMixin:
     """
     Validate the request and return a nicely formatted JSON:API error response if it doesn't pass the validation in a form.
@@ -94,6 +215,8 @@ class FormApiMixin:
             "my_header": ("header", "My-Header"),
             # The field called query_field will be populated from the query parameters 'query_field'
             "query_field": ("query", "query_field"),
+            # The field called form_field will be populated from the urlencoded or multipart POST field 'form_field'
+            "form_field": ("form", "form_field"),
             # The field called body_field will be populated from the decoded JSON body at the given JSON pointer path
             # see https://datatracker.ietf.org/doc/html/rfc6901#section-5
             "body_field": ("body", "/data/attributes/foo"),
@@ -108,6 +231,17 @@ class FormApiMixin:
     ]
     # Set this to override where form data gets populated from
     field_data_sources = None
+    # Parse the field_data_sources once per view class rather than on every request
+    cache_field_data_plan = True
+    # Largest JSON body in bytes this view accepts. Checked against the Content-Length header before
+    # reading anything, and again while reading in case the header is missing.
+    max_body_size = 1024 * 1024
+    body_read_chunk_size = 64 * 1024
+    # Set to use this already decoded document rather than reading the request body, e.g. for
+    # atomic operations
+    json_body = None
+    # Bind the form for DELETE requests too. Always done for atomic operations.
+    bind_delete_form = False
 
     def get_form_class(self):
         """Return the form class to use."""
@@ -124,14 +258,43 @@ class FormApiMixin:
             key: ("body", f"/data/attributes/{key}")
             for key in (form_fields.keys() if form_fields else [])
         }
-        default_sources.update(self.field_data_sources)
+        default_sources.update(self.field_data_sources or {})
         return default_sources
 
+    def get_field_data_plan(self, form_fields):
+        """
+        Return the list of (field_name, source, source_qualifier, pointer) tuples used by get_form_data.
+
+        Body pointers are parsed once per view class and form field set rather than on every request. If you
+        override get_field_data_sources to vary per request set cache_field_data_plan = False.
+        """
+        if not self.cache_field_data_plan:
+            return compile_field_data_sources(self.get_field_data_sources(form_fields))
+
+        cls = type(self)
+        # Look in the class' own __dict__ so subclasses don't share their parent's cache
+        plans = cls.__dict__.get("_field_data_plans")
+        if plans is None:
+            plans = {}
+            cls._field_data_plans = plans
+
+        key = tuple(form_fields.keys()) if form_fields else ()
+        plan = plans.get(key)
+        if plan is None:
+            plan = compile_field_data_sources(self.get_field_data_sources(form_fields))
+            plans[key] = plan
+        return plan
+
     def get_form_kwargs(self, form_fields=None):
         """Return the keyword arguments for instantiating the form."""
         kwargs = {}
 
-        if self.request.method in ("POST", "PUT"):
+        # DELETE forms are only bound when asked for, or for atomic
+        # operations (see main/api_atomic.py), which pass the operation in as
+        # json_body. Plain DELETE requests often have no body at all.
+        method = self.request.method
+        bind_delete = self.bind_delete_form or self.json_body is not None
+        if method in ("POST", "PUT") or (method == "DELETE" and bind_delete):
             kwargs.update(
                 {
                     "data": self.get_form_data(form_fields=form_fields),
@@ -150,10 +313,10 @@ class FormApiMixin:
         def _body():
             nonlocal body_cache
             if body_cache is None:
-                body_cache = json.loads(request.body)
+                body_cache = self.read_json_body()
             return body_cache
 
-        def _get(source, source_qualifier):
+        def _get(source, source_qualifier, pointer):
             if source == "path":
                 # I'm making it an error if this one is missing since that's a programmer error
                 return request.request_path_args[source_qualifier]
@@ -161,20 +324,66 @@ class FormApiMixin:
                 return request.headers.get(source_qualifier)
             elif source == "query":
                 return request.GET.get(source_qualifier)
+            elif source == "form":
+                return request.POST.get(source_qualifier)
             elif source == "body":
                 try:
-                    return extract_json_path(source_qualifier, _body())
+                    return pointer.resolve(_body())
                 except KeyError:
                     return None
             else:
                 raise RuntimeError("Invalid _data_sources source: " + source)
 
         return {
-            field_name: _get(source, source_qualifier)
+            field_name: _get(source, source_qualifier, pointer)
 
-            for field_name, (source, source_qualifier) in self.get_field_data_sources(form_fields).items()
+            for field_name, source, source_qualifier, pointer in self.get_field_data_plan(form_fields)
         }
 
+    def read_json_body(self) -> Any:
+        """
+        Read and decode the JSON body, raising ApiRequestError if it's too
+        large or malformed.
+
+        Reads the request stream in chunks rather than through request.body,
+        so an oversized body is rejected as soon as we've seen too much of
+        it. The bytes are then kept on the request as Django would, so
+        request.body still works afterwards (e.g. for error reporting).
+        """
+        if self.json_body is not None:
+            return self.json_body
+
+        request = self.request
+        max_body_size = self.max_body_size
+
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError as e:
+            raise ApiRequestError("Invalid Content-Length header", status=400) from e
+        if content_length > max_body_size:
+            raise ApiRequestError(f"Request body larger than {max_body_size} bytes", status=413)
+
+        if hasattr(request, "_body"):
+            # Something else has already read it
+            data = request.body
+        else:
+            data = bytearray()
+            while True:
+                chunk = request.read(self.body_read_chunk_size)
+                if not chunk:
+                    break
+                data += chunk
+                if len(data) > max_body_size:
+                    raise ApiRequestError(f"Request body larger than {max_body_size} bytes", status=413)
+            data = bytes(data)
+            # Where request.body looks for it, since the stream has been read
+            request._body = data
+
+        try:
+            return json.loads(data)
+        except ValueError as e:
+            raise ApiRequestError(f"Request body is not valid JSON: {e}", status=400) from e
+
     def form_valid(self, form):
         """If the form is valid return success."""
 
@@ -218,7 +427,7 @@ class FormApiMixin:
             return {
                 "header": source_qualifier
             }
-        elif source == "query":
+        elif source in ("query", "form"):
             return {
                 "parameter": source_qualifier
             }
@@ -235,7 +444,10 @@ class FormApiMixin:
         POST variables and then check if it's valid.
         """
         request.request_path_args = kwargs
-        form = self.get_form()
+        try:
+            form = self.get_form()
+        except ApiRequestError as e:
+            return e.response()
         if form.is_valid():
             return self.form_valid(form)
         else:
@@ -248,39 +460,140 @@ class FormApiMixin:
         return self.post(*args, **kwargs)
 
 
+class AsyncFormApiMixin(FormApiMixin):
+    """
+    FormApiMixin for async views, so ASGI deployments can serve API calls
+    without handing each one off to a thread.
+
+    The principal is resolved with request.auser() and assigned to
+    request.user, so the sync parts (form construction, logging) don't
+    trigger a synchronous database load. Under ASGI Django has already
+    received the whole body before the view runs, so reading it doesn't
+    block on the network.
+
+    Override the async form_valid and form_invalid hooks. Form validation
+    runs on the event loop, so if your form's clean methods hit the database
+    wrap them up with sync_to_async in form_valid instead.
+    """
+
+    async def post(self, request, *args, **kwargs):
+        request.request_path_args = kwargs
+        if hasattr(request, "auser"):
+            request.user = await request.auser()
+
+        try:
+            form = self.get_form()
+        except ApiRequestError as e:
+            return e.response()
+        if form.is_valid():
+            return await self.form_valid(form)
+        else:
+            return await self.form_invalid(form)
+
+    async def put(self, *args, **kwargs):
+        return await self.post(*args, **kwargs)
+
+    async def delete(self, *args, **kwargs):
+        return await self.post(*args, **kwargs)
+
+    async def form_valid(self, form):
+        """If the form is valid return success."""
+
+        raise NotImplementedError
+
+    async def form_invalid(self, form):
+        """If the form is invalid let the caller know the errors."""
+
+        return super().form_invalid(form)
+
+
+def compile_field_data_sources(field_data_sources: Dict[str, Tuple[str, str]]) -> List[Tuple[str, str, str, Optional["JsonPointer"]]]:
+    """
+    Turns a FormApiMixin.field_data_sources style dict into a list of
+    (field_name, source, source_qualifier, pointer) tuples. pointer is a
+    JsonPointer for "body" sources and None otherwise.
+    """
+    return [
+        (
+            field_name,
+            source,
+            source_qualifier,
+            JsonPointer(source_qualifier) if source == "body" else None,
+        )
+        for field_name, (source, source_qualifier) in field_data_sources.items()
+    ]
+
+
+class JsonPointer:
+    """
+    A JSON pointer that has been parsed ahead of time, so resolving it
+    against a document only has to walk the document.
+
+    See https://datatracker.ietf.org/doc/html/rfc6901
+    """
+
+    __slots__ = ("path", "steps")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.steps = tuple(self._parse(path))
+
+    def __repr__(self):
+        return f"JsonPointer({self.path!r})"
+
+    @staticmethod
+    def _parse(path: str):
+        """
+        Yields (startpos, matcher, num_matcher) for each segment of the path
+        """
+        startpos = 0
+        endpos = 0
+        while endpos < len(path)-1:
+            for endpos in range(startpos+1, len(path)+1):
+                if endpos == len(path) or path[endpos] == "/":
+                    break
+
+            matcher = path[startpos+1:endpos].replace("~1", "/").replace("~0", "~")
+            try:
+                num_matcher = int(matcher)
+            except ValueError:
+                num_matcher = None
+
+            yield startpos, matcher, num_matcher
+            startpos = endpos
+
+    def resolve(self, obj: Any) -> Any:
+        """
+        Extract the data this pointer refers to from obj. Throws a KeyError
+        if it can't find it.
+        """
+        path = self.path
+        curr_obj = obj
+        for startpos, matcher, num_matcher in self.steps:
+            if num_matcher is not None:
+                if not isinstance(curr_obj, list):
+                    raise KeyError(f"Item at pos {startpos} in \"{path}\" does not point to a list")
+                if (len(curr_obj) - 1) < num_matcher:
+                    raise KeyError(f"Item at pos {startpos} in \"{path}\" too large for list")
+
+                curr_obj = curr_obj[num_matcher]
+            elif matcher in curr_obj:
+                curr_obj = curr_obj[matcher]
+            else:
+                raise KeyError(f"Couldn't find item at pos {startpos} in \"{path}\"")
+
+        return curr_obj
+
+
 def extract_json_path(path: str, obj: Any) -> Any:
     """
     Attempts to extract data from the given object based on the JSONPath
     in path. Throws a KeyError if it can't find it. Throws a ValueError if
     the JSON path is invalid.
 
+    Parses path on every call, use JsonPointer if you're resolving the same
+    path repeatedly.
+
     See https://datatracker.ietf.org/doc/html/rfc6901#section-3
     """
-    curr_obj = obj
-    startpos = 0
-    endpos = 0
-    while endpos < len(path)-1:
-        for endpos in range(startpos+1, len(path)+1):
-            if endpos == len(path) or path[endpos] == "/":
-                break
-
-        matcher = path[startpos+1:endpos].replace("~1", "/").replace("~0", "~")
-        try:
-            num_matcher = int(matcher)
-        except ValueError:
-            num_matcher = None
-        if num_matcher is not None:
-            if not isinstance(curr_obj, list):
-                raise KeyError(f"Item at pos {startpos} in \"{path}\" does not point to a list")
-            if (len(curr_obj) - 1) < num_matcher:
-                raise KeyError(f"Item at pos {startpos} in \"{path}\" too large for list")
-
-            curr_obj = curr_obj[num_matcher]
-            startpos = endpos
-        elif matcher in curr_obj:
-            curr_obj = curr_obj[matcher]
-            startpos = endpos
-        else:
-            raise KeyError(f"Couldn't find item at pos {startpos} in \"{path}\"")
-
-    return curr_obj
+    return JsonPointer(path).resolve(obj)
@@ -0,0 +1,180 @@
+"""
+Keyset (cursor) pagination for JSON:API collections.
+
+See https://jsonapi.org/profiles/ethanresnick/cursor-pagination/
+
+Rather than OFFSET/LIMIT this remembers the (ordering, pk) values of the
+last row on the page and asks the database for rows after it, so a deep
+page costs the same as the first one provided there's an index matching
+the ordering. UUID7Field primary keys sort by creation time, so the
+default ordering of just the primary key works well with them.
+
+    class MyListApi(LoginNotRequiredMixin, ResourceApiMixin, View):
+        serializer_class = MySerializer
+        paginator_class = CursorPaginator
+
+Clients then pass page[size], page[after] and page[before] and follow the
+links.next and links.prev URLs in the response.
+"""
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.core import signing
+from django.db.models import Q, QuerySet
+from django.http import HttpRequest
+
+from main.api_helpers import ApiParameterError
+
+
+class CursorPage:
+    """
+    A page of results along with the links and meta for the response
+    """
+
+    def __init__(self, object_list: List[Any], links: Dict[str, Optional[str]], meta: Dict[str, Any]):
+        self.object_list = object_list
+        self.links = links
+        self.meta = meta
+
+
+class CursorPaginator:
+    """
+    Paginates a queryset with opaque cursors that encode the ordering
+    values of the first or last row on a page.
+    """
+
+    # Model fields to order by, "-" prefixed for descending. Must not be
+    # nullable. The primary key is added on the end to break ties.
+    ordering: Sequence[str] = ("pk",)
+    page_size = 50
+    max_page_size = 500
+    # Set to False to skip the COUNT(*) query for the total in meta
+    include_count = True
+    salt = "main.api_pagination.CursorPaginator"
+
+    def __init__(self, ordering: Optional[Sequence[str]]=None, page_size: Optional[int]=None, max_page_size: Optional[int]=None, include_count: Optional[bool]=None):
+        if ordering is not None:
+            self.ordering = ordering
+        if page_size is not None:
+            self.page_size = page_size
+        if max_page_size is not None:
+            self.max_page_size = max_page_size
+        if include_count is not None:
+            self.include_count = include_count
+
+    def paginate(self, queryset: QuerySet, request: HttpRequest) -> CursorPage:
+        """
+        Returns the page of queryset described by the request's page[...]
+        parameters. Raises ApiParameterError if they're invalid.
+        """
+        fields = self._get_ordering_fields(queryset.model)
+        page_size = self._get_page_size(request)
+        after = request.GET.get("page[after]")
+        before = request.GET.get("page[before]")
+        if after and before:
+            raise ApiParameterError("page[before]", "Can't use page[after] and page[before] together")
+
+        meta = {}
+        if self.include_count:
+            meta["page"] = {"total": queryset.count()}
+
+        forward = not before
+        if after:
+            queryset = queryset.filter(self._keyset_filter(fields, self._decode(after, fields, "page[after]"), forward))
+        elif before:
+            queryset = queryset.filter(self._keyset_filter(fields, self._decode(before, fields, "page[before]"), forward))
+
+        queryset = queryset.order_by(*[
+            ("-" if descending == forward else "") + name
+            for name, descending, _ in fields
+        ])
+        # Fetch one extra to find out if there's another page
+        object_list = list(queryset[:page_size + 1])
+        has_more = len(object_list) > page_size
+        object_list = object_list[:page_size]
+        if not forward:
+            object_list.reverse()
+
+        links = {"next": None, "prev": None}
+        if object_list:
+            if has_more or not forward:
+                links["next"] = self._build_link(request, "page[after]", self._encode(object_list[-1], fields))
+            if (has_more and not forward) or after:
+                links["prev"] = self._build_link(request, "page[before]", self._encode(object_list[0], fields))
+
+        return CursorPage(object_list, links, meta)
+
+    def _get_ordering_fields(self, model):
+        """
+        List of (name, descending, field) tuples for the ordering plus the
+        primary key.
+        """
+        pk = model._meta.pk
+        rtn = []
+        for name in self.ordering:
+            descending = name.startswith("-")
+            name = name.lstrip("-")
+            field = pk if name == "pk" else model._meta.get_field(name)
+            rtn.append((field.name, descending, field))
+
+        if not any(field == pk for _, _, field in rtn):
+            rtn.append((pk.name, False, pk))
+        return rtn
+
+    def _get_page_size(self, request):
+        value = request.GET.get("page[size]")
+        if value is None:
+            return self.page_size
+
+        try:
+            page_size = int(value)
+        except ValueError:
+            page_size = 0
+        if not 0 < page_size <= self.max_page_size:
+            raise ApiParameterError("page[size]", f"Page size must be a number between 1 and {self.max_page_size}")
+        return page_size
+
+    def _keyset_filter(self, fields, values, forward) -> Q:
+        """
+        Rows that sort after (or before if not forward) the given values:
+
+            (a > 1) OR (a = 1 AND b > 2) OR ...
+        """
+        rtn = Q()
+        for i, (name, descending, _) in enumerate(fields):
+            lookup = "lt" if descending == forward else "gt"
+            clause = Q(**{f"{name}__{lookup}": values[i]})
+            for j, (prev_name, _, _) in enumerate(fields[:i]):
+                clause &= Q(**{prev_name: values[j]})
+            rtn |= clause
+        return rtn
+
+    def _encode(self, obj, fields) -> str:
+        return signing.dumps(
+            {
+                "o": [name for name, _, _ in fields],
+                "v": [field.value_to_string(obj) for _, _, field in fields],
+            },
+            salt=self.salt,
+            compress=True,
+        )
+
+    def _decode(self, cursor, fields, parameter):
+        try:
+            payload = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            raise ApiParameterError(parameter, "Invalid cursor")
+
+        if payload.get("o") != [name for name, _, _ in fields]:
+            raise ApiParameterError(parameter, "Cursor is for a different ordering")
+
+        return [
+            field.to_python(value)
+            for value, (_, _, field) in zip(payload["v"], fields)
+        ]
+
+    def _build_link(self, request, parameter, cursor) -> str:
+        query = request.GET.copy()
+        query.pop("page[after]", None)
+        query.pop("page[before]", None)
+        query[parameter] = cursor
+        return f"{request.path}?{query.urlencode()}"
@@ -0,0 +1,393 @@
+"""
+Turn models into JSON:API resource objects, with support for sparse
+fieldsets and compound documents.
+
+See https://jsonapi.org/format/#fetching-sparse-fieldsets and
+https://jsonapi.org/format/#fetching-includes
+
+Requested fields and includes are used to work out which only(),
+select_related() and prefetch_related() calls to make, so the database
+only fetches what ends up in the document.
+
+    class ContentTypeSerializer(ResourceSerializer):
+        type = "content-types"
+        model = ContentType
+        attributes = ["app_label", "model"]
+
+    class PermissionSerializer(ResourceSerializer):
+        type = "permissions"
+        model = Permission
+        attributes = ["name", "codename"]
+        relationships = {
+            # The model field (or reverse relation name) and the serializer
+            # for the related model
+            "content_type": ContentTypeSerializer,
+        }
+
+    class PermissionListApi(LoginNotRequiredMixin, ResourceApiMixin, View):
+        serializer_class = PermissionSerializer
+
+        def get_queryset(self):
+            return Permission.objects.all()
+
+A request for /permissions?fields[permissions]=name,content_type&include=content_type
+then does a single query with a join to the content type table.
+"""
+import re
+from typing import Any, Dict, Iterable, List, Optional, Set, Type
+
+from django.core.exceptions import FieldDoesNotExist, ObjectDoesNotExist
+from django.db.models import Model, Prefetch, QuerySet
+from django.http import QueryDict
+
+from main.api_helpers import ApiParameterError, ApiResponse
+
+
+FIELDSET_PARAMETER_RE = re.compile(r"^fields\[([^\]]+)\]$")
+
+
+def parse_fieldsets(query: QueryDict) -> Dict[str, Set[str]]:
+    """
+    Turns fields[type]=a,b query parameters into {"type": {"a", "b"}}
+    """
+    rtn = {}
+    for key in query.keys():
+        match = FIELDSET_PARAMETER_RE.match(key)
+        if match:
+            rtn[match.group(1)] = {
+                field
+                for field in query.get(key).split(",")
+                if field
+            }
+    return rtn
+
+
+def parse_include(query: QueryDict) -> Dict[str, Dict]:
+    """
+    Turns an include=a,b.c query parameter into a tree like
+    {"a": {}, "b": {"c": {}}}
+    """
+    rtn = {}
+    for path in query.get("include", "").split(","):
+        if not path:
+            continue
+        node = rtn
+        for name in path.split("."):
+            node = node.setdefault(name, {})
+    return rtn
+
+
+class ResourceSerializer:
+    """
+    Describes how a model instance becomes a JSON:API resource object. An
+    instance serializes objects for one set of requested fields and includes.
+    """
+
+    # The JSON:API resource type
+    type: str = None
+    model: Type[Model] = None
+    # Model attributes to put in the "attributes" member
+    attributes: Iterable[str] = ()
+    # Relationship name -> serializer class. The name must be a model field or
+    # reverse relation
+    relationships: Dict[str, Type["ResourceSerializer"]] = {}
+
+    def __init__(self, fieldsets: Optional[Dict[str, Set[str]]]=None, include: Optional[Dict[str, Dict]]=None):
+        self.fieldsets = fieldsets or {}
+        self.include = include or {}
+
+    @classmethod
+    def get_attributes(cls, fieldsets: Dict[str, Set[str]]) -> List[str]:
+        requested = fieldsets.get(cls.type)
+        return [
+            name
+            for name in cls.attributes
+            if requested is None or name in requested
+        ]
+
+    @classmethod
+    def get_relationships(cls, fieldsets: Dict[str, Set[str]]) -> Dict[str, Type["ResourceSerializer"]]:
+        requested = fieldsets.get(cls.type)
+        return {
+            name: serializer
+            for name, serializer in cls.relationships.items()
+            if requested is None or name in requested
+        }
+
+    @classmethod
+    def validate(cls, fieldsets: Dict[str, Set[str]], include: Dict[str, Dict]):
+        """
+        Raises ApiParameterError if the fieldsets or includes refer to things
+        this serializer (or the ones it's related to) don't have.
+        """
+        serializers = {}
+        cls._collect_serializers(serializers)
+
+        for type_name, fields in fieldsets.items():
+            if type_name not in serializers:
+                raise ApiParameterError(f"fields[{type_name}]", f"Unknown resource type {type_name}")
+            serializer = serializers[type_name]
+            unknown = fields - set(serializer.attributes) - set(serializer.relationships)
+            if unknown:
+                raise ApiParameterError(
+                    f"fields[{type_name}]",
+                    f"Unknown fields for {type_name}: {', '.join(sorted(unknown))}"
+                )
+
+        cls._validate_include(include, "")
+
+    @classmethod
+    def _collect_serializers(cls, serializers):
+        if cls.type in serializers:
+            return
+        serializers[cls.type] = cls
+        for serializer in cls.relationships.values():
+            serializer._collect_serializers(serializers)
+
+    @classmethod
+    def _validate_include(cls, include, path_prefix):
+        for name, subtree in include.items():
+            if name not in cls.relationships:
+                raise ApiParameterError("include", f"Unknown relationship {path_prefix}{name}")
+            cls.relationships[name]._validate_include(subtree, f"{path_prefix}{name}.")
+
+    @classmethod
+    def optimise_queryset(cls, queryset: QuerySet, fieldsets: Dict[str, Set[str]], include: Dict[str, Dict], extra_only: Iterable[str]=()) -> QuerySet:
+        """
+        Restrict the queryset to the columns and relations needed to
+        serialize it with the given fieldsets and includes.
+        """
+        only, select_related, prefetch = cls._get_queryset_plan(fieldsets, include, "")
+        queryset = queryset.only(*only, *extra_only)
+        if select_related:
+            queryset = queryset.select_related(*select_related)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+    @classmethod
+    def _get_queryset_plan(cls, fieldsets, include, prefix):
+        opts = cls.model._meta
+        only = [prefix + opts.pk.name]
+        only.extend(prefix + name for name in cls.get_attributes(fieldsets))
+        select_related = []
+        prefetch = []
+
+        relationships = cls.get_relationships(fieldsets)
+        for name in include:
+            relationships.setdefault(name, cls.relationships[name])
+
+        for name, serializer in relationships.items():
+            field = _get_relation_field(cls.model, name)
+            if _is_forward_to_one(field):
+                # The foreign key column is enough for the resource linkage
+                only.append(prefix + name)
+                if name in include:
+                    select_related.append(prefix + name)
+                    sub_only, sub_select_related, sub_prefetch = serializer._get_queryset_plan(
+                        fieldsets,
+                        include[name],
+                        f"{prefix}{name}__"
+                    )
+                    only.extend(sub_only)
+                    select_related.extend(sub_select_related)
+                    prefetch.extend(sub_prefetch)
+            else:
+                # Reverse relations need the column pointing back at us so
+                # Django can match them up to the parent rows
+                extra_only = [field.field.name] if field.one_to_many or field.one_to_one else []
+                if name in include:
+                    related_queryset = serializer.optimise_queryset(
+                        serializer.model._default_manager.all(),
+                        fieldsets,
+                        include[name],
+                        extra_only=extra_only,
+                    )
+                else:
+                    related_queryset = serializer.model._default_manager.only(
+                        serializer.model._meta.pk.name,
+                        *extra_only
+                    )
+                prefetch.append(
+                    Prefetch(prefix + _get_relation_attr(field), queryset=related_queryset)
+                )
+
+        return only, select_related, prefetch
+
+    def serialize(self, obj: Model) -> Dict[str, Any]:
+        """
+        Build the resource object for obj
+        """
+        rtn = {
+            "type": self.type,
+            "id": str(obj.pk),
+        }
+
+        attributes = {
+            name: getattr(obj, name)
+            for name in self.get_attributes(self.fieldsets)
+        }
+        if attributes:
+            rtn["attributes"] = attributes
+
+        relationships = {
+            name: {"data": self._get_linkage(obj, name, serializer)}
+            for name, serializer in self.get_relationships(self.fieldsets).items()
+        }
+        if relationships:
+            rtn["relationships"] = relationships
+
+        return rtn
+
+    def get_included(self, objs: Iterable[Model]) -> List[Dict[str, Any]]:
+        """
+        Build the resource objects for everything in the include tree,
+        skipping any that are in objs or have already been included.
+        """
+        seen = {(self.type, str(obj.pk)) for obj in objs}
+        rtn = []
+        self._add_included(objs, self.include, seen, rtn)
+        return rtn
+
+    def _add_included(self, objs, include, seen, rtn):
+        for name, subtree in include.items():
+            serializer = self.relationships[name](self.fieldsets, subtree)
+            related_objs = [
+                related_obj
+                for obj in objs
+                for related_obj in self._get_related(obj, name)
+            ]
+            for related_obj in related_objs:
+                key = (serializer.type, str(related_obj.pk))
+                if key not in seen:
+                    seen.add(key)
+                    rtn.append(serializer.serialize(related_obj))
+            serializer._add_included(related_objs, subtree, seen, rtn)
+
+    def _get_related(self, obj, name) -> List[Model]:
+        field = _get_relation_field(self.model, name)
+        if field.many_to_many or field.one_to_many:
+            return list(getattr(obj, _get_relation_attr(field)).all())
+
+        try:
+            related_obj = getattr(obj, _get_relation_attr(field))
+        except ObjectDoesNotExist:
+            return []
+        return [related_obj] if related_obj is not None else []
+
+    def _get_linkage(self, obj, name, serializer):
+        field = _get_relation_field(self.model, name)
+        if _is_forward_to_one(field):
+            # Use the column so we don't load the related object unless it's included
+            related_id = getattr(obj, field.attname)
+            if related_id is None:
+                return None
+            return {"type": serializer.type, "id": str(related_id)}
+
+        linkage = [
+            {"type": serializer.type, "id": str(related_obj.pk)}
+            for related_obj in self._get_related(obj, name)
+        ]
+        if field.one_to_one:
+            return linkage[0] if linkage else None
+        return linkage
+
+    def build_document(self, objs: Iterable[Model]) -> Dict[str, Any]:
+        """
+        Keyword arguments for ApiResponse
+        """
+        objs = list(objs)
+        rtn = {
+            "data": [self.serialize(obj) for obj in objs],
+        }
+        if self.include:
+            rtn["included"] = self.get_included(objs)
+        return rtn
+
+
+class ResourceApiMixin:
+    """
+    View mixin for a JSON:API collection endpoint that supports the
+    fields[type]= and include= query parameters.
+    """
+
+    http_method_names = [
+        "get"
+    ]
+    serializer_class: Type[ResourceSerializer] = None
+    # Set to e.g. main.api_pagination.CursorPaginator to paginate the collection
+    paginator_class = None
+    # Set to a main.api_filters.ApiFilterSet subclass to support filter[...] and sort=
+    filterset_class = None
+
+    def get_queryset(self) -> QuerySet:
+        raise NotImplementedError
+
+    def get_serializer_class(self) -> Type[ResourceSerializer]:
+        return self.serializer_class
+
+    def get_paginator(self, ordering=None):
+        if self.paginator_class is None:
+            return None
+        return self.paginator_class(ordering=ordering)
+
+    def filter_queryset(self, queryset: QuerySet):
+        """
+        Returns the filtered queryset and the requested ordering (or None).
+        Raises ApiParameterError for filters that aren't allowed.
+        """
+        if self.filterset_class is None:
+            return queryset, None
+
+        filterset = self.filterset_class(self.request.GET)
+        return filterset.filter_queryset(queryset), filterset.get_ordering()
+
+    def get(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        fieldsets = parse_fieldsets(request.GET)
+        include = parse_include(request.GET)
+        try:
+            serializer_class.validate(fieldsets, include)
+            queryset, ordering = self.filter_queryset(self.get_queryset())
+        except ApiParameterError as e:
+            return e.response()
+
+        queryset = serializer_class.optimise_queryset(queryset, fieldsets, include)
+        serializer = serializer_class(fieldsets, include)
+
+        paginator = self.get_paginator(ordering)
+        if paginator is None:
+            if ordering:
+                queryset = queryset.order_by(*ordering)
+            return ApiResponse(**serializer.build_document(queryset))
+
+        try:
+            page = paginator.paginate(queryset, request)
+        except ApiParameterError as e:
+            return e.response()
+
+        return ApiResponse(
+            links=page.links,
+            meta=page.meta,
+            **serializer.build_document(page.object_list)
+        )
+
+
+def _get_relation_field(model, name):
+    try:
+        return model._meta.get_field(name)
+    except FieldDoesNotExist:
+        raise RuntimeError(f"{model.__name__} has no relation called {name}")
+
+
+def _get_relation_attr(field) -> str:
+    """
+    The attribute on the model instance for this relation
+    """
+    if field.concrete:
+        return field.name
+    return field.get_accessor_name()
+
+
+def _is_forward_to_one(field) -> bool:
+    return field.many_to_one or (field.one_to_one and field.concrete)
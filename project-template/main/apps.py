@@ -6,5 +6,6 @@ class AuthConfig(AppConfig):
 
     def ready(self):
         import main.auth.checks  # noqa: F401
+        import main.api_filters  # noqa: F401
         # Ensure the signals are hooked up
         import main.signals  # noqa: E262, F401, E402
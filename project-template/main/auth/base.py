@@ -7,7 +7,8 @@ also be using the built in perms sytem in templates: https://docs.djangoproject.
 
 During setup, for each type of authorization principal (i.e. user,
 API token) in your system create an instance of AuthenticationPrincipal and
-put it in instances.py along with the permission checks it needs. If
+put it in instances.py along with the permission checks it needs (see
+AuthenticationPrincipal.check_perm). If
 you're using API token principals you will also need to edit
 auth/middleware.py to create an instance.
 
@@ -24,10 +25,12 @@ admin straightforwardly.
 This module also includes a couple of extra helpers to make auth checks easier.
 """
 
-from typing import Iterable, List, Optional
+from typing import Dict, Iterable, List, Optional
 
 from django.db import models
 
+from main.threadlocals import current_request
+
 
 class AuthenticationPrincipal:
     """
@@ -52,7 +55,7 @@ class AuthenticationPrincipal:
 
         return True
 
-    def has_perm(self, perm: str, obj=Optional[models.Model]) -> bool:
+    def has_perm(self, perm: str, obj: Optional[models.Model]=None) -> bool:
         """
         Main permission check method. Usage:
 
@@ -65,20 +68,73 @@ class AuthenticationPrincipal:
 
         Note that the permission labels are app_label.permission. This is
         the Django way of doing it.
+
+        Decisions are remembered for the rest of the request, so put the
+        rules in check_perm rather than overriding this.
         """
 
-        return False
+        return self.perm_decisions([perm], obj)[perm]
 
-    def has_perms(self, perm_list: List[str], obj=Optional[models.Model]):
+    def has_perms(self, perm_list: List[str], obj: Optional[models.Model]=None) -> bool:
         """
         Return True if the user has each of the specified permissions. If
         object is passed, check if the user has all required perms for it.
+        """
+        return all(self.perm_decisions(perm_list, obj).values())
 
-        Potentially allows for optimisations for bulk checking.
+    def perm_decisions(self, perm_list: List[str], obj: Optional[models.Model]=None) -> Dict[str, bool]:
+        """
+        Whether the principal has each of the permissions. The ones not
+        already decided during this request are passed to check_perms
+        together.
         """
         if not isinstance(perm_list, Iterable) or isinstance(perm_list, str):
             raise ValueError("perm_list must be an iterable of permissions.")
-        return all(self.has_perm(perm, obj) for perm in perm_list)
+
+        cache = _get_decision_cache()
+        if cache is None:
+            return self.check_perms(list(perm_list), obj)
+
+        rtn = {}
+        missing = []
+        for perm in perm_list:
+            cached = cache.get((id(self), perm, id(obj)))
+            if cached is None:
+                missing.append(perm)
+            else:
+                rtn[perm] = cached[-1]
+
+        if missing:
+            for perm, decision in self.check_perms(missing, obj).items():
+                # Keep the principal and object alive so their ids aren't
+                # reused by something else during the request
+                cache[(id(self), perm, id(obj))] = (self, obj, decision)
+                rtn[perm] = decision
+        return rtn
+
+    def check_perm(self, perm: str, obj: Optional[models.Model]=None) -> bool:
+        """
+        The permission rules for this kind of principal. Override this, or
+        check_perms if several permissions can be decided more cheaply
+        together (e.g. in one query).
+        """
+
+        return False
+
+    def check_perms(self, perm_list: List[str], obj: Optional[models.Model]=None) -> Dict[str, bool]:
+        """
+        Decide a batch of permissions for the same object
+        """
+        return {perm: self.check_perm(perm, obj) for perm in perm_list}
+
+    def filter_queryset(self, perm: str, queryset: models.QuerySet) -> models.QuerySet:
+        """
+        Narrow queryset down to the objects the principal has perm on. This
+        is check_perm for a whole table at once, so list views can filter,
+        count and paginate in the database. The two should agree.
+        """
+
+        return queryset.none()
 
     def has_module_perms(self, app_label: str):
         """
@@ -97,3 +153,17 @@ class AuthenticationPrincipal:
         """
 
         raise NotImplementedError
+
+
+def _get_decision_cache() -> Optional[dict]:
+    """
+    (principal id, perm, obj id) -> (principal, obj, decision) for the
+    current request, or None outside a request
+    """
+    request = current_request()
+    if request is None:
+        return None
+    cache = getattr(request, "_perm_decisions", None)
+    if cache is None:
+        cache = request._perm_decisions = {}
+    return cache
@@ -0,0 +1,57 @@
+"""
+Small in-process caches for authentication lookups.
+
+Each worker process has its own, so invalidating an entry only affects the
+current process. Other workers see a change once their entry's TTL runs
+out, so keep TTLs short.
+"""
+import collections
+import threading
+import time
+from typing import Any, Callable, Hashable, Tuple
+
+
+class TTLCache:
+    """
+    A least recently used cache where entries also expire after a time.
+    None can be cached (e.g. for "no such token"), so get() says whether
+    there was a hit separately from the value.
+    """
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float]=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        (True, value) on a hit, otherwise (False, None)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            value, expires = entry
+            if expires <= self.clock():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key: Hashable, value: Any, ttl: float=None):
+        expires = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
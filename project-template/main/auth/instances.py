@@ -6,9 +6,19 @@ class UserPrincipal(AuthenticationPrincipal):
     Authorization logic for a user from the database.
     """
 
-    def has_perm(self, perm, obj):
+    # Only users with is_superuser get these
+    superuser_perms = frozenset({
+        "main.view_js_performance",
+    })
+
+    def check_perm(self, perm, obj=None):
+        if perm in self.superuser_perms:
+            return self.is_superuser
         return True
 
+    def filter_queryset(self, perm, queryset):
+        return queryset
+
     def principal_logging_identifier(self):
         return f"user:{self.pk}"
 
@@ -1,30 +1,38 @@
+import secrets
 from functools import partial
 
-from django.core.exceptions import BadRequest
+from django.conf import settings
 from django.contrib.auth.middleware import AuthenticationMiddleware as DjangoAuthenticationMiddleware
 from django.utils.functional import SimpleLazyObject
 
-from main.auth.instances import AnonymousPrincipal
-
-
-def get_token_principal(token_value):
-    return AnonymousPrincipal()
-
-
-async def aget_token_principal(token_value):
-    return get_token_principal(token_value)
+from main.auth.tokens import aget_token_principal, get_token_principal
+from main.auth.users import aget_user, get_user
 
 
 class AuthenticationMiddleware(DjangoAuthenticationMiddleware):
-    def process_request(self, request):
-        auth_header_prefix = "Bearer "
-        auth_header = request.META.get("Authorization")
-        if auth_header is not None:
-            if not auth_header.startswith(auth_header_prefix):
-                raise BadRequest("Need 'Bearer ' prefix on Authorization header")
+    auth_header_prefix = "Bearer "
 
-            token_value = auth_header[len(auth_header_prefix):]
-            request.user = SimpleLazyObject(lambda: get_user(token_value))
+    def process_request(self, request):
+        token_value = self._get_token_value(request)
+        if token_value is not None:
+            request.user = SimpleLazyObject(lambda: get_token_principal(token_value))
             request.auser = partial(aget_token_principal, token_value)
         else:
             super().process_request(request)
+            # Swap in the cached loaders from main/auth/users.py
+            request.user = SimpleLazyObject(lambda: get_user(request))
+            request.auser = partial(aget_user, request)
+
+    def _get_token_value(self, request):
+        """
+        The API token in the Authorization header, if there is one
+        """
+        auth_header = request.META.get("HTTP_AUTHORIZATION", "")
+        # Other schemes, like Basic from an nginx auth_basic in front of the
+        # site, aren't for us. Those requests use the session as usual.
+        if not auth_header.startswith(self.auth_header_prefix):
+            return None
+        # MetricsView checks its own token, it isn't an API token
+        if settings.METRICS_TOKEN and secrets.compare_digest(auth_header, f"Bearer {settings.METRICS_TOKEN}"):
+            return None
+        return auth_header[len(self.auth_header_prefix):]
@@ -17,8 +17,15 @@ class PermissionRequiredMixin(AccessMixin):
 
     Does a bit more logging around permission failures since OWASP
     recommends that. See OWASP ASVS v4.0.3 items 7.1.3 and 7.2.2 .
+
+    For views with a get_queryset() (list views, django-filter and tables2
+    views, detail views) the queryset is also narrowed down with the
+    principal's filter_queryset before anything else uses it.
     """
 
+    # Permissions to filter querysets by, see get_queryset_permissions
+    queryset_permissions = None
+
     def get_required_permissions(self, request=None):
         """
         Returns list of permissions in format *<app_label>.<codename>* that
@@ -38,6 +45,27 @@ class PermissionRequiredMixin(AccessMixin):
                                        % self.permission_required)
         return perms
 
+    def get_queryset_permissions(self):
+        """
+        Permissions get_queryset() is filtered by, so that list views only
+        show the objects the principal can see. Defaults to the required
+        permissions.
+        """
+        if self.queryset_permissions is not None:
+            return self.queryset_permissions
+        return self.get_required_permissions(self.request)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        for perm in self.get_queryset_permissions():
+            if hasattr(user, "filter_queryset"):
+                queryset = user.filter_queryset(perm, queryset)
+            else:
+                # Django's AnonymousUser when nobody's logged in
+                queryset = queryset.none()
+        return queryset
+
     def get_permission_object(self):
         if hasattr(self, 'permission_object'):
             return self.permission_object
@@ -54,30 +82,49 @@ class PermissionRequiredMixin(AccessMixin):
         perms = self.get_required_permissions(request)
         obj = self.get_permission_object()
 
-        result = request.user.has_perms(perms, obj)
-        if not result:
-            for perm in perms:
-                if not request.user.has_perm(perm, obj):
-                    # Just log the first one
-                    security_logger.warning(
-                        "Permission denied: perm=%s, obj=%s, viewclass=%s",
-                        perm,
-                        obj,
-                        self
-                    )
-                    break
+        user = request.user
+        if hasattr(user, "perm_decisions"):
+            decisions = user.perm_decisions(perms, obj)
+        else:
+            # Django's AnonymousUser when nobody's logged in
+            decisions = {perm: user.has_perm(perm, obj) for perm in perms}
+        denied = [perm for perm in perms if not decisions[perm]]
+        if denied:
+            # Just log the first one
+            security_logger.warning(
+                "Permission denied: perm=%s, obj=%s, viewclass=%s",
+                denied[0],
+                obj,
+                self
+            )
             return self.handle_no_permission()
         else:
             security_logger.debug("Permission granted: viewclass=%s", self)
             return None
 
     def dispatch(self, request, *args, **kwargs):
+        if getattr(self, "view_is_async", False):
+            return self._adispatch(request, *args, **kwargs)
+
         self.request = request
         response = self.check_permissions(request, *args, **kwargs)
         if response:
             return response
         return super().dispatch(request, *args, **kwargs)
 
+    async def _adispatch(self, request, *args, **kwargs):
+        """
+        Async views run dispatch on the event loop, so load the principal
+        without blocking before doing the (synchronous) permission checks.
+        """
+        self.request = request
+        if hasattr(request, "auser"):
+            request.user = await request.auser()
+        response = self.check_permissions(request, *args, **kwargs)
+        if response:
+            return response
+        return await super().dispatch(request, *args, **kwargs)
+
 
 class LoginNotRequiredMixin:
     """
@@ -0,0 +1,199 @@
+"""
+Login throttling.
+
+Failed logins are counted per client IP and per account. After a number
+of free attempts, each further failure doubles how long the IP or account
+has to wait before it can try again, up to a maximum. Counts are dropped
+once there have been no failures for a while, and a successful login
+clears the account's count.
+
+LoginThrottleBackend comes first in AUTHENTICATION_BACKENDS, so throttled
+attempts are turned away before ModelBackend hashes the password, which is
+what makes credential stuffing expensive for us.
+
+Like main/ratelimit.py the counts are per worker process, so each worker
+allows its own free attempts. The backoff grows quickly enough that this
+only buys an attacker a few more attempts.
+"""
+import collections
+import logging
+import threading
+import time
+from typing import Callable, Hashable, Optional
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import BaseBackend, ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.utils.crypto import salted_hmac
+
+from main.logging import get_request_ip
+
+
+security_logger = logging.getLogger("security")
+
+
+class FailureBackoff:
+    """
+    Failure counts per key with exponential backoff. Only the most recently
+    failed max_keys keys are kept.
+    """
+
+    def __init__(
+            self,
+            free_attempts: int,
+            base_delay: float,
+            max_delay: float,
+            reset_after: float,
+            max_keys: int=10000,
+            clock: Callable[[], float]=time.monotonic):
+        self.free_attempts = free_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.reset_after = reset_after
+        self.max_keys = max_keys
+        self.clock = clock
+        # Key -> (failures, time of the last one)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key: Hashable, now: float):
+        entry = self._entries.get(key)
+        if entry is not None and now - entry[1] >= self.reset_after:
+            del self._entries[key]
+            entry = None
+        return entry
+
+    def _delay(self, failures: int) -> float:
+        over = failures - self.free_attempts
+        if over < 0:
+            return 0.0
+        return min(self.base_delay * 2 ** over, self.max_delay)
+
+    def failures(self, key: Hashable) -> int:
+        with self._lock:
+            entry = self._get(key, self.clock())
+        return 0 if entry is None else entry[0]
+
+    def retry_after(self, key: Hashable) -> float:
+        """
+        Seconds until the key can try again, 0 if it can now
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._get(key, now)
+        if entry is None:
+            return 0.0
+        failures, last_failure = entry
+        return max(0.0, last_failure + self._delay(failures) - now)
+
+    def record_failure(self, key: Hashable) -> int:
+        """
+        Count a failure, returning the key's total
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._get(key, now)
+            failures = 1 if entry is None else entry[0] + 1
+            self._entries[key] = (failures, now)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_keys:
+                self._entries.popitem(last=False)
+        return failures
+
+    def reset(self, key: Hashable):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+IP_BACKOFF = FailureBackoff(
+    free_attempts=settings.LOGIN_THROTTLE_IP_FREE_ATTEMPTS,
+    base_delay=settings.LOGIN_THROTTLE_BASE_DELAY,
+    max_delay=settings.LOGIN_THROTTLE_MAX_DELAY,
+    reset_after=settings.LOGIN_THROTTLE_RESET_SECONDS,
+)
+ACCOUNT_BACKOFF = FailureBackoff(
+    free_attempts=settings.LOGIN_THROTTLE_ACCOUNT_FREE_ATTEMPTS,
+    base_delay=settings.LOGIN_THROTTLE_BASE_DELAY,
+    max_delay=settings.LOGIN_THROTTLE_MAX_DELAY,
+    reset_after=settings.LOGIN_THROTTLE_RESET_SECONDS,
+)
+
+
+def get_account_key(username: Optional[str]) -> Optional[str]:
+    """
+    Identifies the account being logged in to, whether or not it exists.
+    Keyed, so it can go in the logs without giving away the email address.
+    """
+    if not username:
+        return None
+    return salted_hmac("main.auth.throttle", username.strip().lower()).hexdigest()[:16]
+
+
+def get_credentials_username(credentials: dict) -> Optional[str]:
+    return credentials.get("username", credentials.get(get_user_model().USERNAME_FIELD))
+
+
+def get_retry_after(request, username: Optional[str]) -> float:
+    ip_address = get_request_ip(request)
+    account_key = get_account_key(username)
+    return max(
+        IP_BACKOFF.retry_after(ip_address) if ip_address else 0.0,
+        ACCOUNT_BACKOFF.retry_after(account_key) if account_key else 0.0,
+    )
+
+
+def record_login_failure(request, username: Optional[str]) -> dict:
+    """
+    Count a failed login, returning the throttle state for logging
+    """
+    ip_address = get_request_ip(request) if request is not None else None
+    account_key = get_account_key(username)
+    return {
+        "account": account_key,
+        "account_failures": ACCOUNT_BACKOFF.record_failure(account_key) if account_key else None,
+        "ip_failures": IP_BACKOFF.record_failure(ip_address) if ip_address else None,
+    }
+
+
+def record_login_success(username: Optional[str]):
+    account_key = get_account_key(username)
+    if account_key:
+        ACCOUNT_BACKOFF.reset(account_key)
+
+
+class LoginThrottleBackend(BaseBackend):
+    """
+    Stops authenticate() before the password is checked if the IP or
+    account is waiting out a backoff. Never authenticates anyone itself.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if request is None:
+            return None
+
+        if username is None:
+            username = kwargs.get(get_user_model().USERNAME_FIELD)
+        retry_after = get_retry_after(request, username)
+        if retry_after > 0:
+            # For LoginForm's error message, and so the failed login signal
+            # doesn't count this attempt
+            request._login_retry_after = retry_after
+            security_logger.info(
+                "Login throttled account=%s retry_after=%s",
+                get_account_key(username),
+                round(retry_after, 1),
+            )
+            # Makes authenticate() give up without trying the other backends
+            raise PermissionDenied()
+
+        return None
+
+    def get_user(self, user_id):
+        # Being first, this is the backend Client.force_login() and the like
+        # pick by default
+        return ModelBackend().get_user(user_id)
@@ -0,0 +1,88 @@
+"""
+API token authentication.
+
+Tokens are random, so a fast hash is enough to make a leaked database
+useless to an attacker while letting tokens be looked up by their hash. The
+token itself is only ever shown once, when it's created (see the
+create_api_token management command).
+
+Resolved tokens, including ones that don't exist, are kept in a per-worker
+cache so a client making lots of requests doesn't cost a query each time.
+Revoking a token, or saving its user (e.g. to deactivate them), removes it
+from this worker's cache straight away. Other workers notice within
+settings.API_TOKEN_CACHE_TTL seconds.
+"""
+import copy
+import hashlib
+import secrets
+
+from django.conf import settings
+
+from main.auth.cache import TTLCache
+from main.auth.instances import AnonymousPrincipal
+
+
+TOKEN_PREFIX = "bdk_"
+
+# Token hash -> APIToken, or None if there isn't a usable one
+TOKEN_CACHE = TTLCache(
+    max_size=settings.API_TOKEN_CACHE_SIZE,
+    ttl=settings.API_TOKEN_CACHE_TTL,
+)
+
+
+def generate_token_value() -> str:
+    return TOKEN_PREFIX + secrets.token_urlsafe(32)
+
+
+def hash_token(token_value: str) -> str:
+    return hashlib.sha256(token_value.encode("utf8")).hexdigest()
+
+
+def _token_queryset(token_hash):
+    from main.models import APIToken
+
+    return APIToken.objects.active().filter(token_hash=token_hash).select_related("user")
+
+
+def _to_principal(token):
+    if token is None or token.is_expired():
+        return AnonymousPrincipal()
+    # Requests can change the token and user they're given, so each gets
+    # its own
+    principal = copy.copy(token)
+    principal.user = copy.copy(token.user)
+    return principal
+
+
+def get_token_principal(token_value: str):
+    token_hash = hash_token(token_value)
+    hit, token = TOKEN_CACHE.get(token_hash)
+    if not hit:
+        token = _token_queryset(token_hash).first()
+        TOKEN_CACHE.set(token_hash, token)
+    return _to_principal(token)
+
+
+async def aget_token_principal(token_value: str):
+    token_hash = hash_token(token_value)
+    hit, token = TOKEN_CACHE.get(token_hash)
+    if not hit:
+        token = await _token_queryset(token_hash).afirst()
+        TOKEN_CACHE.set(token_hash, token)
+    return _to_principal(token)
+
+
+def invalidate_token(token_hash: str):
+    TOKEN_CACHE.delete(token_hash)
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Drop a user's tokens from this worker's cache, so e.g. deactivating them
+    takes effect straight away
+    """
+    from main.models import APIToken
+
+    for token_hash in APIToken.objects.filter(user_id=user_id).values_list("token_hash", flat=True):
+        invalidate_token(token_hash)
@@ -0,0 +1,108 @@
+"""
+Loading the logged in user for session authenticated requests.
+
+Django's get_user loads the user's row on every request. With
+settings.USER_CACHE_TTL set, each worker keeps the users it has loaded for
+that many seconds instead, keyed by user id and checked against the
+session's auth hash (which changes with the password) on every hit.
+
+Saving or deleting a user removes it from this worker's cache straight
+away (see main/signals.py), so a password change or deactivation takes
+effect immediately there. Other workers notice within USER_CACHE_TTL
+seconds. Changes that skip the model signals, like QuerySet.update(), are
+only seen once entries expire.
+"""
+import copy
+
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+
+from main.auth.cache import TTLCache
+
+
+# User id -> (session auth hash, backend path, user)
+USER_CACHE = TTLCache(
+    max_size=settings.USER_CACHE_SIZE,
+    ttl=settings.USER_CACHE_TTL,
+)
+
+
+def _session_key(session):
+    """
+    The (user id, session auth hash, backend) a session is logged in with,
+    or None if it isn't
+    """
+    user_id = session.get(SESSION_KEY)
+    session_hash = session.get(HASH_SESSION_KEY)
+    backend_path = session.get(BACKEND_SESSION_KEY)
+    if user_id is None or not session_hash or backend_path is None:
+        return None
+    return str(user_id), session_hash, backend_path
+
+
+def _get_cached(key):
+    if key is None:
+        return None
+    user_id, session_hash, backend_path = key
+    hit, entry = USER_CACHE.get(user_id)
+    if not hit:
+        return None
+    cached_hash, cached_backend, user = entry
+    if cached_backend != backend_path or not constant_time_compare(cached_hash, session_hash):
+        return None
+    # Requests can change the user they're given, so each gets its own
+    return copy.copy(user)
+
+
+def _set_cached(key, user):
+    # Only users whose session hash matched exactly, not the ones Django let
+    # in through a fallback secret (the session has been updated for those)
+    if key is None or not user.is_authenticated:
+        return
+    user_id, session_hash, backend_path = key
+    if str(user.pk) == user_id and constant_time_compare(session_hash, user.get_session_auth_hash()):
+        USER_CACHE.set(
+            user_id,
+            (session_hash, backend_path, copy.copy(user)),
+            ttl=settings.USER_CACHE_TTL,
+        )
+
+
+def get_user(request):
+    """
+    Cached version of django.contrib.auth.get_user
+    """
+    if settings.USER_CACHE_TTL <= 0:
+        return auth.get_user(request)
+
+    key = _session_key(request.session)
+    user = _get_cached(key)
+    if user is None:
+        user = auth.get_user(request)
+        _set_cached(key, user)
+    return user
+
+
+async def aget_user(request):
+    """
+    Cached version of django.contrib.auth.aget_user
+    """
+    if settings.USER_CACHE_TTL <= 0:
+        return await auth.aget_user(request)
+
+    # Loading the session is the only query here on a hit
+    key = _session_key({
+        name: await request.session.aget(name)
+        for name in (SESSION_KEY, HASH_SESSION_KEY, BACKEND_SESSION_KEY)
+    })
+    user = _get_cached(key)
+    if user is None:
+        user = await auth.aget_user(request)
+        _set_cached(key, user)
+    return user
+
+
+def invalidate_user(user_id):
+    USER_CACHE.delete(str(user_id))
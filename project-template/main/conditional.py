@@ -0,0 +1,121 @@
+"""
+Opt-in conditional GET support (ETag / Last-Modified) for class based views.
+
+Views declare a cheap version key for their content and we answer
+If-None-Match / If-Modified-Since with a 304 before doing any rendering or
+serialisation. See https://developer.mozilla.org/en-US/docs/Web/HTTP/Conditional_requests
+
+    class MyListApi(PermissionRequiredMixin, ConditionalGetMixin, ResourceApiMixin, View):
+        def get_version_key(self):
+            return queryset_version(self.get_queryset())
+
+Put this after PermissionRequiredMixin in the class hierarchy so a 304
+can't be used to probe for content without permission.
+
+Meant for API/JSON views. Each HTML response has its own CSP nonce (see
+main/middleware.py), so a cached page's inline scripts would be blocked
+after a 304. Responses that used {% content_security_policy_nonce %} are
+sent without validators so clients never revalidate them.
+"""
+import datetime
+import hashlib
+from typing import Optional
+
+from django.db.models import Count, Max, QuerySet
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag and Last-Modified headers to GET/HEAD responses and returns
+    304 Not Modified if the client already has the current version.
+
+    Only supports synchronous views.
+    """
+
+    def get_version_key(self) -> Optional[str]:
+        """
+        A cheap to calculate string that changes whenever the content does,
+        e.g. from queryset_version(). Return None to skip the ETag.
+        """
+        return None
+
+    def get_last_modified(self) -> Optional[datetime.datetime]:
+        """
+        When the content last changed, e.g. the max of an updated timestamp.
+        Return None to skip the Last-Modified header.
+        """
+        return None
+
+    def get_etag(self) -> Optional[str]:
+        version_key = self.get_version_key()
+        if version_key is None:
+            return None
+
+        # The same version of the data can be presented differently depending
+        # on the query string (e.g. sparse fieldsets, pagination), and
+        # querysets are filtered for each principal
+        digest = hashlib.sha256(
+            f"{version_key}\n{self.request.get_full_path()}\n{self._get_principal_key()}".encode()
+        ).hexdigest()[:32]
+        # Weak since nginx may compress the response
+        return "W/" + quote_etag(digest)
+
+    def _get_principal_key(self) -> str:
+        user = getattr(self.request, "user", None)
+        if user is None or not user.is_authenticated:
+            return "anonymous"
+        return user.principal_logging_identifier()
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ("GET", "HEAD"):
+            return super().dispatch(request, *args, **kwargs)
+
+        etag = self.get_etag()
+        last_modified = self.get_last_modified()
+        last_modified_timestamp = int(last_modified.timestamp()) if last_modified else None
+
+        response = get_conditional_response(
+            request,
+            etag=etag,
+            last_modified=last_modified_timestamp,
+        )
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+
+        def add_validators(response):
+            if getattr(request, "_csp_nonce_used", False):
+                return
+            if etag or last_modified_timestamp:
+                # Another user of the same browser has different content
+                patch_vary_headers(response, ("Cookie", "Authorization"))
+            if etag and not response.has_header("ETag"):
+                response.headers["ETag"] = etag
+            if last_modified_timestamp and not response.has_header("Last-Modified"):
+                response.headers["Last-Modified"] = http_date(last_modified_timestamp)
+
+        # Template responses are rendered later, so we only know whether
+        # they use the nonce then
+        if getattr(response, "is_rendered", True):
+            add_validators(response)
+        else:
+            response.add_post_render_callback(add_validators)
+
+        return response
+
+
+def queryset_version(queryset: QuerySet, field: str="pk") -> str:
+    """
+    Version key for a queryset from one aggregate query. The max of field
+    changes when rows are added (UUID7 primary keys increase over time) or
+    updated (with an updated timestamp field), and the count changes when
+    rows are deleted.
+    """
+    result = queryset.order_by().aggregate(
+        version_max=Max(field),
+        version_count=Count("pk"),
+    )
+    return f"{result['version_max']}:{result['version_count']}"
@@ -1,4 +1,7 @@
+import math
+
 from django import forms
+from django.contrib.auth.forms import AuthenticationForm
 
 
 class DemoForm(forms.Form):
@@ -6,3 +9,23 @@ class DemoForm(forms.Form):
     default_field = forms.DateTimeField(required=False)
     path_field = forms.CharField()
     header_field = forms.CharField(required=False)
+
+
+class LoginForm(AuthenticationForm):
+    """
+    Says when a login was turned away by main/auth/throttle.py rather than
+    reporting a wrong password
+    """
+
+    def clean(self):
+        try:
+            return super().clean()
+        except forms.ValidationError:
+            retry_after = getattr(self.request, "_login_retry_after", None)
+            if retry_after is None:
+                raise
+            raise forms.ValidationError(
+                "Too many failed login attempts, try again in %(seconds)s seconds.",
+                code="throttled",
+                params={"seconds": math.ceil(retry_after)},
+            )
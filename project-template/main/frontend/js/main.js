@@ -48,6 +48,7 @@ if (window.logRequestLatch) {
                     },
                     body: JSON.stringify({
                         "requestId": window.logConfig.requestId,
+                        "path": window.location.pathname,
                         "domainLookupStart": perf.domainLookupStart,
                         "requestStart": perf.requestStart,
                         "responseStart": perf.responseStart,
@@ -1,42 +1,112 @@
-import collections
-import datetime
 import json
 import os
-import traceback
+import resource
+import time
+
+from main.json_logging import JsonFormatter as BaseJsonFormatter
+from main import metrics, page_timings
 
 
 # Log to stdout.
 accesslog = "-"
 errorlog = "-"
 
+# Workers using more resident memory than this after a request are replaced
+# once it's finished. 0 turns this off.
+MAX_WORKER_RSS_MB = int(os.environ.get("GUNICORN_MAX_WORKER_RSS_MB", "512"))
+
+# Per worker process state for the request hooks
+_worker_state = {
+    "started": None,
+    "requests": 0,
+    "request_started": None,
+}
+
+
+def on_starting(server):
+    """
+    Clear out metrics left by the last run of the server
+    """
+    from main.metrics import REGISTRY
+
+    if not os.environ.get("METRICS_DIR"):
+        # The workers inherit this, so they all write to the arbiter's
+        # directory rather than their own
+        os.environ["METRICS_DIR"] = metrics.get_metrics_dir()
+    REGISTRY.clear()
+    page_timings.REGISTRY.clear()
+
+
+def child_exit(server, worker):
+    """
+    Keep the exited worker's request totals, see main/metrics.py
+    """
+    from main.metrics import REGISTRY
+
+    REGISTRY.mark_process_dead(worker.pid)
+    page_timings.REGISTRY.mark_process_dead(worker.pid)
+
+
+def post_fork(server, worker):
+    _worker_state["started"] = time.monotonic()
+    _worker_state["requests"] = 0
+
+
+def pre_request(worker, req):
+    _worker_state["request_started"] = time.monotonic()
+
+
+def post_request(worker, req, environ, resp):
+    """
+    Record the request and recycle the worker if it's using too much memory
+    """
+    duration = time.monotonic() - (_worker_state["request_started"] or time.monotonic())
+    _worker_state["requests"] += 1
+    rss = get_rss_bytes()
+
+    pid = worker.pid
+    metrics.WORKER_REQUEST_LATENCY.observe(duration, pid=pid)
+    metrics.WORKER_REQUESTS.set(_worker_state["requests"], pid=pid)
+    metrics.WORKER_RSS.set(rss, pid=pid)
+
+    if MAX_WORKER_RSS_MB and rss > MAX_WORKER_RSS_MB * 1024 * 1024 and worker.alive:
+        metrics.WORKER_RECYCLES.inc()
+        worker.log.info("Recycling worker: %s", json.dumps({
+            "event": "worker_recycle",
+            "reason": "rss_ceiling",
+            "pid": pid,
+            "rss_mb": round(rss / 1024 / 1024, 1),
+            "max_rss_mb": MAX_WORKER_RSS_MB,
+            "requests_served": _worker_state["requests"],
+            "uptime_s": round(time.monotonic() - (_worker_state["started"] or time.monotonic())),
+        }))
+        # Stops the worker taking more requests. It exits once this one is
+        # done and the arbiter starts a replacement.
+        worker.alive = False
+
+
+def get_rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # Not Linux, fall back to the peak rather than current size. In KiB
+        # on Linux but bytes on macOS, where this is used.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def worker_exit(server, worker):
+    """
+    Write out any log records still queued by main.logging.QueuedStreamHandler
+    """
+    from main.logging import flush_queued_logging
+
+    flush_queued_logging()
+
 
-class JsonFormatter:
-    def __init__(self, fields, *args, **kwargs):
-        self.fields = [
-            (key, val)
-            for piece in fields.split(" ")
-            for (key, val) in (piece.split(":"),)
-        ]
-
-    def format(self, record):
-        rtn = collections.OrderedDict()
-        for key, field in self.fields:
-            if field == "time":
-                val = datetime.datetime.utcnow().isoformat()
-            elif field == "app":
-                val = "gunicorn"
-            elif field == "project":
-                val = os.environ.get("PROJECT_NAME", "bedrock")
-            elif field == "message":
-                val = record.getMessage()
-            elif field == "exc_info":
-                val = getattr(record, field, None)
-                if val is not None:
-                    val = "".join(traceback.format_exception(val[0], value=val[1], tb=val[2]))
-            else:
-                val = getattr(record, field, None)
-            rtn[key] = val
-        return json.dumps(rtn)
+class JsonFormatter(BaseJsonFormatter):
+    app = "gunicorn"
+    aware_timestamps = False
 
 
 # Ensure the two named loggers that Gunicorn uses are configured to use the custom
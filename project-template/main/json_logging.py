@@ -0,0 +1,95 @@
+"""
+JSON log formatter shared by the Django (main/logging.py) and Gunicorn
+(main/gunicorn_logging.py) logging config.
+
+Doesn't import Django since Gunicorn loads it before Django is set up.
+"""
+import datetime
+import json
+import os
+import traceback
+
+
+class JsonFormatter:
+    """
+    Formats log records as a line of JSON. The fields and their order are
+    given by coopting the format string in the logging config:
+
+        "format": "level:levelname time:time message:message",
+
+    gives {"level": record.levelname, "time": ..., "message": ...}.
+
+    The spec is compiled once when the formatter is configured, and values
+    that can't change (app, project) are looked up then too. Times come from
+    when the record was created rather than when it's formatted.
+    """
+
+    # Value of the app field
+    app = None
+    # Whether the time field includes the +00:00 UTC offset
+    aware_timestamps = True
+
+    def __init__(self, fields, *args, **kwargs):
+        self.fields = [
+            (key, val)
+            for piece in fields.split(" ")
+            for (key, val) in (piece.split(":"),)
+        ]
+
+        # Copied for each record. Has every key so the output keeps the
+        # configured order, with constant values already filled in.
+        self._template = {}
+        # (key, record attribute) pairs copied straight off the record
+        self._attribute_fields = []
+        # (key, getter) pairs for values that need work
+        self._computed_fields = []
+        for key, field in self.fields:
+            self._template[key] = None
+            if field == "time":
+                self._computed_fields.append((key, self._get_time))
+            elif field == "app":
+                self._template[key] = self.app
+            elif field == "project":
+                self._template[key] = os.environ.get("PROJECT_NAME", "bedrock")
+            elif field == "message":
+                self._computed_fields.append((key, self._get_message))
+            elif field == "exc_info":
+                self._computed_fields.append((key, self._get_exc_info))
+            else:
+                self._attribute_fields.append((key, field))
+
+        self._encode = json.JSONEncoder().encode
+        self._time_cache = (None, None)
+
+    def _get_time(self, record):
+        # Formatting the date and time is the slow part, and consecutive
+        # records are usually in the same second
+        created = record.created
+        seconds = int(created)
+        cached_seconds, prefix = self._time_cache
+        if cached_seconds != seconds:
+            prefix = datetime.datetime.fromtimestamp(seconds, tz=datetime.timezone.utc).replace(tzinfo=None).isoformat()
+            self._time_cache = (seconds, prefix)
+
+        suffix = "+00:00" if self.aware_timestamps else ""
+        return f"{prefix}.{int((created - seconds) * 1000000):06d}{suffix}"
+
+    @staticmethod
+    def _get_message(record):
+        return record.getMessage()
+
+    @staticmethod
+    def _get_exc_info(record):
+        val = record.exc_info
+        if val is None:
+            return None
+        return "".join(traceback.format_exception(val[0], value=val[1], tb=val[2]))
+
+    def format(self, record):
+        rtn = self._template.copy()
+        values = record.__dict__
+        for key, field in self._attribute_fields:
+            rtn[key] = values.get(field)
+        for key, getter in self._computed_fields:
+            rtn[key] = getter(record)
+        return self._encode(rtn)
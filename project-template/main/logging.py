@@ -1,15 +1,18 @@
 import collections
 import hashlib
-import json
 import logging
 import os
-import traceback
+import queue
+import sys
+import threading
+import weakref
 from typing import Optional
 
 from django.conf import settings
-from django.utils import timezone
+from django.utils.functional import LazyObject, empty
 
-from main.threadlocals import current_request
+from main.json_logging import JsonFormatter as BaseJsonFormatter
+from main.threadlocals import current_request, current_task_context
 
 
 def get_request_ip(request) -> Optional[str]:
@@ -29,6 +32,65 @@ def get_request_id(request):
     return request.META.get("HTTP_X_REQUEST_ID", "unk")
 
 
+class RequestLogContext:
+    """
+    The log fields for a request. Worked out the first time something is
+    logged during the request and reused for the rest of it, rather than
+    reparsing headers, rehashing the session key and looking up the
+    principal for every record.
+
+    The session hash and principal are recalculated if the session key or
+    request.user change, e.g. on login.
+    """
+
+    __slots__ = ("ip_address", "request_id", "_session_key", "_session_id_hash", "_user", "_request_principal")
+
+    def __init__(self, request):
+        self.ip_address = get_request_ip(request) or "0.0.0.0"
+        self.request_id = get_request_id(request)
+        self._session_key = None
+        self._session_id_hash = "." * 8
+        self._user = None
+        self._request_principal = None
+
+    def session_id_hash(self, request) -> str:
+        session_key = request.session.session_key
+        if session_key != self._session_key:
+            self._session_key = session_key
+            if session_key:
+                self._session_id_hash = hashlib.sha256(session_key.encode()).hexdigest()[:8]
+            else:
+                self._session_id_hash = "." * 8
+        return self._session_id_hash
+
+    def request_principal(self, request) -> str:
+        if not hasattr(request, "user"):
+            return "anon"
+
+        user = request.user
+        if isinstance(user, LazyObject) and user._wrapped is empty:
+            # Loading the user just to log it would cost a session lookup
+            # and a query on requests that never use it. Picked up by the
+            # first record after something else has loaded it.
+            return "unk"
+
+        if user is not self._user or self._request_principal is None:
+            if hasattr(user, "principal_logging_identifier"):
+                self._request_principal = user.principal_logging_identifier()
+            else:
+                self._request_principal = "unk"
+            self._user = user
+        return self._request_principal
+
+
+def get_log_context(request) -> RequestLogContext:
+    context = getattr(request, "_log_context", None)
+    if context is None:
+        context = RequestLogContext(request)
+        request._log_context = context
+    return context
+
+
 class RequestContextFilter(logging.Filter):
     """
     Inject HTTP request path and IP information into the LogRecord
@@ -37,61 +99,241 @@ class RequestContextFilter(logging.Filter):
     def filter(self, record):
         maybe_request = current_request()
         if not maybe_request:
+            # Background tasks carry on the context of the request that
+            # deferred them
+            task_context = current_task_context() or {}
             record.ip_token = "." * 8
             record.ip_address = "0.0.0.0"
             record.session_id_hash = "." * 8
-            record.request_principal = "unk"
-            record.request_id = "." * 8
+            record.request_principal = task_context.get("principal", "unk")
+            record.request_id = task_context.get("request_id", "." * 8)
+            record.query_count = None
+            record.query_time_ms = None
             return True
 
-        maybe_ip = get_request_ip(maybe_request)
-        if maybe_ip:
-            record.ip_address = maybe_ip
-        else:
-            record.ip_address = "0.0.0.0"
+        context = get_log_context(maybe_request)
+        record.ip_address = context.ip_address
+        record.session_id_hash = context.session_id_hash(maybe_request)
+        record.request_principal = context.request_principal(maybe_request)
+        record.request_id = context.request_id
 
-        if maybe_request.session.session_key:
-            record.session_id_hash = hashlib.sha256(maybe_request.session.session_key.encode()).hexdigest()[:8]
+        # Queries so far, see main/query_stats.py
+        query_stats = getattr(maybe_request, "_query_stats", None)
+        if query_stats is not None:
+            record.query_count = query_stats.count
+            record.query_time_ms = round(query_stats.duration * 1000, 1)
         else:
-            record.session_id_hash = "." * 8
+            record.query_count = None
+            record.query_time_ms = None
 
-        if hasattr(maybe_request, "user"):
-            if hasattr(maybe_request.user, "principal_logging_identifier"):
-                record.request_principal = maybe_request.user.principal_logging_identifier()
-            else:
-                record.request_principal = "unk"
+        return True
+
+
+class JsonFormatter(BaseJsonFormatter):
+    app = "django"
+
+
+# All the QueuedStreamHandlers in this process, so they can be flushed on exit
+_queued_handlers = weakref.WeakSet()
+
+
+class QueuedStreamHandler(logging.Handler):
+    """
+    Like logging.StreamHandler, but the calling thread only puts the record
+    on a bounded queue. A background thread per process formats the
+    records and writes them in batches, so request threads don't block when
+    the stream (e.g. a container log driver) is slow.
+
+    Filters still run on the calling thread, so RequestContextFilter sees
+    the current request.
+
+    If the queue is full DEBUG and INFO records are dropped and counted, and
+    the count is reported in a later log line. WARNING and above, and
+    anything on the security logger, wait for space instead.
+    """
+
+    sentinel = None
+
+    def __init__(self, stream=None, queue_size: int=10000, batch_size: int=100):
+        super().__init__()
+        self.stream = stream
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.dropped = collections.Counter()
+        self._dropped_lock = threading.Lock()
+        self._listener_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        _queued_handlers.add(self)
+
+    def handle(self, record):
+        """
+        Same as logging.Handler.handle, but without holding the handler lock
+        while emitting. Otherwise one thread waiting for queue space would
+        block every other thread's logging.
+        """
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        record_queue = self._queue
+        if self._pid != os.getpid():
+            record_queue = self._start()
+
+        # Interpolate the message now since the arguments might change (or
+        # not be safe to use) by the time the background thread gets to it
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.levelno < logging.WARNING and record.name != "security":
+            try:
+                record_queue.put_nowait(record)
+            except queue.Full:
+                with self._dropped_lock:
+                    self.dropped[record.levelname] += 1
         else:
-            record.request_principal = "anon"
+            record_queue.put(record)
 
-        record.request_id = get_request_id(maybe_request)
+    def _start(self):
+        """
+        Start the listener thread. Called lazily, and again after a fork
+        since threads don't survive into the child process.
+        """
+        with self._listener_lock:
+            if self._pid == os.getpid():
+                return self._queue
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._thread = threading.Thread(
+                target=self._listen,
+                args=(self._queue,),
+                name="QueuedStreamHandler",
+                daemon=True,
+            )
+            self._thread.start()
+            self._pid = os.getpid()
+            return self._queue
 
-        return True
+    def _listen(self, record_queue):
+        while True:
+            batch = [record_queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(record_queue.get_nowait())
+                except queue.Empty:
+                    break
 
+            stopping = self.sentinel in batch
+            if stopping:
+                # Records that were put just before close_listener() swapped
+                # the queue may have landed behind the sentinel
+                while True:
+                    try:
+                        batch.append(record_queue.get_nowait())
+                    except queue.Empty:
+                        break
 
-class JsonFormatter:
-    def __init__(self, fields, *args, **kwargs):
-        self.fields = [
-            (key, val)
-            for piece in fields.split(" ")
-            for (key, val) in (piece.split(":"),)
-        ]
-
-    def format(self, record):
-        rtn = collections.OrderedDict()
-        for key, field in self.fields:
-            if field == "time":
-                val = timezone.now().isoformat()
-            elif field == "app":
-                val = "django"
-            elif field == "project":
-                val = os.environ.get("PROJECT_NAME", "bedrock")
-            elif field == "message":
-                val = record.getMessage()
-            elif field == "exc_info":
-                val = getattr(record, field, None)
-                if val is not None:
-                    val = "".join(traceback.format_exception(val[0], value=val[1], tb=val[2]))
-            else:
-                val = getattr(record, field, None)
-            rtn[key] = val
-        return json.dumps(rtn)
+            self._write(item for item in batch if isinstance(item, logging.LogRecord))
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+
+            if stopping:
+                return
+
+    def _write(self, records):
+        lines = [self._format(record) for record in records]
+        dropped_record = self._take_dropped_record()
+        if dropped_record is not None:
+            lines.append(self._format(dropped_record))
+        if not lines:
+            return
+
+        stream = self.stream or sys.stderr
+        # A listener that is still finishing up after close_listener() gave
+        # up waiting for it can be writing at the same time as its
+        # replacement
+        with self._write_lock:
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except Exception:
+                # Nowhere to log this to
+                pass
+
+    def _format(self, record):
+        try:
+            return self.format(record)
+        except Exception:
+            return f"Failed to format log record from {record.name}: {record.msg!r}"
+
+    def _take_dropped_record(self):
+        if not self.dropped:
+            return None
+        with self._dropped_lock:
+            dropped = dict(self.dropped)
+            self.dropped.clear()
+
+        return logging.LogRecord(
+            name=__name__,
+            level=logging.WARNING,
+            pathname=__file__,
+            lineno=0,
+            msg="Log queue full, dropped records: %s",
+            args=(", ".join(f"{level}={count}" for level, count in sorted(dropped.items())),),
+            exc_info=None,
+        )
+
+    def flush(self, timeout: float=5.0):
+        """
+        Wait (up to timeout seconds) for everything queued so far to be
+        written. The listener keeps running.
+        """
+        record_queue = self._queue
+        if self._pid != os.getpid() or record_queue is None:
+            return
+        written = threading.Event()
+        try:
+            record_queue.put(written, timeout=timeout)
+        except queue.Full:
+            return
+        written.wait(timeout)
+
+    def close_listener(self, timeout: float=5.0):
+        """
+        Write out everything queued so far and stop the listener. Records
+        logged after this start a new one.
+        """
+        with self._listener_lock:
+            if self._pid != os.getpid():
+                return
+            record_queue, thread = self._queue, self._thread
+            # Detach the queue before stopping it, so records logged from
+            # now on go to a new listener instead of behind the sentinel
+            self._queue = None
+            self._thread = None
+            self._pid = None
+
+        try:
+            record_queue.put(self.sentinel, timeout=timeout)
+        except queue.Full:
+            return
+        thread.join(timeout)
+
+    def close(self):
+        self.close_listener()
+        super().close()
+
+
+def flush_queued_logging():
+    """
+    Write out everything queued in this process' QueuedStreamHandlers.
+    Call on worker exit, see main/gunicorn_logging.py
+    """
+    for handler in list(_queued_handlers):
+        handler.close_listener()
@@ -0,0 +1,145 @@
+"""
+Micro benchmarks for hot paths in the project helpers.
+
+    ./manage.py benchmark json_pointer
+    ./manage.py benchmark log_formatter
+"""
+
+import collections
+import json
+import logging
+import os
+import timeit
+import traceback
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.utils import timezone
+
+from main.api_helpers import compile_field_data_sources, extract_json_path
+from main.logging import JsonFormatter
+
+
+def benchmark_json_pointer(iterations):
+    """
+    Compare parsing each body pointer on every request (extract_json_path)
+    against walking a precompiled field data plan.
+    """
+    field_count = 40
+    body = {
+        "data": {
+            "attributes": {
+                f"field_{i}": i
+                for i in range(field_count)
+            }
+        }
+    }
+    sources = {
+        f"field_{i}": ("body", f"/data/attributes/field_{i}")
+        for i in range(field_count)
+    }
+    plan = compile_field_data_sources(sources)
+
+    def uncompiled():
+        return {
+            field_name: extract_json_path(qualifier, body)
+            for field_name, (_, qualifier) in sources.items()
+        }
+
+    def compiled():
+        return {
+            field_name: pointer.resolve(body)
+            for field_name, _, _, pointer in plan
+        }
+
+    assert uncompiled() == compiled()
+
+    return [
+        ("extract_json_path per field", timeit.timeit(uncompiled, number=iterations)),
+        ("precompiled plan", timeit.timeit(compiled, number=iterations)),
+    ]
+
+
+class UncompiledJsonFormatter:
+    """
+    The JSON formatter as it was before the field spec was compiled, kept
+    as a baseline.
+    """
+
+    def __init__(self, fields, *args, **kwargs):
+        self.fields = [
+            (key, val)
+            for piece in fields.split(" ")
+            for (key, val) in (piece.split(":"),)
+        ]
+
+    def format(self, record):
+        rtn = collections.OrderedDict()
+        for key, field in self.fields:
+            if field == "time":
+                val = timezone.now().isoformat()
+            elif field == "app":
+                val = "django"
+            elif field == "project":
+                val = os.environ.get("PROJECT_NAME", "bedrock")
+            elif field == "message":
+                val = record.getMessage()
+            elif field == "exc_info":
+                val = getattr(record, field, None)
+                if val is not None:
+                    val = "".join(traceback.format_exception(val[0], value=val[1], tb=val[2]))
+            else:
+                val = getattr(record, field, None)
+            rtn[key] = val
+        return json.dumps(rtn)
+
+
+def benchmark_log_formatter(iterations):
+    """
+    Records formatted per second with the settings.LOGGING console spec
+    """
+    fields = settings.LOGGING["formatters"]["console"]["format"]
+    record = logging.LogRecord("main", logging.INFO, __file__, 1, "Something happened %s", ("here",), None)
+    record.request_principal = "user:1"
+    record.session_id_hash = "abcdef12"
+    record.request_id = "0123456789"
+    record.ip_address = "127.0.0.1"
+    record.query_count = 3
+    record.query_time_ms = 1.2
+
+    uncompiled = UncompiledJsonFormatter(fields)
+    compiled = JsonFormatter(fields)
+
+    return [
+        ("uncompiled formatter", timeit.timeit(lambda: uncompiled.format(record), number=iterations)),
+        ("compiled formatter", timeit.timeit(lambda: compiled.format(record), number=iterations)),
+    ]
+
+
+BENCHMARKS = {
+    "json_pointer": benchmark_json_pointer,
+    "log_formatter": benchmark_log_formatter,
+}
+
+
+class Command(BaseCommand):
+    """
+    Run a named micro benchmark and print timings
+    """
+
+    help = "Run micro benchmarks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("name", choices=sorted(BENCHMARKS.keys()))
+        parser.add_argument("--iterations", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        benchmark = BENCHMARKS.get(options["name"])
+        if benchmark is None:
+            raise CommandError(f"Unknown benchmark {options['name']}")
+
+        iterations = options["iterations"]
+        for label, seconds in benchmark(iterations):
+            self.stdout.write(
+                f"{label}: {seconds:.3f}s total, {iterations / seconds:,.0f} iterations/s"
+            )
@@ -0,0 +1,30 @@
+"""
+Creates an API token for a user.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management import BaseCommand, CommandError
+
+from main.models import APIToken
+
+
+class Command(BaseCommand):
+    """
+    Create an API token and print it. It can't be shown again later.
+    """
+
+    help = "Create an API token for a user"
+
+    def add_arguments(self, parser):
+        parser.add_argument("email")
+        parser.add_argument("name", help="What the token is for")
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            user = User.objects.get(email=options["email"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user with email {options['email']}")
+
+        _, token_value = APIToken.objects.create_token(user, options["name"])
+        print(token_value)
@@ -0,0 +1,460 @@
+"""
+Prometheus style metrics shared between Gunicorn worker processes.
+
+Each worker writes its values into its own memory mapped file under
+METRICS_DIR (an environment variable, since the Gunicorn hooks read it
+before Django is set up). Nothing is shared between writers, so recording a
+value is a dict lookup and a write into the mapping, with no locks. The
+/metrics view reads every worker's file and adds them up.
+
+    REQUESTS = Counter("myapp_things_total", "Things done", ["kind"])
+    REQUESTS.inc(kind="widget")
+
+Counters and histograms from workers that have exited are kept (folded into
+an archive file by the Gunicorn arbiter, see main/gunicorn_logging.py) so
+they never go backwards. Gauges are dropped when their worker exits.
+
+Values are updated with a plain read then write, which is only safe with
+one thread per process like Gunicorn's default sync workers.
+
+Doesn't import Django for the same reason as main/json_logging.py.
+"""
+import atexit
+import glob
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+HEADER = struct.Struct("<I4x")
+KEY_LENGTH = struct.Struct("<I")
+VALUE = struct.Struct("<d")
+
+# Files hold the values for the "live" (gauges) or "total" (counters and
+# histograms) kinds of metric
+LIVE = "live"
+TOTAL = "total"
+
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+# (pid, path) of the directory used when METRICS_DIR isn't set
+_default_dir = None
+_default_dir_lock = threading.Lock()
+
+
+def get_metrics_dir() -> str:
+    """
+    METRICS_DIR if it's set. Otherwise a temporary directory for this
+    process, removed when it exits, so runserver, tests and management
+    commands don't leave files behind for each other to add up. The Gunicorn
+    arbiter sets METRICS_DIR to its own for the workers it forks, see
+    main/gunicorn_logging.py
+    """
+    global _default_dir
+
+    directory = os.environ.get("METRICS_DIR")
+    if directory:
+        return directory
+
+    pid = os.getpid()
+    with _default_dir_lock:
+        if _default_dir is None or _default_dir[0] != pid:
+            path = tempfile.mkdtemp(prefix="bedrock-metrics-")
+            atexit.register(_remove_default_dir, pid, path)
+            _default_dir = (pid, path)
+        return _default_dir[1]
+
+
+def _remove_default_dir(pid: int, path: str):
+    # Forked children run their parent's exit handlers too
+    if os.getpid() == pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class MmapValues:
+    """
+    A file of (key, float) entries, written by a single process.
+
+    The file starts with the number of bytes in use. New entries are written
+    past that before it's updated, so readers in other processes never see a
+    half written entry.
+    """
+
+    initial_size = 64 * 1024
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a+b")
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(self.initial_size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+        self._used = HEADER.unpack_from(self._mmap, 0)[0] or HEADER.size
+        self._positions = {
+            key: position
+            for key, position, _ in _read_entries(self._mmap, self._used)
+        }
+        self._lock = threading.Lock()
+
+    def get_position(self, key: str) -> int:
+        """
+        Offset of the key's value, adding it if need be
+        """
+        position = self._positions.get(key)
+        if position is None:
+            with self._lock:
+                position = self._positions.get(key)
+                if position is None:
+                    position = self._add_entry(key)
+        return position
+
+    def add(self, position: int, amount: float):
+        VALUE.pack_into(self._mmap, position, VALUE.unpack_from(self._mmap, position)[0] + amount)
+
+    def set(self, position: int, value: float):
+        VALUE.pack_into(self._mmap, position, value)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def _add_entry(self, key):
+        encoded = key.encode("utf8")
+        padding = -(KEY_LENGTH.size + len(encoded)) % 8
+        entry = KEY_LENGTH.pack(len(encoded)) + encoded + b" " * padding + VALUE.pack(0.0)
+
+        if self._used + len(entry) > len(self._mmap):
+            new_size = len(self._mmap) * 2
+            while self._used + len(entry) > new_size:
+                new_size *= 2
+            self._file.truncate(new_size)
+            self._mmap.resize(new_size)
+
+        self._mmap[self._used:self._used + len(entry)] = entry
+        position = self._used + len(entry) - VALUE.size
+        self._used += len(entry)
+        HEADER.pack_into(self._mmap, 0, self._used)
+        self._positions[key] = position
+        return position
+
+
+def _read_entries(data, used: int) -> Iterator[Tuple[str, int, float]]:
+    position = HEADER.size
+    while position < used:
+        key_length = KEY_LENGTH.unpack_from(data, position)[0]
+        key_start = position + KEY_LENGTH.size
+        key = bytes(data[key_start:key_start + key_length]).decode("utf8")
+        value_position = key_start + key_length + (-(KEY_LENGTH.size + key_length) % 8)
+        yield key, value_position, VALUE.unpack_from(data, value_position)[0]
+        position = value_position + VALUE.size
+
+
+def read_file(path: str) -> Iterator[Tuple[str, float]]:
+    with open(path, "rb") as fh:
+        data = fh.read()
+    if len(data) < HEADER.size:
+        return
+    for key, _, value in _read_entries(data, HEADER.unpack_from(data, 0)[0]):
+        yield key, value
+
+
+class MetricsRegistry:
+    """
+    The metrics defined in this process and the files holding their values.
+    Files are opened on first use, and again after a fork.
+    """
+
+    def __init__(self, directory: Optional[str]=None, subdirectory: Optional[str]=None):
+        """
+        :param subdirectory: For values kept apart from the /metrics output,
+            in a directory of their own under METRICS_DIR
+        """
+        self._directory = directory
+        self._subdirectory = subdirectory
+        self.metrics: List["Metric"] = []
+        self._files: Dict[str, MmapValues] = {}
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self.reset_after_fork)
+
+    @property
+    def directory(self) -> str:
+        directory = self._directory or get_metrics_dir()
+        if self._subdirectory:
+            directory = os.path.join(directory, self._subdirectory)
+        return directory
+
+    def register(self, metric: "Metric"):
+        self.metrics.append(metric)
+
+    def get_file(self, kind: str) -> MmapValues:
+        values = self._files.get(kind)
+        if values is None:
+            with self._lock:
+                values = self._files.get(kind)
+                if values is None:
+                    os.makedirs(self.directory, exist_ok=True)
+                    path = os.path.join(self.directory, f"{kind}_{os.getpid()}.db")
+                    values = self._files[kind] = MmapValues(path)
+        return values
+
+    def close(self):
+        """
+        Close this process's files, e.g. to start using a different directory
+        """
+        with self._lock:
+            for values in self._files.values():
+                values.close()
+            self._files = {}
+            for metric in self.metrics:
+                metric.positions = {}
+
+    def reset_after_fork(self):
+        # The parent's files belong to the parent, leave them be
+        self._files = {}
+        self._lock = threading.Lock()
+        for metric in self.metrics:
+            metric.positions = {}
+
+    def collect(self) -> Dict[str, float]:
+        """
+        Sample key -> value summed over every process
+        """
+        rtn = {}
+        for path in sorted(glob.glob(os.path.join(self.directory, "*.db"))):
+            try:
+                entries = list(read_file(path))
+            except FileNotFoundError:
+                # Worker exited while we were looking
+                continue
+            for key, value in entries:
+                rtn[key] = rtn.get(key, 0.0) + value
+        return rtn
+
+    def generate_latest(self) -> str:
+        """
+        All the metrics in the Prometheus text format
+        """
+        samples = {}
+        for key, value in self.collect().items():
+            name, labels = json.loads(key)
+            samples.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.expose(samples):
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    def mark_process_dead(self, pid: int):
+        """
+        Called by the Gunicorn arbiter when a worker exits. Drops the
+        worker's gauges and adds its totals to the arbiter's own file.
+        """
+        live_path = os.path.join(self.directory, f"{LIVE}_{pid}.db")
+        total_path = os.path.join(self.directory, f"{TOTAL}_{pid}.db")
+        if os.path.exists(live_path):
+            os.remove(live_path)
+        if os.path.exists(total_path):
+            archive = self.get_file(TOTAL)
+            for key, value in read_file(total_path):
+                archive.add(archive.get_position(key), value)
+            os.remove(total_path)
+
+    def clear(self):
+        """
+        Remove the files left by a previous run of the server
+        """
+        for path in glob.glob(os.path.join(self.directory, "*.db")):
+            os.remove(path)
+
+
+class Metric:
+    type: str = None
+    # Which file the values go in
+    kind = TOTAL
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Iterable[str]=(),
+            registry: Optional[MetricsRegistry]=None,
+            kind: Optional[str]=None):
+        """
+        :param kind: LIVE to drop the values when the process exits, e.g.
+            for a histogram per worker process
+        """
+        if kind is not None:
+            self.kind = kind
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        # Label values -> offset(s) in the file
+        self.positions = {}
+        self.registry.register(self)
+
+    def _label_values(self, labels) -> tuple:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _key(self, name, label_values, extra=()):
+        return json.dumps([name, list(zip(self.labelnames, label_values)) + list(extra)])
+
+    def _get_position(self, labels) -> int:
+        label_values = self._label_values(labels)
+        position = self.positions.get(label_values)
+        if position is None:
+            position = self.positions[label_values] = self.registry.get_file(self.kind).get_position(
+                self._key(self.name, label_values)
+            )
+        return position
+
+    def expose(self, samples) -> Iterator[Tuple[str, list, float]]:
+        for labels, value in samples.get(self.name, []):
+            yield self.name, labels, value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float=1, **labels):
+        position = self._get_position(labels)
+        self.registry.get_file(self.kind).add(position, amount)
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down. Only counts live processes.
+    """
+
+    type = "gauge"
+    kind = LIVE
+
+    def dec(self, amount: float=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        position = self._get_position(labels)
+        self.registry.get_file(self.kind).set(position, value)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float]=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value: float, **labels):
+        label_values = self._label_values(labels)
+        positions = self.positions.get(label_values)
+        if positions is None:
+            positions = self.positions[label_values] = self._create_positions(label_values)
+
+        values = self.registry.get_file(self.kind)
+        for bound, position in zip(self.buckets, positions):
+            if value <= bound:
+                values.add(position, 1)
+                break
+        values.add(positions[-2], value)
+        values.add(positions[-1], 1)
+
+    def _create_positions(self, label_values):
+        values = self.registry.get_file(self.kind)
+        # A count per bucket rather than cumulative, so an observation only
+        # writes one of them. They're added up when exposed.
+        return [
+            values.get_position(self._key(f"{self.name}_bucket", label_values, [("le", _format_value(bound))]))
+            for bound in self.buckets
+        ] + [
+            values.get_position(self._key(f"{self.name}_sum", label_values)),
+            values.get_position(self._key(f"{self.name}_count", label_values)),
+        ]
+
+    def expose(self, samples):
+        cumulative = {}
+        for labels, value in samples.get(f"{self.name}_bucket", []):
+            le = labels[-1][1]
+            cumulative.setdefault(json.dumps(labels[:-1]), {})[le] = value
+
+        for label_key, counts in sorted(cumulative.items()):
+            labels = json.loads(label_key)
+            total = 0.0
+            for bound in self.buckets:
+                le = _format_value(bound)
+                total += counts.get(le, 0.0)
+                yield f"{self.name}_bucket", labels + [["le", le]], total
+
+        for suffix in ("_sum", "_count"):
+            for labels, value in sorted(samples.get(self.name + suffix, [])):
+                yield self.name + suffix, labels, value
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(name, value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r'\"'))
+        for name, value in labels
+    )
+    return "{" + pairs + "}"
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n")
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = Counter(
+    "django_http_requests_total",
+    "Requests handled, by URL name, method and response status",
+    ["view", "method", "status"],
+)
+REQUEST_LATENCY = Histogram(
+    "django_http_request_duration_seconds",
+    "Time to produce a response, by URL name",
+    ["view"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "django_http_requests_in_flight",
+    "Requests currently being handled",
+)
+
+# Recorded by the Gunicorn hooks in main/gunicorn_logging.py
+WORKER_REQUESTS = Gauge(
+    "gunicorn_worker_requests_served",
+    "Requests served by each live worker process",
+    ["pid"],
+)
+WORKER_RSS = Gauge(
+    "gunicorn_worker_resident_memory_bytes",
+    "Resident memory of each live worker process",
+    ["pid"],
+)
+WORKER_REQUEST_LATENCY = Histogram(
+    "gunicorn_request_duration_seconds",
+    "Time from Gunicorn parsing a request to it finishing the response, by live worker process",
+    ["pid"],
+    # Otherwise every recycled worker would leave its series behind
+    kind=LIVE,
+)
+WORKER_RECYCLES = Counter(
+    "gunicorn_worker_recycles_total",
+    "Workers restarted for passing the memory ceiling",
+)
@@ -1,10 +1,13 @@
 import secrets
 import random
+import time
 from collections import OrderedDict
 
 from django.conf import settings
 from django.urls import reverse
-from django.utils.cache import add_never_cache_headers
+from django.utils.cache import add_never_cache_headers, patch_cache_control
+
+from main.metrics import REQUEST_LATENCY, REQUESTS, REQUESTS_IN_FLIGHT
 
 
 class ContentSecurityPolicyMiddleware:
@@ -87,6 +90,9 @@ class ContentSecurityPolicyMiddleware:
 class NoCacheDefaultMiddleware:
     """
     Ensure's we're not caching any of our HTML views by default
+
+    Responses with an ETag or Last-Modified (see main/conditional.py) can
+    still be stored, but must be revalidated on every use.
     """
 
     def __init__(self, get_response):
@@ -97,8 +103,50 @@ class NoCacheDefaultMiddleware:
 
         if not response.has_header("Cache-Control"):
             # Allow people to set their own headers, but if they don't assume no cache
-            add_never_cache_headers(response)
-            pass
+            if response.has_header("ETag") or response.has_header("Last-Modified"):
+                patch_cache_control(response, private=True, no_cache=True, max_age=0)
+            else:
+                add_never_cache_headers(response)
 
 
         return response
+
+
+class MetricsMiddleware:
+    """
+    Records request counts, latency and requests in flight per URL name. See
+    main/metrics.py . Goes first in MIDDLEWARE so the time includes the rest.
+    """
+
+    # Other methods are counted as "other" to limit the number of series
+    known_methods = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        # For exceptions that get past Django's handling, e.g. from the
+        # error views themselves
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            duration = time.perf_counter() - start
+
+            view = self._get_view_label(request)
+            method = request.method if request.method in self.known_methods else "other"
+            REQUEST_LATENCY.observe(duration, view=view)
+            REQUESTS.inc(view=view, method=method, status=status)
+
+    def _get_view_label(self, request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            # Unmatched URLs are any old thing, don't give them their own
+            # series
+            return "unresolved"
+        return match.url_name or match.view_name or "unnamed"
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:53
+
+import django.db.models.deletion
+import django.utils.timezone
+import main.auth.instances
+import main.fields
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='APIToken',
+            fields=[
+                ('id', main.fields.UUID7Field(default=main.fields.UUID7Field.uuid7, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('token_hash', models.CharField(max_length=64, unique=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('expires_at', models.DateTimeField(blank=True, null=True)),
+                ('revoked_at', models.DateTimeField(blank=True, null=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='api_tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+            bases=(main.auth.instances.APITokenPrincipal, models.Model),
+        ),
+    ]
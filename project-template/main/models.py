@@ -2,7 +2,7 @@ from django.db import models
 from django.contrib.auth.base_user import AbstractBaseUser, BaseUserManager
 from django.utils import timezone
 
-from main.auth.instances import UserPrincipal
+from main.auth.instances import APITokenPrincipal, UserPrincipal
 from main.fields import UUID7Field
 
 
@@ -17,6 +17,20 @@ class UUIDModel(models.Model):
         abstract = True
 
 
+class UserManager(BaseUserManager):
+    def create_user(self, email, password=None, **extra_fields):
+        user = self.model(email=self.normalize_email(email), **extra_fields)
+        user.set_password(password)
+        user.save(using=self._db)
+        return user
+
+    def create_superuser(self, email, password=None, **extra_fields):
+        """
+        Used by the createsuperuser management command
+        """
+        return self.create_user(email, password, is_superuser=True, **extra_fields)
+
+
 class User(UserPrincipal, AbstractBaseUser):
     """
     Use a custom user right from the start since it in theory
@@ -27,7 +41,7 @@ class User(UserPrincipal, AbstractBaseUser):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = []
 
-    objects = BaseUserManager()
+    objects = UserManager()
 
     id = UUID7Field(primary_key=True)
     email = models.EmailField(
@@ -36,4 +50,58 @@ class User(UserPrincipal, AbstractBaseUser):
     is_active = models.BooleanField(
         default=True
     )
+    # Gets the permissions in UserPrincipal.superuser_perms
+    is_superuser = models.BooleanField(
+        default=False
+    )
     date_joined = models.DateTimeField(default=timezone.now)
+
+
+class APITokenQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(revoked_at__isnull=True, user__is_active=True)
+
+
+class APITokenManager(models.Manager.from_queryset(APITokenQuerySet)):
+    def create_token(self, user, name, expires_at=None):
+        """
+        Returns the new APIToken and the token value to give to the client,
+        which isn't stored anywhere.
+        """
+        from main.auth.tokens import generate_token_value, hash_token
+
+        token_value = generate_token_value()
+        token = self.create(
+            user=user,
+            name=name,
+            token_hash=hash_token(token_value),
+            expires_at=expires_at,
+        )
+        return token, token_value
+
+
+class APIToken(APITokenPrincipal, UUIDModel):
+    """
+    A token used to access the API on behalf of a user. Only a hash of the
+    token is kept, see main/auth/tokens.py
+    """
+
+    objects = APITokenManager()
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="api_tokens",
+    )
+    name = models.CharField(max_length=255)
+    token_hash = models.CharField(max_length=64, unique=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    def is_expired(self) -> bool:
+        return self.expires_at is not None and self.expires_at <= timezone.now()
+
+    def revoke(self):
+        self.revoked_at = timezone.now()
+        self.save(update_fields=["revoked_at"])
@@ -0,0 +1,224 @@
+"""
+Aggregates the navigation timings the frontend reports for each page view
+(see main/frontend/js/main.js) into histograms per view, labelled by URL
+name like the request metrics in main/middleware.py.
+
+Rather than a log line per page view, each worker logs a summary per view
+every settings.FRONTEND_TIMING_FLUSH_SECONDS of the reports it received,
+and JsPerformanceSummaryView returns the percentiles since the server
+started. Those totals are kept in memory mapped files like main/metrics.py,
+so the summary adds up the reports received by every worker process.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+from typing import Dict, Iterable, Optional, Sequence
+
+from main import metrics
+
+
+# Navigation timing fields reported by the frontend, milliseconds since the
+# navigation started
+TIMING_FIELDS = ("requestStart", "responseStart", "responseEnd", "loadEventEnd")
+
+# Upper bounds (inclusive) of the histogram buckets in milliseconds. There's
+# an extra bucket for anything larger.
+DEFAULT_BUCKETS = (
+    10, 25, 50, 75, 100, 150, 200, 300, 400, 500, 750,
+    1000, 1500, 2000, 3000, 4000, 5000, 7500, 10000, 15000, 30000, 60000,
+)
+
+# Timings past this are junk (e.g. a tab left in the background) and dropped
+MAX_TIMING = 10 * 60 * 1000
+
+LOGGER = logging.getLogger("frontend")
+
+# Where the worker processes keep their totals. Apart from the /metrics
+# output since there's a series for every view.
+REGISTRY = metrics.MetricsRegistry(subdirectory="page_timings")
+
+
+class Histogram:
+    """
+    Counts of observations in fixed buckets. Percentiles are interpolated
+    within the bucket they fall in, so are only as precise as the buckets.
+    """
+
+    def __init__(self, buckets: Sequence[float]=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+
+    def percentile(self, percent: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+
+        rank = self.count * percent / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0
+                if i == len(self.buckets):
+                    # Nothing to interpolate towards in the overflow bucket
+                    return lower
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def percentiles(self, percents: Iterable[float]) -> Dict[str, Optional[float]]:
+        return {
+            f"p{percent:g}": _round(self.percentile(percent))
+            for percent in percents
+        }
+
+
+class PageTimings:
+    """
+    Timing histograms for each view. Keeps totals since the server
+    started, shared by the worker processes, and a window for this worker
+    that's reset every time it logs a summary.
+    """
+
+    # Percentiles returned by summary() and logged
+    percents = (50, 90, 95, 99)
+
+    def __init__(
+            self,
+            max_views: int=200,
+            flush_interval: Optional[float]=60.0,
+            buckets: Sequence[float]=DEFAULT_BUCKETS,
+            registry: Optional[metrics.MetricsRegistry]=None):
+        """
+        :param max_views: Views past this many are counted under "other".
+            Only a backstop, the callers pass URL names so there's a fixed
+            number of them.
+        :param flush_interval: Seconds between logged summaries, or None to
+            only log them when flush() is called
+        :param registry: Where to keep the totals, defaults to REGISTRY
+        """
+        self.max_views = max_views
+        self.flush_interval = flush_interval
+        self.buckets = tuple(buckets)
+        self.registry = registry or REGISTRY
+        self._totals = metrics.Histogram(
+            "frontend_page_timing_milliseconds",
+            "Navigation timings reported by the frontend",
+            ["view", "field"],
+            buckets=self.buckets,
+            registry=self.registry,
+        )
+        self._views = set()
+        self._window = {}
+        self._lock = threading.Lock()
+        self._timer_pid = None
+
+    def observe(self, view: str, report: dict) -> bool:
+        """
+        Record the timing fields in a report, returning False if it didn't
+        have any usable ones.
+        """
+        timings = {}
+        for field in TIMING_FIELDS:
+            value = report.get(field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and 0 <= value <= MAX_TIMING:
+                timings[field] = value
+        if not timings:
+            return False
+
+        self._ensure_timer()
+        with self._lock:
+            if view not in self._views:
+                if len(self._views) >= self.max_views:
+                    view = "other"
+                else:
+                    self._views.add(view)
+
+            view_histograms = self._window.get(view)
+            if view_histograms is None:
+                view_histograms = self._window[view] = {
+                    field: Histogram(self.buckets) for field in TIMING_FIELDS
+                }
+            for field, value in timings.items():
+                view_histograms[field].observe(value)
+                self._totals.observe(value, view=view, field=field)
+        return True
+
+    def summary(self) -> dict:
+        """
+        Percentiles for each view and timing field since the server started,
+        over all the worker processes
+        """
+        bucket_name = f"{self._totals.name}_bucket"
+        histograms = {}
+        for key, value in self.registry.collect().items():
+            name, labels = json.loads(key)
+            if name != bucket_name or not value:
+                continue
+            labels = dict(labels)
+            view_histograms = histograms.setdefault(labels["view"], {})
+            histogram = view_histograms.get(labels["field"])
+            if histogram is None:
+                histogram = view_histograms[labels["field"]] = Histogram(self.buckets)
+            # Stored as a count per bucket, the same as Histogram.counts
+            # ("+Inf" is the overflow bucket)
+            histogram.counts[bisect.bisect_left(self.buckets, float(labels["le"]))] += int(value)
+            histogram.count += int(value)
+
+        return self._summarise({
+            view: {
+                field: view_histograms[field]
+                for field in TIMING_FIELDS
+                if field in view_histograms
+            }
+            for view, view_histograms in sorted(histograms.items())
+        })
+
+    def flush(self):
+        """
+        Log a summary line per view for the reports since the last flush
+        """
+        with self._lock:
+            window = self._window
+            self._window = {}
+            summary = self._summarise(window)
+
+        for view, fields in summary.items():
+            LOGGER.info("JS Performance summary: %s", json.dumps({"view": view, **fields}))
+
+    def _summarise(self, histograms):
+        return {
+            view: {
+                field: {"count": histogram.count, **histogram.percentiles(self.percents)}
+                for field, histogram in view_histograms.items()
+            }
+            for view, view_histograms in histograms.items()
+        }
+
+    def _ensure_timer(self):
+        # Started lazily, and again in each forked worker
+        if self.flush_interval is None or self._timer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+        thread = threading.Thread(target=self._run_timer, name="page-timings-flush", daemon=True)
+        thread.start()
+
+    def _run_timer(self):
+        stopped = threading.Event()
+        while not stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                LOGGER.exception("Failed to log JS performance summary")
+
+
+def _round(value):
+    return None if value is None else round(value, 1)
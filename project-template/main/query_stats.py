@@ -0,0 +1,98 @@
+"""
+Counts and times the SQL queries run while handling each request.
+
+The totals go into every log line for the request (see
+main/logging.py:RequestContextFilter), and statements run over and over
+with different parameters, the telltale sign of an N+1 loop, are logged as
+a warning at the end of the request.
+
+main/tests/base.py:query_budget uses the same counting to put a ceiling on
+the queries a view can run in tests.
+"""
+import collections
+import logging
+import re
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Collapses the placeholder lists from e.g. pk__in=[...] so they have the
+# same shape whatever the number of values
+PLACEHOLDER_LIST_RE = re.compile(r"%s(?:\s*,\s*%s)+")
+
+
+class QueryStats:
+    """
+    An execute_wrapper (see
+    https://docs.djangoproject.com/en/5.0/topics/db/instrumentation/)
+    totalling up the queries run through it
+    """
+
+    __slots__ = ("count", "duration", "shapes")
+
+    def __init__(self):
+        self.count = 0
+        # Seconds
+        self.duration = 0.0
+        # Statement shape -> number of times it was run
+        self.shapes = collections.Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.shapes[PLACEHOLDER_LIST_RE.sub("%s, ...", sql)] += 1
+
+    def repeated(self, threshold: int):
+        """
+        (shape, count) pairs for statements run at least threshold times
+        """
+        return [
+            (shape, count)
+            for shape, count in self.shapes.most_common()
+            if count >= threshold
+        ]
+
+    def instrument(self) -> ExitStack:
+        """
+        Context manager recording queries on every database connection
+        """
+        stack = ExitStack()
+        for connection in connections.all(initialized_only=False):
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Records the queries run by each request in request._query_stats and
+    warns about repeated statements at the end of it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = QueryStats()
+        request._query_stats = stats
+
+        with stats.instrument():
+            response = self.get_response(request)
+
+        threshold = settings.QUERY_REPEAT_THRESHOLD
+        for shape, count in stats.repeated(threshold):
+            LOGGER.warning(
+                "Query repeated %s times in one request, possible N+1: %s",
+                count,
+                shape[:1024],
+            )
+
+        return response
@@ -0,0 +1,150 @@
+"""
+In-process rate limiting and log aggregation.
+
+State is per worker process, so limits are approximate (multiply by the
+number of workers for the whole server) but cost no network round trips.
+Meant for protecting cheap, noisy endpoints like the frontend logging
+views, not as a security boundary.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable
+
+
+class TokenBucketLimiter:
+    """
+    A token bucket per key. Each bucket holds up to burst tokens and refills
+    at rate tokens per second. Only the most recently used max_keys buckets
+    are kept, so memory use is bounded however many keys (e.g. IPs) there are.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int=10000, clock: Callable[[], float]=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, key: Hashable) -> bool:
+        """
+        Take a token from the key's bucket, returning False if it's empty
+        """
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.pop(key, None)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens, updated = bucket
+                tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self._buckets[key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+
+        return allowed
+
+
+class LogAggregator:
+    """
+    Folds repeated identical log messages into one line with a count.
+
+    The first occurrence of a message in each interval is logged straight
+    away. Repeats are counted and logged as a summary line once the interval
+    has passed, by a timer thread or whenever a new message is added or
+    flush() is called.
+    """
+
+    def __init__(
+            self,
+            log: Callable[..., None],
+            interval: float=60.0,
+            max_keys: int=1000,
+            clock: Callable[[], float]=time.monotonic,
+            timer: bool=True):
+        """
+        :param log: Called as log(message_format, *args) for each line, e.g.
+            logging.getLogger("frontend").warning
+        :param timer: Flush every interval from a background thread, so the
+            counts from a burst are logged even if nothing comes after it
+        """
+        self.log = log
+        self.interval = interval
+        self.max_keys = max_keys
+        self.clock = clock
+        self._repeats: Dict[Hashable, list] = {}
+        self._seen = set()
+        self._window_start = clock()
+        self._lock = threading.Lock()
+        self.timer = timer
+        self._timer_pid = None
+
+    def add(self, key: Hashable, message_format: str, *args):
+        self._ensure_timer()
+        self.flush(force=False)
+
+        with self._lock:
+            first = key not in self._seen
+            if first:
+                # Past max_keys distinct messages are all logged as is
+                if len(self._seen) < self.max_keys:
+                    self._seen.add(key)
+            else:
+                repeat = self._repeats.get(key)
+                if repeat is None:
+                    self._repeats[key] = [1, message_format, args]
+                else:
+                    repeat[0] += 1
+
+        if first:
+            self.log(message_format, *args)
+
+    def flush(self, force: bool=True):
+        """
+        Log the repeat counts for the current interval. Unless forced, only
+        does anything once the interval has passed.
+        """
+        now = self.clock()
+        with self._lock:
+            if not force and now - self._window_start < self.interval:
+                return
+            repeats = self._repeats
+            window = now - self._window_start
+            self._repeats = {}
+            self._seen = set()
+            self._window_start = now
+
+        for count, message_format, args in repeats.values():
+            self.log(
+                f"{message_format} (repeated %s times in %ss)",
+                *args,
+                count,
+                round(window),
+            )
+
+    def _ensure_timer(self):
+        # Started lazily, and again in each forked worker
+        if not self.timer or self._timer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._timer_pid == os.getpid():
+                return
+            self._timer_pid = os.getpid()
+        thread = threading.Thread(target=self._run_timer, name="log-aggregator-flush", daemon=True)
+        thread.start()
+
+    def _run_timer(self):
+        stopped = threading.Event()
+        while not stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception:
+                logging.getLogger(__name__).exception("Failed to log aggregated messages")
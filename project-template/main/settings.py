@@ -66,11 +66,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First so it times everything else
+    "main.middleware.MetricsMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
 
     "main.threadlocals.ThreadLocalMiddleware",
+    "main.query_stats.QueryInstrumentationMiddleware",
     "main.auth.middleware.AuthenticationMiddleware",
     "main.middleware.ContentSecurityPolicyMiddleware",
     "main.middleware.NoCacheDefaultMiddleware",
@@ -117,6 +120,12 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 AUTH_USER_MODEL = "main.User"
 
 LOGIN_REDIRECT_URL = "/"
+
+AUTHENTICATION_BACKENDS = [
+    # Has to come first so throttled logins never reach the password hasher
+    "main.auth.throttle.LoginThrottleBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
 LOGOUT_REDIRECT_URL = "/"
 
 # ------ Password validation
@@ -158,7 +167,10 @@ LOGGING = {
     "disable_existing_loggers": False,
     "handlers": {
         "console": {
-            "class": "logging.StreamHandler",
+            # Writes from a background thread so a slow stdout doesn't block
+            # requests. See main/logging.py
+            "class": "main.logging.QueuedStreamHandler",
+            "queue_size": int(os.environ.get("LOG_QUEUE_SIZE", "10000")),
             "filters": ["request_context"],
             "formatter": "console",
         }
@@ -166,7 +178,7 @@ LOGGING = {
     "filters": {"request_context": {"()": "main.logging.RequestContextFilter"}},
     "formatters": {
         "console": {
-            "format": "level:levelname time:time app:app project:project channel:name request_principal:request_principal session_id_hash:session_id_hash request_id:request_id ip_address:ip_address file:pathname line:lineno message:message exception:exc_info",
+            "format": "level:levelname time:time app:app project:project channel:name request_principal:request_principal session_id_hash:session_id_hash request_id:request_id ip_address:ip_address query_count:query_count query_time_ms:query_time_ms file:pathname line:lineno message:message exception:exc_info",
             # Coopting the above string to specify the fields and ordering of the JSON
             # emitted by this class
             "class": "main.logging.JsonFormatter",
@@ -187,12 +199,66 @@ LOGGING = {
             "handlers": ["console"],
             "level": os.environ.get("DJANGO_LOG_LEVEL_FRONTEND", "INFO"),
             "propagate": False,
-        }
+        },
+        "tasks": {
+            # Timings for every background task run, see main/task_context.py
+            "handlers": ["console"],
+            "level": os.environ.get("DJANGO_LOG_LEVEL_TASKS", "INFO"),
+            "propagate": False,
+        },
     },
 }
 
+# Warn when a request runs the same SQL statement (ignoring parameters) at
+# least this many times. See main/query_stats.py
+QUERY_REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", "10"))
+
 JS_REQUEST_LOG_PROB = float(os.environ.get("JS_REQUEST_LOG_PROB", "1.0"))
 JS_ERROR_LOG_PROB = float(os.environ.get("JS_ERROR_LOG_PROB", "1.0"))
+# Server side limits on the frontend report endpoints, per worker process.
+# Rates are reports per second, bursts the most accepted at once
+FRONTEND_REPORT_IP_RATE = float(os.environ.get("FRONTEND_REPORT_IP_RATE", "1.0"))
+FRONTEND_REPORT_IP_BURST = int(os.environ.get("FRONTEND_REPORT_IP_BURST", "30"))
+FRONTEND_REPORT_REQUEST_ID_RATE = float(os.environ.get("FRONTEND_REPORT_REQUEST_ID_RATE", "0.1"))
+FRONTEND_REPORT_REQUEST_ID_BURST = int(os.environ.get("FRONTEND_REPORT_REQUEST_ID_BURST", "10"))
+# Identical reports within this many seconds are logged once with a count
+FRONTEND_REPORT_AGGREGATE_SECONDS = float(os.environ.get("FRONTEND_REPORT_AGGREGATE_SECONDS", "60"))
+# How often each worker logs its summary of the JS performance reports
+FRONTEND_TIMING_FLUSH_SECONDS = float(os.environ.get("FRONTEND_TIMING_FLUSH_SECONDS", "60"))
+
+# ------ API tokens
+
+# Resolved API tokens are cached in each worker for this many seconds, so
+# revoking a token can take this long to reach every worker
+API_TOKEN_CACHE_TTL = float(os.environ.get("API_TOKEN_CACHE_TTL", "60"))
+API_TOKEN_CACHE_SIZE = int(os.environ.get("API_TOKEN_CACHE_SIZE", "10000"))
+
+# ------ Session users
+
+# Logged in users are cached in each worker for this many seconds rather
+# than loaded on every request. Off (0) by default. Saving a user clears it
+# from the current worker, other workers can take this long to notice
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "0"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+
+# ------ Login throttling
+
+# Failed logins allowed per account and per IP before each further failure
+# doubles the wait (starting at LOGIN_THROTTLE_BASE_DELAY seconds, up to
+# LOGIN_THROTTLE_MAX_DELAY). Counts are per worker and forgotten after
+# LOGIN_THROTTLE_RESET_SECONDS without a failure
+LOGIN_THROTTLE_ACCOUNT_FREE_ATTEMPTS = int(os.environ.get("LOGIN_THROTTLE_ACCOUNT_FREE_ATTEMPTS", "5"))
+LOGIN_THROTTLE_IP_FREE_ATTEMPTS = int(os.environ.get("LOGIN_THROTTLE_IP_FREE_ATTEMPTS", "20"))
+LOGIN_THROTTLE_BASE_DELAY = float(os.environ.get("LOGIN_THROTTLE_BASE_DELAY", "1"))
+LOGIN_THROTTLE_MAX_DELAY = float(os.environ.get("LOGIN_THROTTLE_MAX_DELAY", "900"))
+LOGIN_THROTTLE_RESET_SECONDS = float(os.environ.get("LOGIN_THROTTLE_RESET_SECONDS", "3600"))
+
+# ------ Metrics
+
+# Required as a bearer token by the /metrics view if set. Where the values
+# are stored is set by the METRICS_DIR environment variable, see
+# main/metrics.py
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
 
 # ------ Email
 
@@ -4,10 +4,14 @@ Event listeners
 
 import logging
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.signals import user_logged_in, user_login_failed
 from django.contrib.auth import get_user_model
 
+from main.auth.throttle import get_credentials_username, record_login_failure, record_login_success
+from main.auth.tokens import invalidate_token, invalidate_user_tokens
+from main.auth.users import invalidate_user
+from main.models import APIToken
 from main.threadlocals import current_request
 
 
@@ -23,22 +27,25 @@ def log_login_success(sender, request, user, **kwargs):
     security_logger.info(
         "Login success user_id=%s", user.id
     )
+    record_login_success(user.get_username())
 
 
-def log_login_failed(sender, credentials, **kwargs):
+def log_login_failed(sender, credentials, request=None, **kwargs):
     """
-    Log login events (to admin)
+    Log login events (to admin), counting them towards the login throttle
     """
 
-    if "username" in credentials:
-        security_logger.info(
-            "Login failure for %s",
-            User.objects.get(email=credentials["username"]).pk
-        )
-    else:
-        security_logger.info(
-            "Login failure",
-        )
+    if getattr(request, "_login_retry_after", None) is not None:
+        # Turned away by the throttle, which has logged it already
+        return
+
+    state = record_login_failure(request, get_credentials_username(credentials))
+    security_logger.info(
+        "Login failure account=%s account_failures=%s ip_failures=%s",
+        state["account"],
+        state["account_failures"],
+        state["ip_failures"],
+    )
 
 
 def user_changed(
@@ -53,6 +60,11 @@ def user_changed(
     Log password change and user creation events
     """
 
+    # Password changes and deactivation shouldn't wait for the caches
+    invalidate_user(instance.pk)
+    if not created:
+        invalidate_user_tokens(instance.pk)
+
     maybe_request = current_request()
     if maybe_request:
         if maybe_request.user.is_authenticated:
@@ -75,6 +87,21 @@ def user_changed(
         )
 
 
+def api_token_changed(sender, instance, **kwargs):
+    """
+    Drop revoked or deleted tokens from this worker's cache
+    """
+
+    invalidate_token(instance.token_hash)
+
+
+def user_deleted(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
 user_logged_in.connect(log_login_success)
 user_login_failed.connect(log_login_failed)
 post_save.connect(user_changed, sender=User)
+post_delete.connect(user_deleted, sender=User)
+post_save.connect(api_token_changed, sender=APIToken)
+post_delete.connect(api_token_changed, sender=APIToken)
@@ -0,0 +1,168 @@
+"""
+Carries the request context over to procrastinate background tasks.
+
+Tasks declared with context_task rather than app.task have the current
+request_id and principal attached to each job they defer, under an extra
+task argument. The worker takes it back off before calling the task and
+makes it available to RequestContextFilter, so the task's logs can be tied
+back to the request that queued it. Each run is also logged with how long
+the job waited in the queue and how long it took:
+
+    @context_task(queue="emails")
+    def send_email(address):
+        ...
+
+    send_email.defer(address="someone@example.com")
+
+Jobs deferred without the context (e.g. queued before this was added)
+still run, just without it.
+"""
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from asgiref.sync import iscoroutinefunction
+from procrastinate.contrib.django import app
+
+from main.logging import get_log_context
+from main.threadlocals import current_request, current_task_context, task_context
+
+
+LOGGER = logging.getLogger("tasks")
+
+# The task argument the context is passed in
+CONTEXT_KWARG = "_request_context"
+
+
+def get_defer_context() -> dict:
+    """
+    The context to attach to a job deferred now
+    """
+    request = current_request()
+    if request is not None:
+        log_context = get_log_context(request)
+        rtn = {
+            "request_id": log_context.request_id,
+            "principal": log_context.request_principal(request),
+        }
+    else:
+        # Tasks deferring more tasks pass their context along
+        parent = current_task_context() or {}
+        rtn = {
+            key: parent[key]
+            for key in ("request_id", "principal")
+            if key in parent
+        }
+    rtn["queued_at"] = time.time()
+    return rtn
+
+
+class ContextJobDeferrer:
+    """
+    Wraps a procrastinate JobDeferrer to add the context to the job
+    """
+
+    def __init__(self, deferrer):
+        self.deferrer = deferrer
+
+    def defer(self, **task_kwargs):
+        return self.deferrer.defer(**task_kwargs, **{CONTEXT_KWARG: get_defer_context()})
+
+    async def defer_async(self, **task_kwargs):
+        return await self.deferrer.defer_async(**task_kwargs, **{CONTEXT_KWARG: get_defer_context()})
+
+    def __getattr__(self, name):
+        return getattr(self.deferrer, name)
+
+
+class ContextTask:
+    """
+    Wraps a procrastinate Task so jobs deferred through it carry the context.
+    Everything else is passed through to the task.
+    """
+
+    def __init__(self, task, func):
+        self.task = task
+        self.func = func
+        functools.update_wrapper(self, task, updated=())
+
+    def configure(self, **options):
+        return ContextJobDeferrer(self.task.configure(**options))
+
+    def defer(self, **task_kwargs):
+        return self.configure().defer(**task_kwargs)
+
+    async def defer_async(self, **task_kwargs):
+        return await self.configure().defer_async(**task_kwargs)
+
+    def __call__(self, *args, **kwargs):
+        # Calling the task runs it straight away like with app.task
+        return self.func(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.task, name)
+
+
+def context_task(_func=None, *, pass_context: bool=False, **task_options):
+    """
+    Drop in replacement for procrastinate's app.task decorator
+    """
+
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(job_context, *args, **kwargs):
+                context = kwargs.pop(CONTEXT_KWARG, None) or {}
+                if pass_context:
+                    args = (job_context,) + args
+                with _task_run(job_context.job, context):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(job_context, *args, **kwargs):
+                context = kwargs.pop(CONTEXT_KWARG, None) or {}
+                if pass_context:
+                    args = (job_context,) + args
+                with _task_run(job_context.job, context):
+                    return func(*args, **kwargs)
+
+        return ContextTask(app.task(wrapper, pass_context=True, **task_options), func)
+
+    if _func is not None:
+        return decorator(_func)
+    return decorator
+
+
+@contextmanager
+def _task_run(job, context: dict):
+    """
+    Restores the context and logs the timings for one run of a job
+    """
+    with task_context(context):
+        started = time.time()
+        status = "failed"
+        try:
+            yield
+            status = "succeeded"
+        finally:
+            LOGGER.info(
+                "Task %s task=%s job_id=%s attempts=%s queue_wait_ms=%s run_ms=%s",
+                status,
+                job.task_name,
+                job.id,
+                job.attempts,
+                _queue_wait_ms(job, context, started),
+                round((time.time() - started) * 1000, 1),
+            )
+
+
+def _queue_wait_ms(job, context: dict, started: float) -> Optional[float]:
+    queued_at = context.get("queued_at")
+    if queued_at is None:
+        return None
+    # Don't count the time a scheduled job was meant to wait
+    if job.scheduled_at is not None:
+        queued_at = max(queued_at, job.scheduled_at.timestamp())
+    return round(max(started - queued_at, 0) * 1000, 1)
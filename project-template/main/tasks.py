@@ -1,6 +1,6 @@
-from procrastinate.contrib.django import app
+from main.task_context import context_task
 
 
-@app.task
+@context_task
 def background_task(msg):
     print("Task run: " + msg)
@@ -21,6 +21,9 @@ def content_security_policy_nonce(context):
 
     if request and hasattr(request, "_csp_nonce"):
         val = request._csp_nonce  # pylint:disable=protected-access
+        # The page can't be served from a cached copy now, see
+        # main/conditional.py
+        request._csp_nonce_used = True  # pylint:disable=protected-access
         return mark_safe(f"nonce=\"{val}\"")
     else:
         return None
@@ -1,9 +1,14 @@
 """
 Miscellaneous helpers pertaining to automated tests
 """
+from contextlib import contextmanager
+from typing import Optional
+
 import pytest
 from django.test import Client
 
+from main.query_stats import QueryStats
+
 
 @pytest.mark.django_db
 class StandardClientTestCase:
@@ -42,3 +47,25 @@ class InvalidVarException(str):
 
     def __contains__(self, search):
         return True
+
+
+@contextmanager
+def query_budget(max_queries: int, max_repeats: Optional[int]=None):
+    """
+    Fails if the block runs more than max_queries SQL queries, or any
+    statement more than max_repeats times (i.e. an N+1 loop):
+
+        with query_budget(5, max_repeats=1):
+            response = self.client.get("/migrations")
+    """
+    stats = QueryStats()
+    with stats.instrument():
+        yield stats
+
+    shapes = "\n".join(f"{count}: {shape}" for shape, count in stats.shapes.most_common())
+    assert stats.count <= max_queries, \
+        f"Expected at most {max_queries} queries, ran {stats.count}:\n{shapes}"
+    if max_repeats is not None:
+        repeated = stats.repeated(max_repeats + 1)
+        assert not repeated, \
+            f"Expected no statement to run more than {max_repeats} times:\n{shapes}"
@@ -0,0 +1,23 @@
+import os
+
+import pytest
+
+from main import metrics, page_timings
+
+
+@pytest.fixture(autouse=True, scope="session")
+def metrics_dir(tmp_path_factory):
+    """
+    Keep the metrics the tests record out of everything else's
+    """
+    previous = os.environ.get("METRICS_DIR")
+    for registry in (metrics.REGISTRY, page_timings.REGISTRY):
+        registry.close()
+    os.environ["METRICS_DIR"] = str(tmp_path_factory.mktemp("metrics"))
+    yield
+    for registry in (metrics.REGISTRY, page_timings.REGISTRY):
+        registry.close()
+    if previous is None:
+        del os.environ["METRICS_DIR"]
+    else:
+        os.environ["METRICS_DIR"] = previous
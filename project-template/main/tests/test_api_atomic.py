@@ -0,0 +1,140 @@
+import json
+
+import pytest
+from django import forms
+from django.contrib.auth.models import Group
+from django.http import Http404
+from django.test import RequestFactory
+from django.views import View
+
+from main.api_atomic import AtomicOperationsApiMixin
+from main.api_helpers import ApiResponse, FormApiMixin
+
+
+class GroupForm(forms.Form):
+    name = forms.CharField(max_length=10)
+
+
+class CreateGroupApi(FormApiMixin, View):
+    form_class = GroupForm
+
+    def form_valid(self, form):
+        group = Group.objects.create(name=form.cleaned_data["name"])
+        return ApiResponse(data={"type": "groups", "id": str(group.pk)})
+
+
+class DeleteGroupForm(forms.Form):
+    id = forms.IntegerField()
+
+
+class DeleteGroupApi(FormApiMixin, View):
+    form_class = DeleteGroupForm
+    http_method_names = ["delete"]
+    field_data_sources = {
+        "id": ("path", "id"),
+    }
+
+    def form_valid(self, form):
+        Group.objects.filter(pk=form.cleaned_data["id"]).delete()
+        return ApiResponse(data={"ok": True}, status=200)
+
+
+class MissingGroupApi(FormApiMixin, View):
+    form_class = GroupForm
+    http_method_names = ["put"]
+
+    def put(self, *args, **kwargs):
+        raise Http404()
+
+
+class GroupOperationsApi(AtomicOperationsApiMixin, View):
+    operation_views = {
+        ("add", "groups"): CreateGroupApi,
+        ("update", "groups"): MissingGroupApi,
+        ("remove", "groups"): DeleteGroupApi,
+    }
+
+
+@pytest.mark.django_db
+class TestAtomicOperations:
+    def _post(self, operations):
+        request = RequestFactory().post(
+            "/operations",
+            json.dumps({"atomic:operations": operations}),
+            content_type="application/vnd.api+json",
+        )
+        response = GroupOperationsApi.as_view()(request)
+        return response, json.loads(response.content)
+
+    def test_results_in_order(self):
+        existing = Group.objects.create(name="old")
+
+        response, content = self._post([
+            {"op": "add", "data": {"type": "groups", "attributes": {"name": "first"}}},
+            {"op": "remove", "ref": {"type": "groups", "id": str(existing.pk)}},
+            {"op": "add", "data": {"type": "groups", "attributes": {"name": "second"}}},
+        ])
+
+        assert response.status_code == 200
+        first, second = Group.objects.get(name="first"), Group.objects.get(name="second")
+        assert content == {
+            "atomic:results": [
+                {"data": {"type": "groups", "id": str(first.pk)}},
+                {"data": {"ok": True}},
+                {"data": {"type": "groups", "id": str(second.pk)}},
+            ]
+        }
+        assert not Group.objects.filter(pk=existing.pk).exists()
+
+    def test_failure_rolls_back_batch(self):
+        response, content = self._post([
+            {"op": "add", "data": {"type": "groups", "attributes": {"name": "first"}}},
+            {"op": "add", "data": {"type": "groups", "attributes": {"name": "far too long"}}},
+        ])
+
+        assert response.status_code == 400
+        assert content["errors"][0]["source"] == {"pointer": "/atomic:operations/1/data/attributes/name"}
+        assert not Group.objects.exists()
+
+    def test_unsupported_operation(self):
+        response, content = self._post([
+            {"op": "update", "ref": {"type": "users", "id": "1"}},
+        ])
+
+        assert response.status_code == 400
+        assert content["errors"][0]["source"] == {"pointer": "/atomic:operations/0/op"}
+
+    def test_invalid_ref(self):
+        response, content = self._post([
+            {"op": "remove", "ref": "x"},
+        ])
+
+        assert response.status_code == 400
+        assert content["errors"][0]["source"] == {"pointer": "/atomic:operations/0/ref"}
+
+    def test_view_exceptions(self):
+        response, content = self._post([
+            {"op": "add", "data": {"type": "groups", "attributes": {"name": "first"}}},
+            {"op": "update", "ref": {"type": "groups", "id": "1"}},
+        ])
+
+        assert response.status_code == 404
+        assert content["errors"] == [
+            {"status": "404", "title": "Not found", "source": {"pointer": "/atomic:operations/1"}},
+        ]
+        assert not Group.objects.exists()
+
+
+class TestDeleteBinding:
+    def test_plain_delete_unbound(self):
+        # Without a body to read
+        def form_kwargs(view_class):
+            request = RequestFactory().delete("/groups/1")
+            request.request_path_args = {"id": "1"}
+            view = view_class()
+            view.setup(request, id="1")
+            return view.get_form_kwargs()
+
+        assert form_kwargs(DeleteGroupApi) == {}
+        bound = form_kwargs(type("BoundDeleteGroupApi", (DeleteGroupApi,), {"bind_delete_form": True}))
+        assert bound["data"] == {"id": "1"}
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.views import View
+
+from main.api_filters import ApiFilter, ApiFilterSet
+from main.api_helpers import ApiParameterError
+from main.api_pagination import CursorPaginator
+from main.api_resources import ResourceApiMixin, ResourceSerializer
+
+
+class PermissionFilterSet(ApiFilterSet):
+    model = Permission
+    filters = {
+        "id": ApiFilter(operators=["eq", "gt"], sortable=True),
+        "content_type": ApiFilter(operators=["eq", "in"]),
+        "codename": ApiFilter(operators=["eq", "startswith"], sortable=True, index="test_codename_index"),
+        "name": ApiFilter(operators=["eq"]),
+    }
+
+
+class PermissionSerializer(ResourceSerializer):
+    type = "permissions"
+    model = Permission
+    attributes = ["codename"]
+
+
+class PermissionListApi(ResourceApiMixin, View):
+    serializer_class = PermissionSerializer
+    filterset_class = PermissionFilterSet
+    paginator_class = CursorPaginator
+
+    def get_queryset(self):
+        return Permission.objects.all()
+
+
+def test_supporting_indexes():
+    assert PermissionFilterSet.get_supporting_indexes() == {
+        "id": "primary key",
+        "content_type": "db_index",
+        "codename": "test_codename_index",
+        "name": None,
+    }
+
+
+@pytest.mark.parametrize("query, parameter", [
+    ("filter[nope]=1", "filter[nope]"),
+    ("filter[id][lte]=1", "filter[id][lte]"),
+    ("filter[name]=x", "filter[name]"),
+    ("filter[id]=notanumber", "filter[id]"),
+    ("filter[id", "filter[id"),
+    ("sort=name", "sort"),
+])
+def test_rejected(query, parameter):
+    filterset = PermissionFilterSet(QueryDict(query))
+
+    with pytest.raises(ApiParameterError) as e:
+        filterset.filter_queryset(Permission.objects.all())
+        filterset.get_ordering()
+
+    assert e.value.parameter == parameter
+
+
+@pytest.mark.django_db
+def test_filter_and_sort_collection():
+    content_type = ContentType.objects.get_for_model(Permission)
+    request = RequestFactory().get(
+        "/permissions",
+        {
+            "filter[content_type][in]": str(content_type.pk),
+            "filter[codename][startswith]": "add_",
+            "sort": "-codename",
+        }
+    )
+
+    response = PermissionListApi.as_view()(request)
+
+    assert response.status_code == 200
+    content = json.loads(response.content)
+    assert [r["attributes"]["codename"] for r in content["data"]] == ["add_permission"]
+    assert content["meta"] == {"page": {"total": 1}}
+
+
+@pytest.mark.django_db
+def test_invalid_filter_response():
+    response = PermissionListApi.as_view()(RequestFactory().get("/permissions", {"filter[name]": "x"}))
+
+    assert response.status_code == 400
+    assert json.loads(response.content)["errors"][0]["source"] == {"parameter": "filter[name]"}
@@ -1,6 +1,9 @@
+import json
+
 import pytest
+from django.db.migrations.recorder import MigrationRecorder
 
-from main.api_helpers import extract_json_path
+from main.api_helpers import FormApiMixin, JsonPointer, StreamingApiResponse, extract_json_path
 
 class TestExtractJsonPath:
     @pytest.mark.parametrize("path, obj, expected", [
@@ -19,3 +22,76 @@ class TestExtractJsonPath:
     def test_errors_if_not_found(self):
         with pytest.raises(KeyError):
             extract_json_path("/foo", {})
+
+
+class TestJsonPointer:
+    def test_matches_extract_json_path(self):
+        obj = {"data": {"attributes": {"foo": [1, {"a/b": 2}]}}}
+        pointer = JsonPointer("/data/attributes/foo/1/a~1b")
+
+        assert pointer.resolve(obj) == extract_json_path("/data/attributes/foo/1/a~1b", obj)
+        # Can be reused against other documents
+        assert pointer.resolve({"data": {"attributes": {"foo": [0, {"a/b": 3}]}}}) == 3
+
+    def test_errors_if_not_found(self):
+        with pytest.raises(KeyError):
+            JsonPointer("/foo/0").resolve({"foo": {}})
+
+
+class TestFieldDataPlan:
+    class PlanView(FormApiMixin):
+        field_data_sources = {
+            "path_field": ("path", "id"),
+        }
+
+    def test_plan_is_cached_per_class(self):
+        form_fields = {"path_field": None, "body_field": None}
+
+        plan = self.PlanView().get_field_data_plan(form_fields)
+
+        assert plan is self.PlanView().get_field_data_plan(form_fields)
+        assert [(name, source) for name, source, _, _ in plan] == [
+            ("path_field", "path"),
+            ("body_field", "body"),
+        ]
+        assert plan[1][3].path == "/data/attributes/body_field"
+        assert "_field_data_plans" not in FormApiMixin.__dict__
+
+
+@pytest.mark.django_db
+class TestStreamingApiResponse:
+    def _content(self, response):
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_streams_queryset(self):
+        queryset = MigrationRecorder.Migration.objects.order_by("pk")
+
+        response = StreamingApiResponse(
+            queryset=queryset,
+            serializer=lambda row: {"type": "migration", "id": str(row.pk)},
+            links={"self": "/migrations"},
+            chunk_size=2,
+        )
+
+        assert response["Content-Type"] == "application/vnd.api+json"
+        assert self._content(response) == {
+            "data": [
+                {"type": "migration", "id": str(pk)}
+                for pk in queryset.values_list("pk", flat=True)
+            ],
+            "links": {"self": "/migrations"},
+        }
+
+    def test_empty_queryset(self):
+        response = StreamingApiResponse(
+            queryset=MigrationRecorder.Migration.objects.none(),
+            serializer=lambda row: {},
+        )
+
+        assert self._content(response) == {"data": []}
+
+    def test_errors(self):
+        response = StreamingApiResponse(errors=[{"status": "400"}], status=400)
+
+        assert response.status_code == 400
+        assert self._content(response) == {"errors": [{"status": "400"}]}
@@ -0,0 +1,67 @@
+import pytest
+from django.test import RequestFactory
+
+from main.api_helpers import ApiParameterError
+from main.api_pagination import CursorPaginator
+from main.models import User
+
+
+@pytest.mark.django_db
+class TestCursorPaginator:
+    def setup_method(self, method):
+        self.factory = RequestFactory()
+
+    @pytest.fixture
+    def users(self):
+        # UUID7 primary keys so these sort in creation order
+        return [
+            User.objects.create(email=f"user{i}@example.com", is_active=i % 2 == 0)
+            for i in range(5)
+        ]
+
+    def _paginate(self, paginator, url):
+        return paginator.paginate(User.objects.all(), self.factory.get(url))
+
+    def test_walks_forward_and_back(self, users):
+        paginator = CursorPaginator(page_size=2)
+
+        page = self._paginate(paginator, "/users")
+        assert page.object_list == users[:2]
+        assert page.meta == {"page": {"total": 5}}
+        assert page.links["prev"] is None
+
+        page = self._paginate(paginator, page.links["next"])
+        assert page.object_list == users[2:4]
+
+        page = self._paginate(paginator, page.links["next"])
+        assert page.object_list == users[4:]
+        assert page.links["next"] is None
+
+        page = self._paginate(paginator, page.links["prev"])
+        assert page.object_list == users[2:4]
+
+        page = self._paginate(paginator, page.links["prev"])
+        assert page.object_list == users[:2]
+        assert page.links["prev"] is None
+
+    def test_ordering_with_ties(self, users):
+        paginator = CursorPaginator(ordering=["-is_active"], page_size=2, include_count=False)
+        expected = [users[0], users[2], users[4], users[1], users[3]]
+
+        page = self._paginate(paginator, "/users?page[size]=3")
+        assert page.object_list == expected[:3]
+        assert page.meta == {}
+
+        page = self._paginate(paginator, page.links["next"])
+        assert page.object_list == expected[3:]
+
+    @pytest.mark.parametrize("url, parameter", [
+        ("/users?page[size]=0", "page[size]"),
+        ("/users?page[after]=nope", "page[after]"),
+        ("/users?page[after]=a&page[before]=b", "page[before]"),
+    ])
+    def test_invalid_parameters(self, url, parameter):
+        with pytest.raises(ApiParameterError) as e:
+            self._paginate(CursorPaginator(), url)
+
+        assert e.value.parameter == parameter
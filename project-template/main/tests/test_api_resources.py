@@ -0,0 +1,133 @@
+import json
+
+import pytest
+from django.contrib.auth.models import Group, Permission
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.views import View
+
+from main.api_helpers import ApiParameterError
+from main.api_resources import (
+    ResourceApiMixin,
+    ResourceSerializer,
+    parse_fieldsets,
+    parse_include,
+)
+
+
+class ContentTypeSerializer(ResourceSerializer):
+    type = "content-types"
+    model = ContentType
+    attributes = ["app_label", "model"]
+
+
+class PermissionSerializer(ResourceSerializer):
+    type = "permissions"
+    model = Permission
+    attributes = ["name", "codename"]
+    relationships = {
+        "content_type": ContentTypeSerializer,
+    }
+
+
+class GroupSerializer(ResourceSerializer):
+    type = "groups"
+    model = Group
+    attributes = ["name"]
+    relationships = {
+        "permissions": PermissionSerializer,
+    }
+
+
+class GroupListApi(ResourceApiMixin, View):
+    serializer_class = GroupSerializer
+
+    def get_queryset(self):
+        return Group.objects.order_by("name")
+
+
+def test_parse_parameters():
+    query = QueryDict("fields[groups]=name,permissions&fields[permissions]=&include=permissions.content_type,permissions")
+
+    assert parse_fieldsets(query) == {"groups": {"name", "permissions"}, "permissions": set()}
+    assert parse_include(query) == {"permissions": {"content_type": {}}}
+
+
+@pytest.mark.parametrize("fieldsets, include, parameter", [
+    ({"groups": {"nope"}}, {}, "fields[groups]"),
+    ({"nope": {"name"}}, {}, "fields[nope]"),
+    ({}, {"permissions": {"nope": {}}}, "include"),
+])
+def test_validate(fieldsets, include, parameter):
+    with pytest.raises(ApiParameterError) as e:
+        GroupSerializer.validate(fieldsets, include)
+
+    assert e.value.parameter == parameter
+
+
+@pytest.mark.django_db
+class TestResourceApiMixin:
+    def setup_method(self, method):
+        self.factory = RequestFactory()
+
+    def _get(self, query):
+        response = GroupListApi.as_view()(self.factory.get("/groups?" + query))
+        return response, json.loads(response.content)
+
+    def test_compound_document(self):
+        group = Group.objects.create(name="admins")
+        group.permissions.set(Permission.objects.filter(codename__in=["add_group", "change_group"]))
+        content_type = ContentType.objects.get_for_model(Group)
+
+        with CaptureQueriesContext(connection) as queries:
+            response, content = self._get(
+                "fields[groups]=permissions&fields[permissions]=codename,content_type"
+                "&fields[content-types]=model&include=permissions.content_type"
+            )
+
+        assert response.status_code == 200
+        # Groups, then permissions joined to their content types
+        assert len(queries) == 2
+        assert "auth_group_permissions" in queries[1]["sql"]
+        assert "django_content_type" in queries[1]["sql"]
+        assert '"auth_permission"."name"' not in queries[1]["sql"]
+
+        assert content["data"] == [
+            {
+                "type": "groups",
+                "id": str(group.pk),
+                "relationships": {
+                    "permissions": {
+                        "data": [
+                            {"type": "permissions", "id": str(perm.pk)}
+                            for perm in group.permissions.all()
+                        ]
+                    }
+                }
+            }
+        ]
+        included = {(r["type"], r["id"]): r for r in content["included"]}
+        assert len(included) == 3
+        assert included[("content-types", str(content_type.pk))] == {
+            "type": "content-types",
+            "id": str(content_type.pk),
+            "attributes": {"model": "group"},
+        }
+        assert included[("permissions", str(Permission.objects.get(codename="add_group").pk))]["relationships"] == {
+            "content_type": {"data": {"type": "content-types", "id": str(content_type.pk)}},
+        }
+
+    def test_invalid_parameter(self):
+        response, content = self._get("include=nope")
+
+        assert response.status_code == 400
+        assert content["errors"][0]["source"] == {"parameter": "include"}
+
+    def test_empty_collection(self):
+        response, content = self._get("")
+
+        assert response.status_code == 200
+        assert content == {"data": []}
@@ -0,0 +1,112 @@
+import datetime
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.utils import timezone
+
+from main.auth.cache import TTLCache
+from main.auth.middleware import AuthenticationMiddleware
+from main.auth.tokens import TOKEN_CACHE, aget_token_principal, get_token_principal, hash_token
+from main.models import APIToken
+from main.tests.base import query_budget
+from main.tests.factories import UserFactory
+
+
+class TestTTLCache:
+    def test_expiry_and_size(self):
+        now = [0]
+        cache = TTLCache(max_size=2, ttl=10, clock=lambda: now[0])
+        cache.set("a", None)
+        cache.set("b", 2)
+        assert cache.get("a") == (True, None)
+        cache.set("c", 3)
+
+        # "b" was least recently used
+        assert cache.get("b") == (False, None)
+        now[0] = 10
+        assert cache.get("a") == (False, None)
+
+
+@pytest.mark.django_db
+class TestTokenPrincipal:
+    def setup_method(self, method):
+        TOKEN_CACHE.clear()
+
+    def test_cached_lookups(self):
+        token, token_value = APIToken.objects.create_token(UserFactory(), "test")
+        assert token.token_hash == hash_token(token_value)
+        assert token_value not in token.token_hash
+
+        with query_budget(1):
+            assert get_token_principal(token_value) == token
+            assert get_token_principal(token_value) == token
+            # Shared with the async path
+            assert async_to_sync(aget_token_principal)(token_value) == token
+
+        # Bad tokens are cached too
+        with query_budget(1):
+            assert get_token_principal("bdk_nope").is_anonymous
+            assert async_to_sync(aget_token_principal)("bdk_nope").is_anonymous
+
+    def test_copies(self):
+        token, token_value = APIToken.objects.create_token(UserFactory(), "test")
+        first = get_token_principal(token_value)
+        first.user.email = "changed@example.com"
+
+        with query_budget(0):
+            second = get_token_principal(token_value)
+        assert second is not first
+        assert second.user.email == token.user.email
+
+    def test_user_deactivated(self):
+        token, token_value = APIToken.objects.create_token(UserFactory(), "test")
+        assert get_token_principal(token_value) == token
+
+        user = token.user
+        user.is_active = False
+        user.save()
+        assert get_token_principal(token_value).is_anonymous
+
+    def test_revoked_and_expired(self):
+        token, token_value = APIToken.objects.create_token(UserFactory(), "test")
+        assert get_token_principal(token_value) == token
+
+        token.revoke()
+        assert get_token_principal(token_value).is_anonymous
+
+        token, token_value = APIToken.objects.create_token(
+            UserFactory(email="other@example.com"),
+            "test",
+            expires_at=timezone.now() - datetime.timedelta(seconds=1),
+        )
+        assert get_token_principal(token_value).is_anonymous
+
+    def test_middleware(self):
+        token, token_value = APIToken.objects.create_token(UserFactory(), "test")
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {token_value}")
+        request.session = None
+
+        AuthenticationMiddleware(lambda request: HttpResponse())(request)
+
+        assert request.user.principal_logging_identifier() == f"apitoken:{token.pk}"
+        assert async_to_sync(request.auser)() == token
+
+    @pytest.mark.parametrize("header", ["Basic dXNlcjpwYXNz", "Bearer metrics-secret"])
+    def test_middleware_other_credentials(self, settings, monkeypatch, header):
+        settings.METRICS_TOKEN = "metrics-secret"
+        monkeypatch.setattr("main.auth.middleware.get_token_principal", None)
+        user = UserFactory()
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=header)
+        request.session = SessionStore()
+        request.session[SESSION_KEY] = str(user.pk)
+        request.session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+        request.session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+
+        AuthenticationMiddleware(lambda request: HttpResponse())(request)
+
+        # Logged in by the session, the header isn't looked up as a token
+        assert request.user.pk == user.pk
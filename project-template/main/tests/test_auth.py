@@ -0,0 +1,112 @@
+import logging
+
+import pytest
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.exceptions import PermissionDenied
+from django.db.migrations.recorder import MigrationRecorder
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.views import View
+
+from main.auth.base import AuthenticationPrincipal
+from main.auth.mixins import PermissionRequiredMixin
+from main.models import APIToken
+from main.tests.factories import UserFactory
+from main.threadlocals import ThreadLocalMiddleware
+from main.views.pages import MigrationsListView
+
+
+class BatchPrincipal(AuthenticationPrincipal):
+    def __init__(self, allowed):
+        self.allowed = allowed
+        self.batches = []
+
+    def check_perms(self, perm_list, obj=None):
+        self.batches.append(list(perm_list))
+        return {perm: perm in self.allowed for perm in perm_list}
+
+    def principal_logging_identifier(self):
+        return "test"
+
+
+def _in_request(func):
+    ThreadLocalMiddleware(lambda request: func() or HttpResponse())(RequestFactory().get("/"))
+
+
+class TestPermissionDecisions:
+    def test_cached_per_request(self):
+        principal = BatchPrincipal({"main.a"})
+        obj = object()
+
+        def checks():
+            assert principal.has_perms(["main.a", "main.b"]) is False
+            assert principal.has_perm("main.a")
+            assert not principal.has_perm("main.b")
+            # A different object is decided separately
+            assert principal.has_perm("main.a", obj)
+            assert principal.has_perm("main.a", obj)
+
+        _in_request(checks)
+        assert principal.batches == [["main.a", "main.b"], ["main.a"]]
+
+        # Nothing carries over to the next request
+        _in_request(lambda: principal.has_perm("main.a"))
+        assert len(principal.batches) == 3
+
+    def test_not_cached_outside_request(self):
+        principal = BatchPrincipal({"main.a"})
+        assert principal.has_perm("main.a")
+        assert principal.has_perm("main.a")
+        assert len(principal.batches) == 2
+
+
+class TestPermissionRequiredMixin:
+    class ProtectedView(PermissionRequiredMixin, View):
+        permission_required = ["main.a", "main.b", "main.c"]
+        raise_exception = True
+
+        def get(self, request):
+            return HttpResponse()
+
+    def test_denial_decided_once(self, caplog):
+        principal = BatchPrincipal({"main.a"})
+        request = RequestFactory().get("/")
+        request.session = SessionStore()
+        request.user = principal
+
+        with caplog.at_level(logging.WARNING, logger="security"):
+            with pytest.raises(PermissionDenied):
+                ThreadLocalMiddleware(self.ProtectedView.as_view())(request)
+
+        assert principal.batches == [["main.a", "main.b", "main.c"]]
+        assert "perm=main.b" in caplog.records[0].getMessage()
+
+
+@pytest.mark.django_db
+class TestQuerysetFiltering:
+    class AppPrincipal(BatchPrincipal):
+        def filter_queryset(self, perm, queryset):
+            return queryset.filter(app="main")
+
+    def test_list_view_filtered(self):
+        request = RequestFactory().get("/migrations")
+        request.session = SessionStore()
+        request.user = self.AppPrincipal({"main.view_migrations"})
+
+        response = MigrationsListView.as_view()(request)
+
+        filterset = response.context_data["filter"]
+        assert {row.app for row in filterset.qs} == {"main"}
+        assert [choice for choice, _ in filterset.filters["app"].extra["choices"]] == ["main"]
+        assert response.context_data["table"].paginator.count == MigrationRecorder.Migration.objects.filter(app="main").count()
+
+    def test_default_hides_everything(self):
+        principal = BatchPrincipal(set())
+        assert not principal.filter_queryset("main.a", MigrationRecorder.Migration.objects.all()).exists()
+
+    def test_api_tokens_denied_by_default(self):
+        # Tokens don't act as their user unless APITokenPrincipal says so
+        token, _ = APIToken.objects.create_token(UserFactory(), "test")
+        assert token.user.has_perm("main.view_migrations")
+        assert not token.has_perm("main.view_migrations")
+        assert not token.filter_queryset("main.view_migrations", MigrationRecorder.Migration.objects.all()).exists()
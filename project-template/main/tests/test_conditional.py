@@ -0,0 +1,104 @@
+import datetime
+
+import pytest
+from django.contrib.auth.models import Group
+from django.http import HttpResponse
+from django.template import engines
+from django.template.response import TemplateResponse
+from django.test import RequestFactory
+from django.utils.http import http_date
+from django.views import View
+
+from main.conditional import ConditionalGetMixin, queryset_version
+from main.middleware import NoCacheDefaultMiddleware
+from main.tests.factories import UserFactory
+
+
+class GroupCountView(ConditionalGetMixin, View):
+    renders = 0
+
+    def get_version_key(self):
+        return queryset_version(Group.objects.all())
+
+    def get_last_modified(self):
+        return datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+
+    def get(self, request, *args, **kwargs):
+        GroupCountView.renders += 1
+        return HttpResponse(str(Group.objects.count()))
+
+
+class NonceTemplateView(GroupCountView):
+    template = "{% load security %}<script {% content_security_policy_nonce %}></script>"
+
+    def get(self, request, *args, **kwargs):
+        return TemplateResponse(request, engines["django"].from_string(self.template))
+
+
+@pytest.mark.django_db
+class TestConditionalGetMixin:
+    def setup_method(self, method):
+        self.factory = RequestFactory()
+        GroupCountView.renders = 0
+
+    def _get(self, url="/groups", **headers):
+        return GroupCountView.as_view()(self.factory.get(url, headers=headers))
+
+    def test_not_modified(self):
+        response = self._get()
+        assert response.status_code == 200
+        assert response.headers["ETag"].startswith('W/"')
+        assert response.headers["Last-Modified"] == http_date(datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc).timestamp())
+
+        response = self._get(if_none_match=response.headers["ETag"])
+
+        assert response.status_code == 304
+        assert GroupCountView.renders == 1
+
+    def test_etag_changes_with_data_and_query(self):
+        etag = self._get().headers["ETag"]
+
+        assert self._get("/groups?page=2").headers["ETag"] != etag
+
+        Group.objects.create(name="new")
+        response = self._get(if_none_match=etag)
+        assert response.status_code == 200
+        assert response.content == b"1"
+
+    def test_etag_per_principal(self):
+        request = self.factory.get("/groups")
+        request.user = UserFactory()
+        response = GroupCountView.as_view()(request)
+        assert response.headers["Vary"] == "Cookie, Authorization"
+
+        # The same data can be filtered differently for another user
+        assert response.headers["ETag"] != self._get().headers["ETag"]
+        request = self.factory.get("/groups", headers={"if_none_match": response.headers["ETag"]})
+        request.user = UserFactory(email="other@example.com")
+        assert GroupCountView.as_view()(request).status_code == 200
+
+    def test_no_validators_with_csp_nonce(self):
+        # Inline scripts are tied to the response's nonce, so the page can't
+        # be reused after a 304
+        request = self.factory.get("/page")
+        request._csp_nonce = "abc"
+        response = NonceTemplateView.as_view()(request).render()
+
+        assert b'nonce="abc"' in response.content
+        assert not response.has_header("ETag")
+        assert not response.has_header("Last-Modified")
+
+        # Templates without it still get them
+        view = type("PlainTemplateView", (NonceTemplateView,), {"template": "<p></p>"})
+        response = view.as_view()(self.factory.get("/page")).render()
+        assert response.has_header("ETag")
+
+
+def test_no_cache_middleware_keeps_validators_usable():
+    response = HttpResponse()
+    response.headers["ETag"] = 'W/"abc"'
+
+    response = NoCacheDefaultMiddleware(lambda request: response)(None)
+
+    assert "no-store" not in response.headers["Cache-Control"]
+    assert "no-cache" in response.headers["Cache-Control"]
@@ -0,0 +1,43 @@
+import json
+import logging
+import os
+
+from main import gunicorn_logging, metrics
+
+
+class FakeWorker:
+    def __init__(self):
+        self.pid = os.getpid()
+        self.alive = True
+        self.log = logging.getLogger("gunicorn.error")
+
+
+class TestWorkerHooks:
+    def test_recycles_over_memory_ceiling(self, monkeypatch, caplog):
+        worker = FakeWorker()
+        gunicorn_logging.post_fork(None, worker)
+
+        monkeypatch.setattr(gunicorn_logging, "MAX_WORKER_RSS_MB", 1024 * 1024)
+        gunicorn_logging.pre_request(worker, None)
+        gunicorn_logging.post_request(worker, None, {}, None)
+        assert worker.alive
+
+        monkeypatch.setattr(gunicorn_logging, "MAX_WORKER_RSS_MB", 1)
+        with caplog.at_level(logging.INFO, logger="gunicorn.error"):
+            gunicorn_logging.pre_request(worker, None)
+            gunicorn_logging.post_request(worker, None, {}, None)
+
+        assert not worker.alive
+        message = caplog.records[0].getMessage()
+        assert message.startswith("Recycling worker: ")
+        details = json.loads(message[len("Recycling worker: "):])
+        assert details["requests_served"] == 2
+        assert details["rss_mb"] > 1
+
+        # In the worker's live file, so dropped with the worker like its gauges
+        count_key = json.dumps(["gunicorn_request_duration_seconds_count", [["pid", str(worker.pid)]]])
+        live_path = os.path.join(metrics.REGISTRY.directory, f"live_{worker.pid}.db")
+        assert dict(metrics.read_file(live_path))[count_key] == 2
+
+    def test_rss(self):
+        assert gunicorn_logging.get_rss_bytes() > 1024 * 1024
@@ -0,0 +1,190 @@
+import hashlib
+import io
+import json
+import logging
+import sys
+import threading
+
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.test import RequestFactory
+from django.utils.functional import SimpleLazyObject
+
+from main.gunicorn_logging import JsonFormatter as GunicornJsonFormatter
+from main.logging import JsonFormatter, QueuedStreamHandler, RequestContextFilter
+from main.threadlocals import ThreadLocalMiddleware
+
+
+class BlockingStream(io.StringIO):
+    """
+    Stream that blocks writes until released
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.write_started = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, value):
+        self.write_started.set()
+        self.release.wait(5)
+        return super().write(value)
+
+
+def _record(message, level=logging.INFO, name="test"):
+    return logging.LogRecord(name, level, __file__, 1, message, None, None)
+
+
+class TestQueuedStreamHandler:
+    def test_writes_in_background(self):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream=stream)
+        handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+
+        handler.handle(logging.LogRecord("test", logging.INFO, __file__, 1, "hello %s", ("world",), None))
+        handler.handle(_record("second", logging.ERROR))
+        handler.flush()
+
+        assert stream.getvalue() == "INFO hello world\nERROR second\n"
+
+    def test_drops_low_priority_records_when_full(self):
+        stream = BlockingStream()
+        handler = QueuedStreamHandler(stream=stream, queue_size=2)
+        handler.setFormatter(logging.Formatter("%(levelname)s %(message)s"))
+
+        handler.handle(_record("first"))
+        # The listener is now stuck writing the first record
+        assert stream.write_started.wait(5)
+        handler.handle(_record("queued"))
+        handler.handle(_record("security", name="security"))
+        handler.handle(_record("dropped"))
+        handler.handle(_record("dropped", logging.DEBUG))
+
+        stream.release.set()
+        handler.flush()
+
+        lines = stream.getvalue().splitlines()
+        assert lines[:3] == ["INFO first", "INFO queued", "INFO security"]
+        assert lines[3] == "WARNING Log queue full, dropped records: DEBUG=1, INFO=1"
+
+    def test_flush_keeps_listener(self):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream=stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+        handler.handle(_record("first"))
+        handler.flush()
+        thread = handler._thread
+        handler.handle(_record("second"))
+        handler.flush()
+
+        assert handler._thread is thread and thread.is_alive()
+        assert stream.getvalue() == "first\nsecond\n"
+
+    def test_close_listener(self):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream=stream)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+        handler.handle(_record("first"))
+        thread = handler._thread
+        handler.close_listener()
+        assert not thread.is_alive()
+
+        # Later records start a new listener rather than being lost
+        handler.handle(_record("second"))
+        handler.close()
+        assert stream.getvalue() == "first\nsecond\n"
+
+
+class TestJsonFormatter:
+    def test_format(self, monkeypatch):
+        monkeypatch.setenv("PROJECT_NAME", "testproject")
+        formatter = JsonFormatter("level:levelname time:time app:app project:project message:message missing:nope")
+        monkeypatch.setenv("PROJECT_NAME", "changed")
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "hello %s", ("world",), None)
+        record.created = 1735689600.5
+
+        assert json.loads(formatter.format(record)) == {
+            "level": "INFO",
+            "time": "2025-01-01T00:00:00.500000+00:00",
+            "app": "django",
+            # Read when the formatter was configured
+            "project": "testproject",
+            "message": "hello world",
+            "missing": None,
+        }
+
+    def test_exception(self):
+        formatter = JsonFormatter("exception:exc_info")
+        try:
+            raise ValueError("oops")
+        except ValueError:
+            record = logging.LogRecord("test", logging.ERROR, __file__, 1, "failed", None, sys.exc_info())
+
+        assert "ValueError: oops" in json.loads(formatter.format(record))["exception"]
+
+    def test_gunicorn_timestamps(self):
+        formatter = GunicornJsonFormatter("time:time app:app")
+        record = _record("hello")
+        record.created = 1735689600.5
+
+        assert json.loads(formatter.format(record)) == {
+            "time": "2025-01-01T00:00:00.500000",
+            "app": "gunicorn",
+        }
+
+
+class TestRequestContextFilter:
+    class Principal:
+        def __init__(self, name):
+            self.name = name
+            self.calls = 0
+
+        def principal_logging_identifier(self):
+            self.calls += 1
+            return self.name
+
+    def _records(self, request, callback):
+        records = []
+
+        def get_response(request):
+            log_filter = RequestContextFilter()
+            for step in callback:
+                step()
+                record = _record("message")
+                log_filter.filter(record)
+                records.append(record)
+
+        ThreadLocalMiddleware(get_response)(request)
+        return records
+
+    def test_context_computed_once_per_request(self):
+        request = RequestFactory().get("/", REMOTE_ADDR="10.0.0.1", HTTP_X_FORWARDED_FOR="1.2.3.4, 5.6.7.8", HTTP_X_REQUEST_ID="req1")
+        request.session = SessionStore()
+        evaluations = []
+        principal = self.Principal("user:1")
+        request.user = SimpleLazyObject(lambda: evaluations.append(1) or principal)
+        new_principal = self.Principal("user:2")
+
+        def login():
+            request.session.cycle_key()
+            request.user = new_principal
+
+        records = self._records(request, [lambda: None, lambda: request.user.name, lambda: None, login, lambda: None])
+
+        assert evaluations == [1]
+        assert principal.calls == 1
+        assert new_principal.calls == 1
+        # The lazy user isn't loaded just for logging
+        assert [r.request_principal for r in records] == ["unk", "user:1", "user:1", "user:2", "user:2"]
+        assert records[0].ip_address == "5.6.7.8"
+        assert records[0].request_id == "req1"
+        assert records[0].session_id_hash == "." * 8
+        assert records[3].session_id_hash == hashlib.sha256(request.session.session_key.encode()).hexdigest()[:8]
+
+    def test_outside_request(self):
+        record = _record("message")
+
+        RequestContextFilter().filter(record)
+
+        assert record.request_id == "." * 8
@@ -0,0 +1,101 @@
+import logging
+
+import pytest
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+from main.auth.throttle import ACCOUNT_BACKOFF, IP_BACKOFF, FailureBackoff
+from main.tests.factories import USER_PASSWORD, UserFactory
+
+
+class TestFailureBackoff:
+    def test_backoff(self):
+        now = [0]
+        backoff = FailureBackoff(free_attempts=2, base_delay=1, max_delay=4, reset_after=100, clock=lambda: now[0])
+
+        assert backoff.record_failure("a") == 1
+        assert backoff.retry_after("a") == 0
+        backoff.record_failure("a")
+        assert backoff.retry_after("a") == 1
+        backoff.record_failure("a")
+        assert backoff.retry_after("a") == 2
+        backoff.record_failure("a")
+        backoff.record_failure("a")
+        assert backoff.retry_after("a") == 4
+        assert backoff.retry_after("b") == 0
+
+        now[0] = 3
+        assert backoff.retry_after("a") == 1
+        now[0] = 103
+        assert backoff.failures("a") == 0
+
+
+@pytest.mark.django_db
+class TestLoginThrottle:
+    @pytest.fixture(autouse=True)
+    def setup(self, settings, monkeypatch):
+        settings.STORAGES = {
+            **settings.STORAGES,
+            "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+        }
+        ACCOUNT_BACKOFF.clear()
+        IP_BACKOFF.clear()
+
+        self.hashes = 0
+        encode = PBKDF2PasswordHasher.encode
+
+        def counting_encode(hasher, *args, **kwargs):
+            self.hashes += 1
+            return encode(hasher, *args, **kwargs)
+
+        monkeypatch.setattr(PBKDF2PasswordHasher, "encode", counting_encode)
+
+    def _login(self, client, email, password, ip="10.0.0.1"):
+        return client.post(
+            "/accounts/login/",
+            {"username": email, "password": password},
+            HTTP_X_FORWARDED_FOR=ip,
+        )
+
+    def test_account_throttled_before_hashing(self, client, caplog):
+        user = UserFactory()
+
+        with caplog.at_level(logging.INFO, logger="security"):
+            for _ in range(ACCOUNT_BACKOFF.free_attempts):
+                response = self._login(client, user.email, "wrong")
+                assert response.status_code == 200
+                assert b"Too many failed" not in response.content
+
+            self.hashes = 0
+            # Even the right password is turned away while waiting
+            response = self._login(client, user.email, USER_PASSWORD)
+
+        assert self.hashes == 0
+        assert b"Too many failed login attempts" in response.content
+        messages = [record.getMessage() for record in caplog.records]
+        assert "account_failures=5 ip_failures=5" in messages[-2]
+        assert messages[-1].startswith("Login throttled account=")
+
+        # Other accounts aren't affected
+        other = UserFactory(email="other@example.com")
+        assert self._login(client, other.email, USER_PASSWORD).status_code == 302
+
+    def test_ip_throttled(self, client):
+        for i in range(IP_BACKOFF.free_attempts):
+            # Unknown accounts are fine, and count against the IP
+            self._login(client, f"nobody{i}@example.com", "wrong")
+
+        user = UserFactory()
+        response = self._login(client, user.email, USER_PASSWORD)
+        assert b"Too many failed login attempts" in response.content
+
+        assert self._login(client, user.email, USER_PASSWORD, ip="10.0.0.2").status_code == 302
+
+    def test_success_resets_account(self, client):
+        user = UserFactory()
+        for _ in range(ACCOUNT_BACKOFF.free_attempts - 1):
+            self._login(client, user.email, "wrong")
+
+        assert self._login(client, user.email, USER_PASSWORD).status_code == 302
+        client.logout()
+        self._login(client, user.email, "wrong")
+        assert self._login(client, user.email, USER_PASSWORD).status_code == 302
@@ -0,0 +1,132 @@
+import os
+
+import pytest
+from django.test import RequestFactory
+
+from main.metrics import REGISTRY, Counter, Gauge, Histogram, MetricsRegistry, MmapValues, get_metrics_dir, read_file
+from main.middleware import MetricsMiddleware
+from main.tests.base import StandardClientTestCase
+
+
+def _registry(tmp_path):
+    registry = MetricsRegistry(directory=str(tmp_path))
+    requests = Counter("requests_total", "Requests", ["view"], registry=registry)
+    in_flight = Gauge("in_flight", "In flight", registry=registry)
+    latency = Histogram("latency_seconds", "Latency", ["view"], buckets=[0.1, 1], registry=registry)
+    return registry, requests, in_flight, latency
+
+
+class TestMmapValues:
+    def test_grows_and_reopens(self, tmp_path):
+        path = str(tmp_path / "total_1.db")
+        values = MmapValues(path)
+        for i in range(5000):
+            values.add(values.get_position(f"key {i}"), i)
+        values.close()
+
+        assert os.path.getsize(path) > MmapValues.initial_size
+        reopened = MmapValues(path)
+        reopened.add(reopened.get_position("key 10"), 1)
+        assert dict(read_file(path))["key 10"] == 11
+        assert len(list(read_file(path))) == 5000
+
+
+class TestMetricsRegistry:
+    def test_exposition(self, tmp_path):
+        registry, requests, in_flight, latency = _registry(tmp_path)
+        requests.inc(view="home")
+        requests.inc(view="home")
+        in_flight.inc()
+        latency.observe(0.05, view="home")
+        latency.observe(0.5, view="home")
+
+        assert registry.generate_latest() == "\n".join([
+            "# HELP requests_total Requests",
+            "# TYPE requests_total counter",
+            'requests_total{view="home"} 2.0',
+            "# HELP in_flight In flight",
+            "# TYPE in_flight gauge",
+            "in_flight 1.0",
+            "# HELP latency_seconds Latency",
+            "# TYPE latency_seconds histogram",
+            'latency_seconds_bucket{view="home",le="0.1"} 1.0',
+            'latency_seconds_bucket{view="home",le="1.0"} 2.0',
+            'latency_seconds_bucket{view="home",le="+Inf"} 2.0',
+            'latency_seconds_sum{view="home"} 0.55',
+            'latency_seconds_count{view="home"} 2.0',
+        ]) + "\n"
+
+    def test_merges_workers(self, tmp_path):
+        registry, requests, in_flight, _ = _registry(tmp_path)
+        requests.inc(view="home")
+        in_flight.inc()
+
+        # Another worker's files
+        for kind, name in (("total", '["requests_total", [["view", "home"]]]'), ("live", '["in_flight", []]')):
+            values = MmapValues(str(tmp_path / f"{kind}_99999.db"))
+            values.add(values.get_position(name), 3)
+            values.close()
+
+        assert registry.collect()['["requests_total", [["view", "home"]]]'] == 4
+        assert registry.collect()['["in_flight", []]'] == 4
+
+        # Totals outlive the worker, gauges don't
+        registry.mark_process_dead(99999)
+        assert sorted(os.listdir(tmp_path)) == [f"live_{os.getpid()}.db", f"total_{os.getpid()}.db"]
+        assert registry.collect()['["requests_total", [["view", "home"]]]'] == 4
+        assert registry.collect()['["in_flight", []]'] == 1
+
+    def test_fork(self, tmp_path):
+        registry, requests, _, _ = _registry(tmp_path)
+        requests.inc(view="home")
+
+        pid = os.fork()
+        if pid == 0:
+            # Writes go to the child's own file
+            requests.inc(view="home")
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        assert os.path.exists(tmp_path / f"total_{pid}.db")
+        assert registry.collect()['["requests_total", [["view", "home"]]]'] == 2
+
+    def test_default_directory_per_process(self, monkeypatch):
+        monkeypatch.delenv("METRICS_DIR")
+        directory = get_metrics_dir()
+        assert os.path.isdir(directory)
+        assert get_metrics_dir() == directory
+
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.write(write, get_metrics_dir().encode())
+            os._exit(0)
+        os.waitpid(pid, 0)
+        child_directory = os.read(read, 4096).decode()
+        # The child exited without its cleanup
+        os.rmdir(child_directory)
+        assert child_directory != directory
+
+
+class TestMetricsView(StandardClientTestCase):
+    def test_records_requests(self):
+        self.client.get("/metrics")
+        response = self.client.get("/metrics")
+
+        assert response.status_code == 200
+        body = response.content.decode()
+        assert "\ndjango_http_requests_in_flight " in body
+        assert 'django_http_requests_total{view="metrics",method="GET",status="200"}' in body
+        assert 'django_http_request_duration_seconds_count{view="metrics"}' in body
+
+    def test_counts_exceptions_as_errors(self):
+        def get_response(request):
+            raise RuntimeError("boom")
+
+        request = RequestFactory().get("/nowhere")
+        with pytest.raises(RuntimeError):
+            MetricsMiddleware(get_response)(request)
+
+        samples = REGISTRY.collect()
+        assert samples['["django_http_requests_total", [["view", "unresolved"], ["method", "GET"], ["status", "500"]]]'] >= 1
+        assert samples['["django_http_requests_in_flight", []]'] == 0
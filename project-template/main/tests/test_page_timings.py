@@ -0,0 +1,102 @@
+import json
+import os
+
+import pytest
+
+from main.metrics import MetricsRegistry
+from main.page_timings import Histogram, PageTimings
+from main.tests.base import StandardClientTestCase
+from main.tests.factories import UserFactory
+from main.ratelimit import TokenBucketLimiter
+from main.views.util import FrontendReportView, JsPerformanceReportView
+
+
+class TestHistogram:
+    def test_percentiles(self):
+        histogram = Histogram(buckets=(100, 200, 400))
+        for value in [50] * 50 + [150] * 40 + [300] * 9 + [1000]:
+            histogram.observe(value)
+
+        assert histogram.percentile(50) == 100
+        assert histogram.percentile(90) == 200
+        assert histogram.percentile(95) == 200 + 200 * 5 / 9
+        # The overflow bucket can only report its lower bound
+        assert histogram.percentile(100) == 400
+        assert Histogram().percentile(50) is None
+
+
+class TestPageTimings:
+    def test_observe_and_flush(self, caplog, tmp_path):
+        timings = PageTimings(max_views=1, flush_interval=None, registry=MetricsRegistry(str(tmp_path)))
+        assert timings.observe("a", {"requestStart": 5, "loadEventEnd": 900})
+        assert timings.observe("b", {"requestStart": 15, "loadEventEnd": "junk"})
+        assert not timings.observe("a", {"loadEventEnd": -1})
+
+        summary = timings.summary()
+        assert set(summary.keys()) == {"a", "other"}
+        assert summary["a"]["loadEventEnd"] == {"count": 1, "p50": 875.0, "p90": 975.0, "p95": 987.5, "p99": 997.5}
+        assert set(summary["other"].keys()) == {"requestStart"}
+
+        with caplog.at_level("INFO", logger="frontend"):
+            timings.flush()
+            timings.flush()
+        assert len(caplog.records) == 2
+        # The totals stay after the window is logged
+        assert timings.summary() == summary
+
+    def test_merges_workers(self, tmp_path):
+        timings = PageTimings(flush_interval=None, registry=MetricsRegistry(str(tmp_path)))
+        timings.observe("a", {"responseStart": 120})
+
+        pid = os.fork()
+        if pid == 0:
+            # Another worker, with its own file
+            timings.observe("a", {"responseStart": 120})
+            timings.observe("b", {"responseStart": 5000})
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+        summary = timings.summary()
+        assert summary["a"]["responseStart"]["count"] == 2
+        assert summary["b"]["responseStart"]["count"] == 1
+
+        # Still counted once the worker has gone
+        timings.registry.mark_process_dead(pid)
+        assert timings.summary() == summary
+
+
+class TestJsPerformanceViews(StandardClientTestCase):
+    @pytest.fixture(autouse=True)
+    def timings(self, tmp_path, settings):
+        # For the 403 page
+        settings.STORAGES = {
+            **settings.STORAGES,
+            "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+        }
+        self.original = (FrontendReportView.ip_limiter, JsPerformanceReportView.timings)
+        FrontendReportView.ip_limiter = TokenBucketLimiter(rate=1, burst=100)
+        JsPerformanceReportView.timings = PageTimings(flush_interval=None, registry=MetricsRegistry(str(tmp_path)))
+
+    def teardown_method(self, method):
+        FrontendReportView.ip_limiter, JsPerformanceReportView.timings = self.original
+
+    def test_summary(self):
+        for path in ["/", "/", "/migrations", "/made-up", "/made-up-too"]:
+            response = self.client.post(
+                "/js-performance",
+                json.dumps({"requestId": path, "path": path, "responseStart": 120}),
+                content_type="application/json",
+            )
+            assert response.status_code == 204
+
+        # Superusers only
+        assert self.client.get("/js-performance/summary").status_code == 302
+        self.client.force_login(UserFactory())
+        assert self.client.get("/js-performance/summary").status_code == 403
+        self.client.force_login(UserFactory(email="admin@example.com", is_superuser=True))
+        response = self.client.get("/js-performance/summary")
+
+        # Labelled by URL name, and paths that don't resolve aren't counted
+        views = response.json()["views"]
+        assert sorted(views.keys()) == ["home", "migrations_list"]
+        assert views["home"]["responseStart"]["count"] == 2
@@ -0,0 +1,69 @@
+import logging
+
+import pytest
+from django.http import HttpResponse
+from django.test import RequestFactory
+from django.db.migrations.recorder import MigrationRecorder
+
+from main.query_stats import QueryInstrumentationMiddleware, QueryStats
+from main.tests.base import query_budget
+from main.tests.factories import UserFactory
+
+
+@pytest.mark.django_db
+class TestQueryStats:
+    def test_counts_shapes(self):
+        Migration = MigrationRecorder.Migration
+        stats = QueryStats()
+        with stats.instrument():
+            for pk in (1, 2, 3):
+                Migration.objects.filter(pk=pk).first()
+            list(Migration.objects.filter(pk__in=[1, 2]))
+            list(Migration.objects.filter(pk__in=[1, 2, 3]))
+
+        assert stats.count == 5
+        assert stats.duration > 0
+        assert [count for _, count in stats.repeated(2)] == [3, 2]
+
+    def test_budget_failure(self):
+        with pytest.raises(AssertionError, match="at most 1 queries, ran 2"):
+            with query_budget(1):
+                MigrationRecorder.Migration.objects.count()
+                MigrationRecorder.Migration.objects.count()
+
+
+@pytest.mark.django_db
+class TestQueryInstrumentationMiddleware:
+    def test_migrations_list_budget(self, client, caplog, settings):
+        settings.QUERY_REPEAT_THRESHOLD = 3
+        # The frontend build's manifest isn't there in tests
+        settings.STORAGES = {
+            **settings.STORAGES,
+            "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+        }
+        client.force_login(UserFactory())
+
+        with caplog.at_level(logging.WARNING, logger="main.query_stats"):
+            with query_budget(6, max_repeats=2):
+                response = client.get("/migrations")
+
+        assert response.status_code == 200
+        assert [r for r in caplog.records if r.name == "main.query_stats"] == []
+
+    def test_logs_repeated_queries(self, caplog, settings):
+        settings.QUERY_REPEAT_THRESHOLD = 2
+        Migration = MigrationRecorder.Migration
+
+        def view(request):
+            for pk in (1, 2):
+                Migration.objects.filter(pk=pk).first()
+            logging.getLogger("main").warning("Done")
+            return HttpResponse()
+
+        with caplog.at_level(logging.WARNING):
+            # The middleware, but not the URL, is needed
+            QueryInstrumentationMiddleware(view)(RequestFactory().get("/"))
+
+        messages = [r.getMessage() for r in caplog.records]
+        assert messages[0] == "Done"
+        assert messages[1].startswith("Query repeated 2 times in one request, possible N+1: SELECT")
@@ -0,0 +1,128 @@
+import json
+import time
+
+from main.ratelimit import LogAggregator, TokenBucketLimiter
+from main.tests.base import StandardClientTestCase
+from main.views.util import FrontendReportView, JsErrorReportView
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucketLimiter:
+    def test_burst_then_refill(self):
+        clock = FakeClock()
+        limiter = TokenBucketLimiter(rate=1, burst=2, clock=clock)
+
+        assert [limiter.allow("a") for _ in range(3)] == [True, True, False]
+        # Other keys have their own bucket
+        assert limiter.allow("b")
+
+        clock.now = 1.5
+        assert [limiter.allow("a") for _ in range(2)] == [True, False]
+
+    def test_bounded_keys(self):
+        limiter = TokenBucketLimiter(rate=0, burst=1, max_keys=2)
+        assert limiter.allow("a")
+        assert limiter.allow("b")
+        assert limiter.allow("c")
+
+        # The least recently used bucket was dropped, so "a" starts afresh
+        assert len(limiter._buckets) == 2
+        assert limiter.allow("a")
+        assert not limiter.allow("c")
+
+
+class TestLogAggregator:
+    def test_folds_repeats(self):
+        clock = FakeClock()
+        lines = []
+        aggregator = LogAggregator(lambda fmt, *args: lines.append(fmt % args), interval=60, clock=clock, timer=False)
+
+        for _ in range(3):
+            aggregator.add("x", "Error %s", "x")
+        aggregator.add("y", "Error %s", "y")
+        assert lines == ["Error x", "Error y"]
+
+        # Summaries are logged once the interval passes
+        clock.now = 61
+        aggregator.add("x", "Error %s", "x")
+        assert lines == [
+            "Error x",
+            "Error y",
+            "Error x (repeated 2 times in 61s)",
+            "Error x",
+        ]
+
+    def test_timer_flushes_last_burst(self):
+        lines = []
+        aggregator = LogAggregator(lambda fmt, *args: lines.append(fmt % args), interval=0.05)
+        aggregator.add("x", "Error")
+        aggregator.add("x", "Error")
+
+        # Logged without anything else coming in
+        deadline = time.monotonic() + 5
+        while len(lines) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert lines == ["Error", "Error (repeated 1 times in 0s)"]
+
+
+class TestFrontendReportViews(StandardClientTestCase):
+    def setup_method(self, method):
+        super().setup_method(method)
+        self.lines = []
+        self.limiters = (FrontendReportView.ip_limiter, FrontendReportView.request_id_limiter)
+        self.aggregator = JsErrorReportView.aggregator
+        FrontendReportView.ip_limiter = TokenBucketLimiter(rate=0, burst=5)
+        FrontendReportView.request_id_limiter = TokenBucketLimiter(rate=0, burst=2)
+        JsErrorReportView.aggregator = LogAggregator(lambda fmt, *args: self.lines.append(fmt % args), timer=False)
+
+    def teardown_method(self, method):
+        FrontendReportView.ip_limiter, FrontendReportView.request_id_limiter = self.limiters
+        JsErrorReportView.aggregator = self.aggregator
+
+    def _post(self, request_id, message="boom", stack=""):
+        return self.client.post(
+            "/js-error",
+            json.dumps({"requestId": request_id, "message": message, "stack": stack}),
+            content_type="application/json",
+            HTTP_USER_AGENT="test",
+            HTTP_X_FORWARDED_FOR="10.0.0.1",
+        )
+
+    def test_identical_errors_folded(self):
+        assert self._post("r1").status_code == 204
+        assert self._post("r2").status_code == 204
+        assert self._post("r2", "other").status_code == 204
+
+        assert len(self.lines) == 2
+        JsErrorReportView.aggregator.flush()
+        assert self.lines[-1].endswith("|| test (repeated 1 times in 0s)")
+
+    def test_limits(self):
+        # Per page view
+        for _ in range(3):
+            assert self._post("r1").status_code == 204
+        assert JsErrorReportView.aggregator._seen
+        assert sum(count for count, _, _ in JsErrorReportView.aggregator._repeats.values()) == 1
+
+        # Per IP, including reports without a request id
+        for _ in range(3):
+            self.client.post("/csp-report", "not json", content_type="application/csp-report", HTTP_X_FORWARDED_FOR="10.0.0.1")
+        assert not FrontendReportView.ip_limiter.allow("10.0.0.1")
+
+    def test_long_reports(self):
+        # Reports with a stack trace are longer than what gets logged
+        stack = "at foo (main.js:1:1)\n" * 200
+        for _ in range(3):
+            assert self._post("r1", stack=stack).status_code == 204
+
+        # Still parsed, so folded and limited by page view
+        assert len(self.lines) == 1
+        assert len(self.lines[0]) < 1100
+        assert sum(count for count, _, _ in JsErrorReportView.aggregator._repeats.values()) == 1
@@ -0,0 +1,59 @@
+import logging
+
+from django.test import RequestFactory
+from procrastinate.contrib.django import app
+from procrastinate.testing import InMemoryConnector
+
+from main.logging import RequestContextFilter
+from main.task_context import CONTEXT_KWARG, context_task
+from main.threadlocals import ThreadLocalMiddleware
+
+
+class Principal:
+    def principal_logging_identifier(self):
+        return "user:1"
+
+
+seen = []
+
+
+@context_task
+def record_context(value):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "In task", None, None)
+    RequestContextFilter().filter(record)
+    seen.append((value, record.request_id, record.request_principal))
+
+
+class TestContextTask:
+    def test_context_carried_to_worker(self, caplog):
+        seen.clear()
+        connector = InMemoryConnector()
+        request = RequestFactory().get("/", HTTP_X_REQUEST_ID="req1", HTTP_X_FORWARDED_FOR="1.2.3.4")
+        request.user = Principal()
+
+        with app.replace_connector(connector):
+            def get_response(request):
+                record_context.defer(value=1)
+
+            ThreadLocalMiddleware(get_response)(request)
+            # Outside a request there's no context to pass on
+            record_context.defer(value=2)
+
+            job = connector.jobs[1]
+            assert job["args"][CONTEXT_KWARG]["request_id"] == "req1"
+            assert job["args"][CONTEXT_KWARG]["principal"] == "user:1"
+
+            with caplog.at_level(logging.INFO, logger="tasks"):
+                app.run_worker(wait=False, install_signal_handlers=False, listen_notify=False)
+
+        assert sorted(seen) == [(1, "req1", "user:1"), (2, "." * 8, "unk")]
+        messages = [r.getMessage() for r in caplog.records if r.name == "tasks"]
+        assert len(messages) == 2
+        assert messages[0].startswith("Task succeeded task=")
+        assert "record_context job_id=" in messages[0]
+        assert "queue_wait_ms=" in messages[0] and "queue_wait_ms=None" not in messages[0]
+
+    def test_can_still_call_directly(self):
+        seen.clear()
+        record_context(value=3)
+        assert seen == [(3, "." * 8, "unk")]
@@ -0,0 +1,60 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from main.threadlocals import ContextThreadPoolExecutor, ThreadLocalMiddleware, current_request
+
+
+class TestThreadLocalMiddleware:
+    def test_sync(self):
+        request = RequestFactory().get("/")
+        seen = []
+
+        def get_response(request):
+            seen.append(current_request())
+            with ContextThreadPoolExecutor(max_workers=1) as executor:
+                seen.append(executor.submit(current_request).result())
+            # Plain pools don't copy the context
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                seen.append(executor.submit(current_request).result())
+            return HttpResponse()
+
+        ThreadLocalMiddleware(get_response)(request)
+
+        assert seen == [request, request, None]
+        assert current_request() is None
+
+    def test_concurrent_async_requests(self):
+        requests = [RequestFactory().get(f"/{i}") for i in range(2)]
+        both_started = threading.Barrier(2, timeout=5)
+        seen = {}
+
+        def blocking_work(name):
+            # Each request is in its own thread at the same time
+            both_started.wait()
+            return current_request()
+
+        async def get_response(request):
+            await asyncio.sleep(0)
+            in_thread = await sync_to_async(blocking_work, thread_sensitive=False)(request.path)
+            in_executor = await asyncio.get_running_loop().run_in_executor(
+                ContextThreadPoolExecutor(max_workers=1), current_request
+            )
+            seen[request.path] = (current_request(), in_thread, in_executor)
+            return HttpResponse()
+
+        middleware = ThreadLocalMiddleware(get_response)
+        assert asyncio.iscoroutinefunction(middleware)
+
+        async def run():
+            await asyncio.gather(*(middleware(request) for request in requests))
+
+        async_to_sync(run)()
+
+        for request in requests:
+            assert seen[request.path] == (request, request, request)
+        assert current_request() is None
@@ -0,0 +1,94 @@
+import hashlib
+import json
+import os
+
+from django import forms
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from django.views import View
+
+from main.api_helpers import ApiResponse
+from main.uploads import UploadFormApiMixin, UploadLimit
+
+
+class AttachmentForm(forms.Form):
+    title = forms.CharField()
+    attachment = forms.FileField()
+
+
+class AttachmentApi(UploadFormApiMixin, View):
+    form_class = AttachmentForm
+    upload_limits = {
+        "attachment": UploadLimit(max_size=1000, content_types=["text/plain"]),
+    }
+
+    def form_valid(self, form):
+        upload = form.cleaned_data["attachment"]
+        assert os.path.exists(upload.temporary_file_path())
+        return ApiResponse(data={
+            "title": form.cleaned_data["title"],
+            "hash": upload.content_hash,
+        })
+
+
+class TestUploadFormApiMixin:
+    def _post(self, data):
+        request = RequestFactory().post("/attachments", data)
+        request._dont_enforce_csrf_checks = True
+        response = AttachmentApi.as_view()(request)
+        return response, json.loads(response.content)
+
+    def test_streams_and_hashes(self):
+        contents = b"hello world\n" * 50
+
+        response, content = self._post({
+            "title": "greeting",
+            "attachment": SimpleUploadedFile("hello.txt", contents, content_type="text/plain"),
+        })
+
+        assert response.status_code == 200
+        assert content["data"] == {
+            "title": "greeting",
+            "hash": hashlib.sha256(contents).hexdigest(),
+        }
+
+    def test_rejects_large_files(self):
+        response, content = self._post({
+            "title": "big",
+            "attachment": SimpleUploadedFile("big.txt", b"x" * 1001, content_type="text/plain"),
+        })
+
+        assert response.status_code == 413
+
+    def test_rejects_other_types(self):
+        response, content = self._post({
+            "title": "image",
+            "attachment": SimpleUploadedFile("image.png", b"png", content_type="image/png"),
+        })
+
+        assert response.status_code == 400
+        assert "image/png" in content["errors"][0]["detail"]
+
+    def test_rejects_unexpected_fields(self):
+        response, content = self._post({
+            "title": "other",
+            "attachment": SimpleUploadedFile("hello.txt", b"hi", content_type="text/plain"),
+            "other": SimpleUploadedFile("other.txt", b"hi", content_type="text/plain"),
+        })
+
+        assert response.status_code == 400
+
+    def test_validation_errors_point_at_form_fields(self):
+        response, content = self._post({
+            "attachment": SimpleUploadedFile("hello.txt", b"hi", content_type="text/plain"),
+        })
+
+        assert response.status_code == 400
+        assert content["errors"][0]["source"] == {"parameter": "title"}
+
+    def test_enforces_csrf(self):
+        request = RequestFactory().post("/attachments", {"title": "no token"})
+
+        response = AttachmentApi.as_view()(request)
+
+        assert response.status_code == 403
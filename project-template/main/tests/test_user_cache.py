@@ -0,0 +1,70 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from main.auth.middleware import AuthenticationMiddleware
+from main.auth.users import USER_CACHE
+from main.tests.base import query_budget
+from main.tests.factories import UserFactory
+
+
+def _request(user, session_hash=None):
+    request = RequestFactory().get("/")
+    request.session = SessionStore()
+    request.session[SESSION_KEY] = str(user.pk)
+    request.session[BACKEND_SESSION_KEY] = "django.contrib.auth.backends.ModelBackend"
+    request.session[HASH_SESSION_KEY] = session_hash or user.get_session_auth_hash()
+    AuthenticationMiddleware(lambda request: HttpResponse())(request)
+    return request
+
+
+@pytest.mark.django_db
+class TestUserCache:
+    @pytest.fixture(autouse=True)
+    def enable_cache(self, settings):
+        settings.USER_CACHE_TTL = 60
+        USER_CACHE.clear()
+
+    def test_cached(self):
+        user = UserFactory()
+
+        with query_budget(1):
+            assert _request(user).user.pk == user.pk
+            assert _request(user).user.pk == user.pk
+            assert async_to_sync(_request(user).auser)().pk == user.pk
+
+        # Each request gets its own copy
+        first, second = _request(user).user, _request(user).user
+        first.email = "changed@example.com"
+        assert second.email == user.email
+
+    def test_password_change(self):
+        user = UserFactory()
+        session_hash = user.get_session_auth_hash()
+        assert _request(user, session_hash).user.is_authenticated
+
+        user.set_password("new password")
+        user.save()
+
+        # Sessions from before the change are logged out
+        assert not _request(user, session_hash).user.is_authenticated
+        assert _request(user).user.is_authenticated
+
+    def test_deactivated(self):
+        user = UserFactory()
+        assert _request(user).user.is_authenticated
+
+        user.is_active = False
+        user.save()
+        assert not _request(user).user.is_authenticated
+
+    def test_disabled(self, settings):
+        settings.USER_CACHE_TTL = 0
+        user = UserFactory()
+
+        with query_budget(2):
+            assert _request(user).user.pk == user.pk
+            assert _request(user).user.pk == user.pk
@@ -1,5 +1,9 @@
 import json
 
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, RequestFactory
+
+from main.views.pages import DemoJsonAPI
 from main.tests.factories import UserFactory, USER_PASSWORD
 from main.tests.base import StandardClientTestCase
 
@@ -66,3 +70,68 @@ class TestJsonApi(StandardClientTestCase):
         print(response.content)
         assert response.status_code == 400
         assert b"valid date" in response.content
+
+    def test_malformed_body_response(self):
+        # When we post something that isn't JSON
+        response = self.client.post(
+            "/demoapi/foo",
+            "{not json",
+            content_type="application/json"
+        )
+
+        # Then we get a JSON:API error rather than a server error
+        assert response.status_code == 400
+        assert json.loads(response.content)["errors"][0]["status"] == "400"
+
+    def test_oversized_body_response(self):
+        # When we post a body larger than the view accepts
+        response = self.client.post(
+            "/demoapi/foo",
+            json.dumps({"padding": "x" * DemoJsonAPI.max_body_size}),
+            content_type="application/json"
+        )
+
+        # Then it's rejected
+        assert response.status_code == 413
+        assert json.loads(response.content)["errors"][0]["title"] == "payload_too_large"
+
+    def test_body_readable_afterwards(self):
+        # When the view has read the JSON body from the stream
+        body = json.dumps({"data": {"attributes": {"body_field": "2025-02-08 13:16:00"}}})
+        request = RequestFactory().post("/demoapi/foo", body, content_type="application/json")
+        response = DemoJsonAPI.as_view()(request, id="foo")
+        assert response.status_code == 200
+
+        # Then request.body still works for anything after it
+        assert request.body == body.encode("utf8")
+
+
+class TestAsyncJsonApi(StandardClientTestCase):
+    def _post(self, body_field):
+        return async_to_sync(AsyncClient().post)(
+            "/demoapi-async/foo",
+            json.dumps({
+                "data": {
+                    "attributes": {
+                        "body_field": body_field
+                    }
+                }
+            }),
+            content_type="application/json"
+        )
+
+    def test_success_response(self):
+        # When we post some valid JSON to the async endpoint
+        response = self._post("2025-02-08 13:16:00")
+
+        # Then it's handled
+        assert response.status_code == 200
+        assert json.loads(response.content) == {"data": {"ok": True}}
+
+    def test_validation_error_response(self):
+        # When we post an invalid value
+        response = self._post("nottimestamp")
+
+        # Then we get the JSON:API error back
+        assert response.status_code == 400
+        assert b"valid date" in response.content
@@ -2,12 +2,24 @@
 Makes request available as a global object.
 
 This should probably just be used for enrichment of log messages.
+
+The request is kept in a context variable rather than a thread local, so
+it's right for async views, follows the request into sync_to_async and
+async_to_sync calls, and doesn't leak into the next request to use the
+thread. Thread pools don't copy context by themselves, use
+ContextThreadPoolExecutor (or contextvars.copy_context().run) for work
+handed to them.
 """
 
-from threading import local
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 
 
-thread_local_storage = local()
+_current_request = contextvars.ContextVar("current_request", default=None)
+_current_task_context = contextvars.ContextVar("current_task_context", default=None)
 
 
 def current_request():
@@ -16,26 +28,69 @@ def current_request():
     outside a request context)
     """
 
-    return getattr(thread_local_storage, "request", None)
+    return _current_request.get()
+
+
+def current_task_context():
+    """
+    Returns the context of the request that deferred the running background
+    task (or None if we're not in one). See main/task_context.py
+    """
+
+    return _current_task_context.get()
+
+
+@contextmanager
+def task_context(context):
+    token = _current_task_context.set(context)
+    try:
+        yield
+    finally:
+        _current_task_context.reset(token)
 
 
 class ThreadLocalMiddleware:
     """
-    Simple middleware that adds the request object in thread local storage.
+    Simple middleware that makes the request available through
+    current_request(). Named for the threading.local it used to use.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
-        thread_local_storage.request = request
+        if self.async_mode:
+            return self.__acall__(request)
 
+        token = _current_request.set(request)
         try:
             return self.get_response(request)
         finally:
-            # Clear storage after processing the request because
-            # threads might be reused for multiple requests. We
-            # wouldn't want to associate previous info with the
-            # next request by accident.
-            if hasattr(thread_local_storage, "request"):
-                del thread_local_storage.request
+            # Threads are reused for later requests, so don't leave this one
+            # behind
+            _current_request.reset(token)
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor running each task in a copy of the submitting
+    thread's context, so current_request() (and so request log context)
+    works in the task. Also works with loop.run_in_executor().
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        context = contextvars.copy_context()
+        return super().submit(context.run, fn, *args, **kwargs)
@@ -0,0 +1,152 @@
+"""
+Streaming file uploads for JSON:API views.
+
+Django's default upload handlers keep files up to
+FILE_UPLOAD_MAX_MEMORY_SIZE in memory and views then read them again to
+hash or store them. The handler here writes each chunk straight to a
+temporary file on disk while hashing it, and enforces per-field size and
+content type limits as the chunks arrive, so an oversized upload is
+rejected without ever being held in worker memory.
+
+    class AttachmentApi(LoginNotRequiredMixin, UploadFormApiMixin, View):
+        form_class = AttachmentForm
+        upload_limits = {
+            "attachment": UploadLimit(max_size=5 * 1024 * 1024, content_types=["image/png", "image/jpeg"]),
+        }
+
+        def form_valid(self, form):
+            upload = form.cleaned_data["attachment"]
+            # upload.content_hash is the hex sha256 of the contents and
+            # upload.temporary_file_path() can be moved into place
+            ...
+
+Content types are as claimed by the client, so check the contents too if
+that matters.
+"""
+import hashlib
+from typing import Dict, Iterable, Optional
+
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.middleware.csrf import CsrfViewMiddleware
+
+from main.api_helpers import ApiRequestError, FormApiMixin
+
+
+class UploadLimit:
+    """
+    Restrictions on the file uploaded to a form field
+    """
+
+    def __init__(self, max_size: int, content_types: Optional[Iterable[str]]=None):
+        self.max_size = max_size
+        self.content_types = set(content_types) if content_types is not None else None
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """
+    Upload handler that streams each file to a temporary file on disk,
+    computing a hash of the contents as it goes. The finished files get a
+    content_hash attribute.
+
+    Files for fields without an UploadLimit, or that break their limit, stop
+    the upload. The reason is put in the error attribute as an
+    ApiRequestError.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, request, limits: Dict[str, UploadLimit], hash_algorithm: str="sha256"):
+        super().__init__(request)
+        self.limits = limits
+        self.hash_algorithm = hash_algorithm
+        self.error = None
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+        self.limit = self.limits.get(field_name)
+        if self.limit is None:
+            self.reject(f"Unexpected file upload in field {field_name}", 400)
+        if self.limit.content_types is not None and content_type not in self.limit.content_types:
+            self.reject(f"File type {content_type} not allowed for field {field_name}", 400)
+        # Browsers don't usually send this, but if they do we can reject early
+        if content_length is not None and content_length > self.limit.max_size:
+            self.reject(f"File for field {field_name} larger than {self.limit.max_size} bytes", 413)
+
+        self.file = TemporaryUploadedFile(file_name, content_type, 0, charset, content_type_extra)
+        self.hash = hashlib.new(self.hash_algorithm)
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limit.max_size:
+            self.reject(f"File for field {self.field_name} larger than {self.limit.max_size} bytes", 413)
+
+        self.hash.update(raw_data)
+        self.file.write(raw_data)
+        # Don't pass the data on to any other handlers
+        return None
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_hash = self.hash.hexdigest()
+        return self.file
+
+    def reject(self, detail: str, status: int):
+        self.error = ApiRequestError(detail, status=status)
+        # Django closes (and so deletes) self.file, then discards the rest of
+        # the body without storing it
+        raise StopUpload(connection_reset=False)
+
+
+class UploadFormApiMixin(FormApiMixin):
+    """
+    FormApiMixin for multipart/form-data requests with file uploads.
+
+    Fields default to coming from the multipart form fields rather than a
+    JSON body. Files are streamed through HashingFileUploadHandler using the
+    per-field upload_limits.
+
+    The upload handler has to be installed before anything reads
+    request.POST, and CsrfViewMiddleware reads it before the view runs. So
+    views using this are marked csrf_exempt and the CSRF check is run here
+    once the handler is in place.
+    """
+
+    # Form field name -> UploadLimit. Files for any other field are rejected
+    upload_limits: Dict[str, UploadLimit] = {}
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view.csrf_exempt = True
+        return view
+
+    def get_upload_limits(self) -> Dict[str, UploadLimit]:
+        return self.upload_limits
+
+    def get_field_data_sources(self, form_fields=None):
+        default_sources = {
+            key: ("form", key)
+            for key in (form_fields.keys() if form_fields else [])
+        }
+        default_sources.update(self.field_data_sources or {})
+        return default_sources
+
+    def post(self, request, *args, **kwargs):
+        handler = HashingFileUploadHandler(request, self.get_upload_limits())
+        request.upload_handlers = [handler]
+
+        # Parse the body now, streaming the files through the handler
+        request.POST  # noqa: B018
+
+        if handler.error is not None:
+            return handler.error.response()
+
+        csrf_middleware = CsrfViewMiddleware(lambda request: None)
+        csrf_middleware.process_request(request)
+        csrf_rejection = csrf_middleware.process_view(request, None, (), {})
+        if csrf_rejection is not None:
+            return csrf_rejection
+
+        return super().post(request, *args, **kwargs)
@@ -1,27 +1,36 @@
+from django.contrib.auth.views import LoginView
 from django.urls import path, include
 
+from main.forms import LoginForm
+
 from main.views.util import (
     HealthcheckView,
     DebugHttpView,
     CspReportView,
     JsErrorReportView,
-    JsPerformanceReportView
+    JsPerformanceReportView,
+    JsPerformanceSummaryView,
+    MetricsView,
 )
-from main.views.pages import DemoJsonAPI, HomeView, MigrationsListView
+from main.views.pages import AsyncDemoJsonAPI, DemoJsonAPI, HomeView, MigrationsListView
 from main.views.error import server_error, bad_request, not_found, forbidden
 
 urlpatterns = [
     path("", HomeView.as_view(), name="home"),
     path("demoapi/<str:id>", DemoJsonAPI.as_view(), name="testapi"),
+    path("demoapi-async/<str:id>", AsyncDemoJsonAPI.as_view(), name="testapi_async"),
     path("migrations", MigrationsListView.as_view(), name="migrations_list"),
+    path("accounts/login/", LoginView.as_view(authentication_form=LoginForm), name="login"),
     path("accounts/", include("django.contrib.auth.urls")),
 
     # Debug
     path("healthcheck", HealthcheckView.as_view()),
+    path("metrics", MetricsView.as_view(), name="metrics"),
     path("debug-http", DebugHttpView.as_view()),
     path("csp-report", CspReportView.as_view(), name="csp_report"),
     path("js-error", JsErrorReportView.as_view(), name="js_error"),
     path("js-performance", JsPerformanceReportView.as_view(), name="js_performance"),
+    path("js-performance/summary", JsPerformanceSummaryView.as_view(), name="js_performance_summary"),
     path("errors/400", bad_request, {"exception": Exception()}),
     path("errors/404", not_found, {"exception": Exception()}),
     path("errors/403", forbidden, {"exception": Exception()}),
@@ -10,7 +10,7 @@ from django.utils import timezone
 from main.auth.mixins import LoginNotRequiredMixin, PermissionRequiredMixin
 from main.forms import DemoForm
 from main.tasks import background_task
-from main.api_helpers import FormApiMixin, ApiResponse
+from main.api_helpers import AsyncFormApiMixin, FormApiMixin, ApiResponse
 
 
 class HomeView(LoginNotRequiredMixin, TemplateView):
@@ -41,6 +41,18 @@ class DemoJsonAPI(LoginNotRequiredMixin, FormApiMixin, View):
         return ApiResponse(data={"ok": True})
 
 
+class AsyncDemoJsonAPI(LoginNotRequiredMixin, AsyncFormApiMixin, View):
+    """
+    Same as DemoJsonAPI, but runs on the event loop under ASGI
+    """
+
+    form_class = DemoForm
+    field_data_sources = DemoJsonAPI.field_data_sources
+
+    async def form_valid(self, form):
+        return ApiResponse(data={"ok": True})
+
+
 class MigrationsListView(PermissionRequiredMixin, django_tables2.SingleTableMixin, FilterView):
     """
     Example demonstrating django filters, table2, and permissions
@@ -67,10 +79,15 @@ class MigrationsListView(PermissionRequiredMixin, django_tables2.SingleTableMixi
 
             self.filters["app"].extra["choices"] = [
                 (row, row)
-                for row in MigrationRecorder.Migration.objects.distinct("app").values_list("app", flat=True)
+                # Already narrowed down to what the user can see by
+                # PermissionRequiredMixin.get_queryset
+                for row in self.queryset.order_by("app").distinct("app").values_list("app", flat=True)
             ]
 
 
+    # Gives get_queryset() something to filter by permission, otherwise
+    # django-filter quietly queries the filterset's model itself
+    model = MigrationRecorder.Migration
     paginate_by = 3
     permission_required = ["main.view_migrations"]
     template_name = "main/migrations_list.html"
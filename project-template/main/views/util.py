@@ -1,10 +1,16 @@
 import os
+import json
+import hashlib
+import secrets
 import socket
 import logging
+from typing import Optional
+from urllib.parse import urlsplit
 
 from django.conf import settings
 from django.db import connection
 from django.http import Http404
+from django.urls import Resolver404, resolve
 from django.views import View
 from django.core.signing import TimestampSigner, BadSignature, SignatureExpired
 from django.utils.decorators import method_decorator
@@ -12,7 +18,11 @@ from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse, HttpResponse
 from django.views.decorators.cache import cache_page
 
-from main.auth.mixins import LoginNotRequiredMixin
+from main.auth.mixins import LoginNotRequiredMixin, PermissionRequiredMixin
+from main import metrics
+from main.logging import get_request_ip
+from main.page_timings import PageTimings
+from main.ratelimit import LogAggregator, TokenBucketLimiter
 
 
 LOGGER = logging.getLogger(__name__)
@@ -139,64 +149,179 @@ class DebugHttpView(LoginNotRequiredMixin, View):
 
 
 @method_decorator(csrf_exempt, name="dispatch")
-class CspReportView(LoginNotRequiredMixin, View):
+class FrontendReportView(LoginNotRequiredMixin, View):
     """
-    Logs Content-Security-Policy violation reports.
+    Base for the endpoints the frontend posts logs to. Anyone can call these,
+    so each IP and each page view (the requestId in the report) gets a token
+    bucket. Once it's empty reports are dropped without reading the body.
     """
 
     http_method_names = ["post"]
+    # Only read this much of the body, to stop people abusing the endpoint
+    # with huge piles of content. Enough for reports with stack traces,
+    # anything longer is treated as not being JSON.
+    max_content_length = 16 * 1024
+    # Logged text is cut down further. Could slice a multibyte character.
+    max_log_length = 1024
+
+    # Shared by all the report views so a client can't triple its allowance
+    ip_limiter = TokenBucketLimiter(
+        rate=settings.FRONTEND_REPORT_IP_RATE,
+        burst=settings.FRONTEND_REPORT_IP_BURST,
+    )
+    request_id_limiter = TokenBucketLimiter(
+        rate=settings.FRONTEND_REPORT_REQUEST_ID_RATE,
+        burst=settings.FRONTEND_REPORT_REQUEST_ID_BURST,
+    )
 
     def post(self, request, *args, **kwargs):
-        # Truncate request to stop people abusing the endpoint with huge piles
-        # of content. Could make the JSON data invalid or slice a multibyte
-        # character.
-        content = request.body.decode("utf8")[:1024]
-        # Also log the most likely culprit: the browser they're using
-        useragent = request.META.get("HTTP_USER_AGENT")[:1024]
-        logger = logging.getLogger("frontend")
-        logger.warning("CSP Violation Report: %s || %s", content, useragent)
+        if not self.ip_limiter.allow(get_request_ip(request)):
+            return HttpResponse(status=204)
+
+        content = request.read(self.max_content_length).decode("utf8", errors="replace")
+        try:
+            report = json.loads(content)
+        except ValueError:
+            report = None
+        if not isinstance(report, dict):
+            report = None
+
+        request_id = report.get("requestId") if report else None
+        if request_id is not None and not self.request_id_limiter.allow(str(request_id)[:64]):
+            return HttpResponse(status=204)
+
+        self.log_report(request, content[:self.max_log_length], report)
 
         # No content response
         return HttpResponse(status=204)
 
+    def log_report(self, request, content: str, report: Optional[dict]):
+        """
+        :param content: The body, truncated to max_log_length
+        :param report: The whole body parsed as a JSON object, if it is one
+        """
+        raise NotImplementedError()
+
+    @staticmethod
+    def get_fold_key(content: str, report: Optional[dict]) -> str:
+        """
+        Identifies reports that are the same apart from which page view sent
+        them. Hashed, since the aggregator keeps up to max_keys of these.
+        """
+        if report is not None:
+            content = json.dumps(
+                {key: val for key, val in report.items() if key != "requestId"},
+                sort_keys=True,
+            )
+        return hashlib.sha256(content.encode("utf8", errors="replace")).hexdigest()
 
-@method_decorator(csrf_exempt, name="dispatch")
-class JsErrorReportView(LoginNotRequiredMixin, View):
+
+class CspReportView(FrontendReportView):
+    """
+    Logs Content-Security-Policy violation reports.
+    """
+
+    aggregator = LogAggregator(
+        logging.getLogger("frontend").warning,
+        interval=settings.FRONTEND_REPORT_AGGREGATE_SECONDS,
+    )
+
+    def log_report(self, request, content, report):
+        # Also log the most likely culprit: the browser they're using
+        useragent = request.META.get("HTTP_USER_AGENT", "")[:1024]
+        self.aggregator.add(
+            (self.get_fold_key(content, report), useragent),
+            "CSP Violation Report: %s || %s", content, useragent,
+        )
+
+
+class JsErrorReportView(FrontendReportView):
     """
     Logs Javascript error reports from the frontend
     """
 
-    http_method_names = ["post"]
+    aggregator = LogAggregator(
+        logging.getLogger("frontend").warning,
+        interval=settings.FRONTEND_REPORT_AGGREGATE_SECONDS,
+    )
 
-    def post(self, request, *args, **kwargs):
-        # Truncate request to stop people abusing the endpoint with huge piles
-        # of content. Could make the JSON data invalid or slice a multibyte
-        # character.
-        content = request.body.decode("utf8")[:1024]
+    def log_report(self, request, content, report):
         # Browser they're using might be useful
-        useragent = request.META.get("HTTP_USER_AGENT")[:1024]
-        logger = logging.getLogger("frontend")
-        logger.warning("JS Error: %s || %s", content, useragent)
+        useragent = request.META.get("HTTP_USER_AGENT", "")[:1024]
+        self.aggregator.add(
+            (self.get_fold_key(content, report), useragent),
+            "JS Error: %s || %s", content, useragent,
+        )
 
-        # No content response
-        return HttpResponse(status=204)
+
+class JsPerformanceReportView(FrontendReportView):
+    """
+    Records the navigation timings reported by the frontend in per-view
+    histograms. See main/page_timings.py
+    """
+
+    timings = PageTimings(flush_interval=settings.FRONTEND_TIMING_FLUSH_SECONDS)
+
+    def log_report(self, request, content, report):
+        view = self._get_page_view(request, report)
+        if report is None or view is None or not self.timings.observe(view, report):
+            logger = logging.getLogger("frontend")
+            logger.info("Unusable JS Performance report: %s", content)
+
+    @staticmethod
+    def _get_page_view(request, report):
+        """
+        The URL name of the page the report is for. The path comes from the
+        client, so only ones in the URLconf are counted, otherwise every
+        made up path would get its own series.
+        """
+        path = report.get("path") if report else None
+        if not isinstance(path, str):
+            # Older frontend code doesn't send the path
+            path = urlsplit(request.META.get("HTTP_REFERER", "")).path
+        if not path.startswith("/"):
+            return None
+        try:
+            match = resolve(path[:2000])
+        except Resolver404:
+            return None
+        return match.url_name or match.view_name or "unnamed"
 
 
-@method_decorator(csrf_exempt, name="dispatch")
-class JsPerformanceReportView(LoginNotRequiredMixin, View):
+class JsPerformanceSummaryView(PermissionRequiredMixin, View):
     """
-    Logs Javascript error reports from the frontend
+    Percentiles of the frontend navigation timings for each view, over
+    all the worker processes. Superusers only, see UserPrincipal.
     """
 
-    http_method_names = ["post"]
+    http_method_names = ["get"]
+    permission_required = "main.view_js_performance"
 
-    def post(self, request, *args, **kwargs):
-        # Truncate request to stop people abusing the endpoint with huge piles
-        # of content. Could make the JSON data invalid or slice a multibyte
-        # character.
-        content = request.body.decode("utf8")[:1024]
-        logger = logging.getLogger("frontend")
-        logger.info("JS Performance: %s", content)
+    def get(self, request, *args, **kwargs):
+        return JsonResponse({
+            "views": JsPerformanceReportView.timings.summary(),
+        })
 
-        # No content response
-        return HttpResponse(status=204)
+
+class MetricsView(LoginNotRequiredMixin, View):
+    """
+    Request metrics for all the worker processes in the Prometheus text
+    format. See main/metrics.py
+
+    Blocked in the production nginx config, so scrape it from inside the
+    container. If settings.METRICS_TOKEN is set it must be given as a bearer
+    token too.
+    """
+
+    http_method_names = ["get"]
+
+    def get(self, request, *args, **kwargs):
+        if settings.METRICS_TOKEN:
+            authorization = request.META.get("HTTP_AUTHORIZATION", "")
+            if not secrets.compare_digest(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+                raise Http404
+
+        return HttpResponse(
+            metrics.REGISTRY.generate_latest(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )